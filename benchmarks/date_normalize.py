@@ -0,0 +1,178 @@
+"""
+回答の日付変換を，以前の `_preprocess_date` と `DateNormalizer` とで比べる
+
+    python benchmarks/date_normalize.py run --size=100000 --distinct=5000
+    python benchmarks/date_normalize.py check --size=100000
+
+以前の実装は比較のためにここへ写してある．
+yyyy-mm-dd は以前の実装では年だけを読み月日を今日で補っていたので，比較から除く．
+"""
+import datetime
+import json
+import random
+import re
+import sys
+import time
+from os import path
+
+import fire
+from dateutil.parser import parse as datetime_parser
+from dateutil.parser._parser import ParserError
+from japanera import Japanera
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from show_a_table.model.refiner.date_normalizer import (  # noqa: E402
+    DateNormalizer, _from_mtgrp_to_str, _td1, _td2)
+
+_eras = ["明治", "大正", "昭和", "平成", "令和", "天平勝宝", "元禄", "慶応"]
+_kanji = ["元", "二", "十", "十一", "二十三", "三十"]
+
+
+def legacy_preprocess_date(result):
+    """変更前の `date._preprocess_date`"""
+    result = result.translate(_td1)
+    mmdd = r'((\d{1,2})月((\d{1,2})日)?)?'
+    eraname = r'(天平)?[^\d]{2}((\d{1,2})|元)年?'
+    years = r'(\d{1,4})年?'
+    mt = re.match(r'({})(\({}\))?'.format(years, eraname)+mmdd, result)
+    if mt:
+        result = _from_mtgrp_to_str(mt.groups(), 0, 1, 4, 6, 8, 7, 9).translate(_td2)
+        try:
+            if result.endswith("-"):
+                date = datetime_parser(result[:-1]).date()
+            else:
+                date = datetime_parser(result).date()
+            return date
+        except ParserError as e:
+            raise RuntimeError("Cannot parser as date '{}'".format(result)) from e
+    mt = re.match(r'({})(\({}\))?'.format(eraname, years)+mmdd, result)
+    if mt:
+        result = _from_mtgrp_to_str(mt.groups(), 0, 3, 2, 6, 8, 7, 9)
+    mt = re.match(r'\(({})\){}'.format(eraname, mmdd), result)
+    if mt:
+        result = _from_mtgrp_to_str(mt.groups(), 0, 3, 2, 4, 6, 5, 7)
+    jn = Japanera()
+    fmt = "%-E%-kO年"
+    fmt += "%m月%d日" if "月" in result and "日" in result else "%m月" if "月" in result else ""
+    res = jn.strptime(result, fmt)
+    if res:
+        return res[0].date()
+    else:
+        raise RuntimeError("Cannot parse as date '{}' by '{}'".format(result, fmt))
+
+
+def make_answers(size, distinct, seed=0):
+    """
+    読解モデルが返しそうな回答を作る
+
+    Parameters
+    ----------
+    size : int
+      回答の数
+    distinct : int
+      異なり数
+    seed : int
+
+    Returns
+    -------
+    List[str]
+    """
+    rng = random.Random(seed)
+
+    def one():
+        y, m, d = rng.randint(1, 2100), rng.randint(0, 13), rng.randint(0, 32)
+        era = rng.choice(_eras)
+        ey = rng.choice([str(rng.randint(0, 70)), rng.choice(_kanji)])
+        return rng.choice([
+            f"{y}年{m}月{d}日",
+            f"{y}年{m}月{d}日生まれ",
+            f"{y}年{m}月",
+            f"{y}年",
+            f"{y}",
+            f"{y}{m}月",
+            f"{y}年({era}{ey}年){m}月{d}日",
+            f"{era}{ey}年",
+            f"{era}{ey}年{m}月",
+            f"{era}{ey}年{m}月{d}日",
+            f"{era}{ey}年({y}年){m}月{d}日",
+            f"({era}{ey}年){m}月{d}日",
+            f"{era}{ey}年頃",
+            f"{y}年{m}月{d}日".translate(str.maketrans("0123456789", "０１２３４５６７８９")),
+            era,
+            "不明",
+            "約3年",
+        ])
+
+    pool = [one() for _ in range(distinct)]
+    return [rng.choice(pool) for _ in range(size)]
+
+
+def _call(fn, answer):
+    try:
+        return fn(answer)
+    except RuntimeError as e:
+        return str(e)
+
+
+def check(size=20000, distinct=20000, seed=0):
+    """
+    両者の結果が一致するか確かめる
+
+    Returns
+    -------
+    int
+      一致しなかった回答の数
+    """
+    norm = DateNormalizer()
+    diffs = 0
+    for answer in sorted(set(make_answers(size, distinct, seed))):
+        old, new = _call(legacy_preprocess_date, answer), _call(norm.normalize, answer)
+        if old != new:
+            diffs += 1
+            print(f"{answer!r}: {old} != {new}")
+    print(f"{diffs} differences", file=sys.stderr)
+    return diffs
+
+
+def _time(fn, answers):
+    start = time.perf_counter()
+    for answer in answers:
+        _call(fn, answer)
+    return time.perf_counter() - start
+
+
+def run(size=100000, distinct=5000, seed=0, output=None):
+    """
+    Parameters
+    ----------
+    size : int
+      回答の数
+    distinct : int
+      異なり数．exam では同じ回答が何度も現れる
+    seed : int
+    output : str
+      指定された場合は結果を JSON で書き出す
+    """
+    answers = make_answers(size, distinct, seed)
+    results = {}
+    # 以前の実装は遅いので一部で測って換算する
+    sample = answers[:max(1, size // 20)]
+    results["legacy"] = _time(legacy_preprocess_date, sample) * len(answers) / len(sample)
+    results["cold"] = _time(DateNormalizer(maxsize=0).normalize, answers)
+    results["memo"] = _time(DateNormalizer().normalize, answers)
+    start = time.perf_counter()
+    DateNormalizer().normalize_many(answers)
+    results["batch"] = time.perf_counter() - start
+    for key, sec in results.items():
+        print(f"{key:<8} {sec:8.3f} s {size / sec:12.1f} answers/s "
+              f"x{results['legacy'] / sec:7.1f}", file=sys.stderr)
+    if output:
+        with open(output, "w") as f:
+            json.dump({"date": str(datetime.date.today()), "size": size, "distinct": distinct,
+                       "seconds": results}, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    fire.Fire({"run": run, "check": check})
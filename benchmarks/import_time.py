@@ -0,0 +1,83 @@
+"""
+show_a_table 配下の各パッケージの import にかかる時間を計測する
+
+それぞれ新しいインタプリタで計測するので，先に import されたモジュールの影響を受けない．
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --repeat=5 --output=import_time.json
+"""
+import json
+import statistics
+import subprocess
+import sys
+from os import path
+
+import fire
+
+_root = path.dirname(path.dirname(path.abspath(__file__)))
+
+_modules = [
+    "show_a_table",
+    "show_a_table.model",
+    "show_a_table.model.refiner",
+    "show_a_table.model.refiner.category_selector",
+    "show_a_table.model.dqw",
+    "show_a_table.model.dqw.dqwrapper",
+    "show_a_table.view",
+    "show_a_table.view.refiner.cands_performer",
+]
+
+_snippet = """
+import time
+t = time.perf_counter()
+import {mod}
+print(time.perf_counter() - t)
+"""
+
+
+def measure(mod, repeat=3):
+    """
+    Parameters
+    ----------
+    mod : str
+    repeat : int
+
+    Returns
+    -------
+    {str: float} or {str: str}
+      秒単位の最小値と中央値．import に失敗した場合はそのエラー
+    """
+    times = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", _snippet.format(mod=mod)], cwd=_root,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1]}
+        times.append(float(proc.stdout.strip()))
+    return {"min": min(times), "median": statistics.median(times)}
+
+
+def main(repeat=3, output=None):
+    """
+    Parameters
+    ----------
+    repeat : int
+      各モジュールの計測回数
+    output : str
+      指定された場合は結果を JSON で書き出す
+    """
+    results = {}
+    for mod in _modules:
+        results[mod] = res = measure(mod, repeat)
+        if "error" in res:
+            print(f"{mod:<48} ERROR {res['error']}")
+        else:
+            print(f"{mod:<48} {res['min']*1000:8.1f} ms (median {res['median']*1000:.1f} ms)")
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
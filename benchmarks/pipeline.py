@@ -0,0 +1,327 @@
+"""
+refine → run の各処理の性能を合成コーパスで計測する
+
+読解モデルには `StubBackend` を用いるので，モデルやデータの無い環境でも動く．
+
+    python benchmarks/pipeline.py run --sizes='[1000, 10000]' --output=bench.json
+    python benchmarks/pipeline.py compare bench.json baseline.json --threshold=0.2
+"""
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from os import path
+
+import fire
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from show_a_table.model.dqw import dqwrapper  # noqa: E402
+from show_a_table.model.dqw.backend import StubBackend  # noqa: E402
+from show_a_table.model.refiner import date  # noqa: E402
+from show_a_table.model.refiner.category_selector import CategorySelector  # noqa: E402
+from show_a_table.model.refiner.refiner import (  # noqa: E402
+    Candidate, FunQuery, RegQuery, SearchIndex)
+from show_a_table.model.refiner.util import make_n_dict  # noqa: E402
+
+_prefs = ["北海道", "青森県", "宮城県", "東京都", "神奈川県", "愛知県", "大阪府", "福岡県", "沖縄県"]
+_kana = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワ"
+_eras = ["明治", "大正", "昭和", "平成"]
+# 所在地の質問には都道府県名を答える．既定の規則では記事名を答えてしまい，所在地のクエリを誰も通過しない
+_stub_patterns = [(r".*所在地", "|".join(_prefs))] + StubBackend.default_patterns
+
+
+def _paragraphs(rng, title):
+    year = rng.randint(1850, 2020)
+    era = rng.choice(_eras)
+    return [
+        f"{title}は{rng.choice(_prefs)}にある市である．人口は{rng.randint(1000, 3000000)}人．",
+        f"{year}年{rng.randint(1, 12)}月{rng.randint(1, 28)}日に市制を施行した．",
+        f"{era}{rng.randint(1, 30)}年には周辺の町村を編入した．",
+        "特筆すべき事項は無い．" * rng.randint(1, 20),
+    ]
+
+
+def make_corpus(dirname, size, seed=0):
+    """
+    SQuAD 形式と PLAIN 形式の合成コーパスを作る
+
+    Parameters
+    ----------
+    dirname : str
+    size : int
+      記事数
+    seed : int
+
+    Returns
+    -------
+    (str, str)
+      SQuAD 形式の JSON のパスと PLAIN 形式のカテゴリ名
+    """
+    rng = random.Random(seed)
+    data = []
+    name = f"Synthetic{size}"
+    plain = path.join(dirname, "datasets/PLAIN", name)
+    os.makedirs(plain, exist_ok=True)
+    for i in range(size):
+        title = "".join(rng.choice(_kana) for _ in range(rng.randint(2, 5))) + "市"
+        prhs = _paragraphs(rng, title)
+        data.append({"title": title, "WikipediaID": str(i),
+                     "paragraphs": [{"context": p} for p in prhs]})
+        with open(path.join(plain, f"{i}.txt"), "w") as f:
+            f.write(f"{title} - Wikipedia Dump 20171103\n" + "\n".join(prhs))
+    ds = path.join(dirname, f"squad_{name}.json")
+    with open(ds, "w") as f:
+        json.dump({"data": data}, f, ensure_ascii=False)
+    return ds, name
+
+
+def _date_query():
+    jo = date.JustOneDateRefiner("成立年")
+    jo.year, jo.month = "*", "4"
+    return jo._day(Candidate("SKIP", ref="*"))
+
+
+def _range_query():
+    dr = date.DateRangeRefiner("成立年")
+    dr._start, dr._end = "1900-*-*", "1950-*-*"
+    return FunQuery(dr._mk_exam(), lambda tgt: f"{tgt}の成立年は?")
+
+
+def _geo_query():
+    return RegQuery(re.compile("東京都|大阪府"), lambda tgt: f"{tgt}の所在地は?", ctx_filter="都|府")
+
+
+def _percentile(values, p):
+    """
+    Parameters
+    ----------
+    values : List[float]
+      整列済みのもの
+    p : float
+      0 から 100
+
+    Returns
+    -------
+    float
+      最近傍順位法による百分位数
+    """
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def _measure(fn, repeat):
+    """
+    シナリオ全体を `repeat` 回実行して時間を測り，別の1回で最大メモリを測る
+
+    tracemalloc は確保の多い処理を大きく遅くするので，時間の計測中は使わない．
+    `fn` が問い合わせごとの所要時間のリストを返す場合はそれらから，
+    件数を返す場合は1回ごとの所要時間から遅延の百分位数を求める
+
+    Returns
+    -------
+    dict
+      処理量(件/秒)，秒単位の遅延の p50/p90/p99，1回あたりの所要時間の最小値と平均，
+      tracemalloc による最大メモリ(byte)
+    """
+    times = []
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ret = fn()
+        times.append(time.perf_counter() - start)
+        if isinstance(ret, list):
+            items = len(ret)
+            latencies += ret
+        else:
+            items = ret
+            latencies.append(times[-1])
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    best = min(times)
+    latencies.sort()
+    return {
+        "items": items,
+        "throughput": items / best if best else float("inf"),
+        "p50": _percentile(latencies, 50),
+        "p90": _percentile(latencies, 90),
+        "p99": _percentile(latencies, 99),
+        "min": best,
+        "mean": statistics.mean(times),
+        "peak_memory": peak,
+    }
+
+
+def _timed(fn, args):
+    """
+    Returns
+    -------
+    List[float]
+      `args` の各要素について `fn` を呼んだ所要時間(秒)
+    """
+    ret = []
+    for a in args:
+        start = time.perf_counter()
+        fn(a)
+        ret.append(time.perf_counter() - start)
+    return ret
+
+
+def scenarios(ds, name, size, seed=0):
+    """
+    Returns
+    -------
+    {str: () -> int or List[float]}
+      シナリオ名から計測対象の関数への対応．関数は処理件数，
+      あるいは1件ずつ処理するものならば各件の所要時間のリストを返す
+    """
+    rng = random.Random(seed)
+    date_q = _date_query()
+    range_q = _range_query()
+    geo_q = _geo_query()
+    answers = [f"{rng.randint(1850, 2020)}年{rng.randint(1, 12)}月{rng.randint(1, 28)}日"
+               for _ in range(min(size, 10000))]
+    answers += [f"{rng.choice(_eras)}{rng.randint(1, 30)}年" for _ in range(min(size, 10000) // 10)]
+    labels = [(f"s{i}", "".join(rng.choice(_kana) for _ in range(4)))
+              for i in range(min(size, 5000))]
+
+    cs = CategorySelector()
+    cs.set_category("市区町村名")
+    cs.attr = "所在地"
+    cs.add_query(geo_q)
+    cs.attr = "成立年"
+    cs.add_query(date_q)
+
+    def run_store():
+        dqwrapper.run(cs)
+        return size
+
+    def run_table():
+        dqwrapper.run(cs, table=True)
+        return size
+
+    def exam(q):
+        return lambda: _timed(q.exam, answers)
+
+    def exam_batch(q):
+        return lambda: len(q.exam_batch(answers))
+
+    def kana():
+        make_n_dict(list(labels), 20)
+        return len(labels)
+
+    def search():
+        index = SearchIndex([Candidate(label, ref=s) for s, label in labels])
+        return _timed(index.search, [label[:2] for _, label in labels[:1000]])
+
+    return {
+        "make_questions": lambda: len(dqwrapper._make_questions(ds, date_q)),
+        "make_questions_from_ds": lambda: len(dqwrapper._make_questions_from_ds(name, date_q)),
+        "run": run_store,
+        "run_table": run_table,
+        "exam_date": exam(date_q),
+        "exam_range": exam(range_q),
+        "exam_geo": exam(geo_q),
+        "exam_batch_date": exam_batch(date_q),
+        "exam_batch_geo": exam_batch(geo_q),
+        "make_n_dict": kana,
+        "search": search,
+    }
+
+
+def run(sizes=(1000, 10000, 100000), repeat=3, output="bench.json", only=None, seed=0):
+    """
+    Parameters
+    ----------
+    sizes : List[int]
+      合成コーパスの記事数
+    repeat : int
+      各シナリオの繰り返し回数
+    output : str
+      結果の JSON
+    only : List[str]
+      指定された場合はそのシナリオだけを実行する
+    seed : int
+    """
+    results = {}
+    dqwrapper.set_backend(StubBackend(_stub_patterns))
+    datadir, workdir = dqwrapper._datadir, dqwrapper._workdir
+    datasets = dict(dqwrapper._datasets)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            ds, name = make_corpus(tmp, size, seed)
+            dqwrapper._datadir = tmp
+            dqwrapper._workdir = path.join(tmp, "work")
+            dqwrapper._datasets["CITY"] = ds
+            try:
+                for sc, fn in scenarios(ds, name, size, seed).items():
+                    if only and sc not in only:
+                        continue
+                    key = f"{sc}/{size}"
+                    results[key] = _measure(fn, repeat)
+                    res = results[key]
+                    print(f"{key:<32} {res['throughput']:12.1f} items/s "
+                          f"p50 {res['p50']*1000:9.3f} ms p90 {res['p90']*1000:9.3f} ms "
+                          f"p99 {res['p99']*1000:9.3f} ms "
+                          f"peak {res['peak_memory']/2**20:8.1f} MiB", file=sys.stderr)
+            finally:
+                dqwrapper._datadir, dqwrapper._workdir = datadir, workdir
+                dqwrapper._datasets.update(datasets)
+                dqwrapper._corpora.clear()
+                dqwrapper._indices.clear()
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    return output
+
+
+def compare(current, baseline, threshold=0.2):
+    """
+    基準の結果と比べ，処理量が `threshold` 以上落ちたか，遅延の中央値や最大メモリが
+    `threshold` 以上増えたシナリオを報告する
+
+    Parameters
+    ----------
+    current : str
+    baseline : str
+    threshold : float
+
+    Returns
+    -------
+    int
+      劣化したシナリオ数．0 でなければ終了コードも 1 とする
+    """
+    with open(current) as f:
+        cur = json.load(f)
+    with open(baseline) as f:
+        base = json.load(f)
+    regressions = 0
+    for key in sorted(set(cur) & set(base)):
+        ratio = cur[key]["throughput"] / base[key]["throughput"] if base[key]["throughput"] else 1
+        mem = cur[key]["peak_memory"] / base[key]["peak_memory"] if base[key]["peak_memory"] else 1
+        # 百分位数の無い古い結果とは処理量とメモリだけを比べる
+        p50 = cur[key]["p50"] / base[key]["p50"] if base[key].get("p50") else 1
+        p99 = cur[key]["p99"] / base[key]["p99"] if base[key].get("p99") else 1
+        mark = ""
+        if ratio < 1 - threshold or mem > 1 + threshold or p50 > 1 + threshold:
+            regressions += 1
+            mark = "REGRESSION"
+        print(f"{key:<32} throughput x{ratio:5.2f} p50 x{p50:5.2f} p99 x{p99:5.2f} "
+              f"memory x{mem:5.2f} {mark}")
+    if regressions:
+        sys.exit(1)
+    return regressions
+
+
+if __name__ == "__main__":
+    fire.Fire({"run": run, "compare": compare})
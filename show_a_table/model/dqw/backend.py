@@ -0,0 +1,209 @@
+import json
+import re
+import threading
+import urllib.request
+
+
+class Backend:
+    """
+    読解モデルの基底クラス
+
+    `predict_batch` は DrQA の `Predictor.predict_batch` と同じ形の値を返す．
+    すなわち質問ごとに top_n 件以下の `({"text": 回答}, スコア)` のリスト
+    """
+
+    def predict_batch(self, batch, top_n=1):
+        """
+        Parameters
+        ----------
+        batch : [(str, str)]
+          文脈と質問文の組
+        top_n : int
+
+        Returns
+        -------
+        [[({"text": str}, float)]]
+        """
+        raise NotImplementedError()
+
+    def load(self):
+        """重い初期化があればここで行う"""
+        pass
+
+    def close(self):
+        pass
+
+
+class DrQABackend(Backend):
+    """
+    DrQA の `Predictor` を用いる．モデルは初回の推論時(あるいは `load`)に読み込む
+    """
+
+    def __init__(self, model, embedding_file, tokenizer="mecab", num_workers=10, device="auto"):
+        """
+        Parameters
+        ----------
+        model : str
+        embedding_file : str
+        tokenizer : str
+        num_workers : int
+        device : str
+          "cuda", "cpu", "auto" のいずれか．auto ならば GPU が使えるときに GPU を使う
+
+        Raises
+        ------
+        ValueError
+          device が不正な場合
+        """
+        if device not in ("cuda", "cpu", "auto"):
+            raise ValueError(f"unknown device: {device}")
+        self.model = model
+        self.embedding_file = embedding_file
+        self.tokenizer = tokenizer
+        self.num_workers = num_workers
+        self.device = device
+        self._predictor = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._predictor is None:
+                import torch
+                from drqa.reader import Predictor
+                predictor = Predictor(
+                    model=self.model,
+                    tokenizer=self.tokenizer,
+                    embedding_file=self.embedding_file,
+                    num_workers=self.num_workers,
+                )
+                device = self.device
+                if device == "auto":
+                    device = "cuda" if torch.cuda.is_available() else "cpu"
+                if device == "cuda":
+                    predictor.cuda()
+                else:
+                    predictor.cpu()
+                self._predictor = predictor
+            return self._predictor
+
+    def predict_batch(self, batch, top_n=1):
+        return self.load().predict_batch(batch, top_n=top_n)
+
+
+class StubBackend(Backend):
+    """
+    モデルを用いず，正規表現あるいは固定表から回答を返す決定的な読解モデル
+
+    負荷試験やモデルの無い環境での動作確認に用いる．
+
+    Attributes
+    ----------
+    fixtures : {(str, str): str} or {str: str}
+      (文脈, 質問文) あるいは質問文から回答への表．正規表現より優先する
+    patterns : [(re, re)]
+      質問文の正規表現と，文脈から回答を抜き出す正規表現の組．先に一致したものを用いる
+    calls : int
+      回答した質問の数
+    """
+
+    default_patterns = [
+        (re.compile(r".*(日|年|時期)"),
+         re.compile(r"((紀元前)?\d{1,4}年(\d{1,2}月(\d{1,2}日)?)?|\d{4}-\d{1,2}-\d{1,2})")),
+        (re.compile(r".*(数|高|金|面積|人口)"), re.compile(r"\d[\d,.]*")),
+        (re.compile(r".*"), re.compile(r"[^\s、。]+?[都道府県市区町村国]")),
+    ]
+
+    def __init__(self, patterns=None, fixtures=None):
+        """
+        Parameters
+        ----------
+        patterns : [(str or re, str or re)]
+          未指定時は `default_patterns`
+        fixtures : dict
+        """
+        if patterns is None:
+            patterns = self.default_patterns
+        self.patterns = [(re.compile(q) if isinstance(q, str) else q,
+                          re.compile(a) if isinstance(a, str) else a) for q, a in patterns]
+        self.fixtures = fixtures or {}
+        self.calls = 0
+
+    def answer(self, context, question):
+        """
+        Returns
+        -------
+        (str, float) or None
+          回答とスコア．スコアは文脈中の位置が前であるほど大きい
+        """
+        if (context, question) in self.fixtures:
+            return (self.fixtures[(context, question)], 1.0)
+        if question in self.fixtures:
+            return (self.fixtures[question], 1.0)
+        for qptn, aptn in self.patterns:
+            if not qptn.match(question):
+                continue
+            mt = aptn.search(context)
+            if mt:
+                return (mt.group(0), 1.0 / (1 + mt.start()))
+            return None
+        return None
+
+    def predict_batch(self, batch, top_n=1):
+        self.calls += len(batch)
+        ret = []
+        for context, question in batch:
+            ans = self.answer(context, question)
+            ret.append([({"text": ans[0]}, ans[1])] if ans else [])
+        return ret
+
+
+class RemoteBackend(Backend):
+    """
+    `server` で起動した推論サーバに問い合わせる
+
+    Attributes
+    ----------
+    url : str
+      "http://127.0.0.1:8765" のようなサーバの位置
+    timeout : float
+    """
+
+    def __init__(self, url="http://127.0.0.1:8765", timeout=600):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, obj=None):
+        data = None if obj is None else json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(self.url + path, data=data,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as res:
+            return json.loads(res.read().decode("utf-8"))
+
+    def load(self):
+        return self._request("/health")
+
+    def predict_batch(self, batch, top_n=1):
+        res = self._request("/predict", {"batch": [list(pair) for pair in batch], "top_n": top_n})
+        return [[tuple(ans) for ans in result] for result in res["results"]]
+
+
+def make_backend(name, **kwargs):
+    """
+    Parameters
+    ----------
+    name : str
+      "drqa", "stub", "remote" のいずれか
+    kwargs
+      各クラスのコンストラクタ引数
+
+    Returns
+    -------
+    Backend
+    """
+    if name == "drqa":
+        return DrQABackend(**kwargs)
+    elif name == "stub":
+        return StubBackend(**kwargs)
+    elif name == "remote":
+        return RemoteBackend(**kwargs)
+    raise ValueError(f"unknown backend: {name}")
@@ -0,0 +1,86 @@
+import time
+
+
+class TokenBudgetBatcher:
+    """
+    文脈長の近い質問をまとめ，トークン数の予算に収まるようにバッチを組む
+
+    バッチの大きさは (バッチ内の最長文脈長) × (質問数) が `token_budget` を越えない範囲で決める．
+    長い段落1つのために短い段落までパディングされることを避けるため，文脈長で整列してから詰める．
+
+    Attributes
+    ----------
+    token_budget : int
+      1バッチあたりのパディング込みトークン数の上限
+    max_batch : int
+      1バッチあたりの質問数の上限．0 以下なら無制限
+    length : str -> int
+      文脈の長さを測る関数．未指定時は文字数で近似する
+    """
+
+    def __init__(self, token_budget=8192, max_batch=64, length=None):
+        self.token_budget = token_budget
+        self.max_batch = max_batch
+        self.length = length or len
+
+    def batches(self, questions):
+        """
+        Parameters
+        ----------
+        questions : [(str, str, ...)]
+          先頭要素が文脈，2番目が質問文
+
+        Returns
+        -------
+        [[int]]
+          `questions` の添字のリストのリスト．全ての添字がちょうど1回ずつ現れる
+        """
+        lens = [self.length(q[0]) + self.length(q[1]) for q in questions]
+        order = sorted(range(len(questions)), key=lambda i: lens[i])
+        ret = []
+        cur = []
+        for i in order:
+            # 整列済みなので追加する要素が常に最長となる
+            full = self.max_batch > 0 and len(cur) >= self.max_batch
+            if cur and (full or lens[i] * (len(cur) + 1) > self.token_budget):
+                ret.append(cur)
+                cur = []
+            cur.append(i)
+        if cur:
+            ret.append(cur)
+        return ret
+
+    def autotune(self, predict, questions, budgets=(2048, 4096, 8192, 16384, 32768), repeat=1):
+        """
+        実際に推論を行い，処理量が最大となる予算を `token_budget` に設定する
+
+        Parameters
+        ----------
+        predict : [(str, str)] -> any
+          文脈と質問文の組のリストを受け取る推論関数
+        questions : [(str, str, ...)]
+          計測に用いる質問
+        budgets : Iterable[int]
+          試す予算
+        repeat : int
+          各予算での計測回数．最良値を採用する
+
+        Returns
+        -------
+        {int: float}
+          予算ごとの処理量(質問数/秒)
+        """
+        report = {}
+        for budget in budgets:
+            self.token_budget = budget
+            best = 0.0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for idxs in self.batches(questions):
+                    predict([questions[i][:2] for i in idxs])
+                elapsed = time.perf_counter() - start
+                best = max(best, len(questions) / elapsed if elapsed else float("inf"))
+            report[budget] = best
+        if report:
+            self.token_budget = max(report, key=report.get)
+        return report
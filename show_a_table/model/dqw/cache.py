@@ -0,0 +1,190 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+# これだけ参照が溜まったら書き込みを待たずに反映する
+_touch_batch = 1000
+
+
+def context_hash(context):
+    """
+    段落本文のハッシュ値を返す
+
+    Parameters
+    ----------
+    context : str
+
+    Returns
+    -------
+    str
+      sha1 の16進表記
+    """
+    return hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    読解モデルの回答をディスク上に保持するキャッシュ
+
+    キーは (カテゴリ, wiki_id, 段落のハッシュ, 質問文)．
+    値は top-1 の回答文字列とスコア．回答無しも `None` として記録する．
+    `max_entries` を越えた場合は最終参照が古いものから捨てる(LRU)．
+    参照時刻の更新は溜めておき，次の書き込みと同じトランザクションで反映するので，
+    読むだけの間は他のプロセスの書き込みを妨げない．
+
+    Attributes
+    ----------
+    hits : int
+    misses : int
+    evictions : int
+    """
+
+    _schema = """
+    CREATE TABLE IF NOT EXISTS answers (
+      cat TEXT NOT NULL,
+      wid TEXT NOT NULL,
+      ctx TEXT NOT NULL,
+      question TEXT NOT NULL,
+      answer TEXT,
+      score REAL,
+      atime REAL NOT NULL,
+      PRIMARY KEY (cat, wid, ctx, question)
+    );
+    CREATE INDEX IF NOT EXISTS answers_atime ON answers (atime);
+    """
+
+    def __init__(self, dbpath, max_entries=1000000):
+        """
+        Parameters
+        ----------
+        dbpath : str
+          sqlite のファイル．":memory:" も可
+        max_entries : int
+          保持する最大件数．0 以下なら無制限
+        """
+        self.dbpath = dbpath
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # 暗黙のトランザクションを張らず，書き込みだけを明示的に囲む
+        self._conn = sqlite3.connect(dbpath, check_same_thread=False, isolation_level=None)
+        if dbpath != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self._schema)
+        # 参照された行と時刻．書き込み時にまとめて反映する
+        self._touched = {}
+        # 件数の上界．越えた時だけ数え直す
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+
+    def get(self, cat, wid, context, question):
+        """
+        Returns
+        -------
+        (str, float) or None or False
+          キャッシュされた (回答, スコア)．回答無しが記録されていれば None，未登録なら False
+        """
+        key = (cat, wid, context_hash(context), question)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, score FROM answers WHERE cat=? AND wid=? AND ctx=? AND question=?",
+                key).fetchone()
+            if row is None:
+                self.misses += 1
+                return False
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= _touch_batch:
+                self._flush()
+        if row[0] is None:
+            return None
+        return (row[0], row[1])
+
+    def put(self, cat, wid, context, question, answer, score=None):
+        """
+        Parameters
+        ----------
+        answer : str or None
+          回答が無かった場合は None
+        score : float
+        """
+        self.put_many([(cat, wid, context, question, answer, score)])
+
+    def put_many(self, rows):
+        """
+        Parameters
+        ----------
+        rows : [(str, str, str, str, str, float)]
+          cat, wid, context, question, answer, score
+        """
+        now = time.time()
+        rows = [(cat, wid, context_hash(ctx), q, ans, score, now)
+                for cat, wid, ctx, q, ans, score in rows]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._touch()
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                # 置き換えた行も数えるので上界になる
+                self._count += len(rows)
+                self._evict()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _touch(self):
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE answers SET atime=? WHERE cat=? AND wid=? AND ctx=? AND question=?",
+            [(atime,) + key for key, atime in self._touched.items()])
+        self._touched.clear()
+
+    def _flush(self):
+        if not self._touched:
+            return
+        self._conn.execute("BEGIN")
+        self._touch()
+        self._conn.execute("COMMIT")
+
+    def _evict(self):
+        if self.max_entries <= 0 or self._count <= self.max_entries:
+            return
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        over = self._count - self.max_entries
+        if over <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM answers WHERE rowid IN "
+            "(SELECT rowid FROM answers ORDER BY atime LIMIT ?)", (over,))
+        self._count -= over
+        self.evictions += over
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def stats(self):
+        """
+        Returns
+        -------
+        {str: number}
+          hits, misses, evictions, hit_rate, entries
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
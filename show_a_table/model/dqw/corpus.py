@@ -0,0 +1,184 @@
+import glob
+import json
+import mmap
+from os import path
+
+
+class CorpusStore:
+    """
+    カテゴリ単位のコーパスを1ファイルにまとめたアーカイブ
+
+    記事は1件ずつ JSON として連結して保存し，wiki_id からオフセットを引く索引を別に持つ．
+    本体は mmap で開くため，必要な記事だけを読むことになる．
+
+    Attributes
+    ----------
+    packpath : str
+      アーカイブ本体のパス．索引は `packpath + ".idx"` に置く
+    """
+
+    def __init__(self, packpath):
+        """
+        Parameters
+        ----------
+        packpath : str
+          `build` で作成したアーカイブ
+        """
+        self.packpath = packpath
+        with open(packpath + ".idx") as f:
+            self._index = json.load(f)
+        self._by_title = {}
+        for wid, (_, _, title) in self._index.items():
+            self._by_title.setdefault(title, []).append(wid)
+        self._file = open(packpath, "rb")
+        if self._index:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._mm = b""
+
+    @staticmethod
+    def build(articles, packpath):
+        """
+        記事列からアーカイブを作成する
+
+        Parameters
+        ----------
+        articles : Iterable[dict]
+          少なくとも "title" と "WikipediaID" を持つ辞書
+        packpath : str
+
+        Returns
+        -------
+        int
+          格納した記事数
+        """
+        index = {}
+        offset = 0
+        with open(packpath, "wb") as f:
+            for art in articles:
+                buf = json.dumps(art, ensure_ascii=False).encode("utf-8")
+                f.write(buf)
+                index[art["WikipediaID"]] = (offset, len(buf), art["title"])
+                offset += len(buf)
+        with open(packpath + ".idx", "w") as f:
+            json.dump(index, f, ensure_ascii=False)
+        return len(index)
+
+    @staticmethod
+    def exists(packpath):
+        return path.isfile(packpath) and path.isfile(packpath + ".idx")
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, wid):
+        return wid in self._index
+
+    def wids(self, ids=None, titles=None):
+        """
+        条件を満たす wiki_id を格納順に返す
+
+        Parameters
+        ----------
+        ids : Set[str]
+        titles : Set[str]
+
+        Returns
+        -------
+        List[str]
+        """
+        if titles:
+            cands = {wid for t in titles for wid in self._by_title.get(t, [])}
+            if ids:
+                cands &= set(ids)
+        elif ids:
+            cands = {wid for wid in ids if wid in self._index}
+        else:
+            return list(self._index.keys())
+        return sorted(cands, key=lambda wid: self._index[wid][0])
+
+    def title(self, wid):
+        return self._index[wid][2]
+
+    def article(self, wid):
+        """
+        Parameters
+        ----------
+        wid : str
+
+        Returns
+        -------
+        dict
+          格納時の記事
+
+        Raises
+        ------
+        KeyError
+          wid が存在しない場合
+        """
+        offset, length, _ = self._index[wid]
+        return json.loads(self._mm[offset:offset+length].decode("utf-8"))
+
+    def articles(self, ids=None, titles=None):
+        """
+        Parameters
+        ----------
+        ids : Set[str]
+        titles : Set[str]
+
+        Yields
+        ------
+        dict
+        """
+        for wid in self.wids(ids, titles):
+            yield self.article(wid)
+
+    def close(self):
+        if self._index:
+            self._mm.close()
+        self._file.close()
+
+
+def squad_articles(ds):
+    """
+    SQuAD 形式のデータセットから記事を取り出す
+
+    Parameters
+    ----------
+    ds : str
+      squad_*.json のパス
+
+    Yields
+    ------
+    dict
+      "title", "WikipediaID", "paragraphs"(context のみ)
+    """
+    with open(ds) as f:
+        data = json.load(f)['data']
+    for art in data:
+        yield {
+            "title": art['title'],
+            "WikipediaID": art['WikipediaID'],
+            "paragraphs": [{"context": prh['context']} for prh in art['paragraphs']],
+        }
+
+
+def plain_articles(datapath, get_title):
+    """
+    PLAIN 形式(記事ごとの txt)のディレクトリから記事を取り出す
+
+    Parameters
+    ----------
+    datapath : str
+    get_title : str -> str
+      本文からタイトルを得る関数
+
+    Yields
+    ------
+    dict
+      "title", "WikipediaID", "text"
+    """
+    for fn in sorted(glob.iglob(path.join(datapath, "*.txt"))):
+        with open(fn) as f:
+            text = f.read()
+        yield {"title": get_title(text), "WikipediaID": fn[:-4], "text": text}
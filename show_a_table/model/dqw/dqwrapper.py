@@ -4,11 +4,19 @@ from collections import OrderedDict, defaultdict
 from os import environ, path
 import copy
 import glob
+import os
+import threading
 
-import time
-import torch
-from drqa.reader import Predictor
-from tqdm import tqdm
+from .backend import make_backend
+from .batching import TokenBudgetBatcher
+from .cache import AnswerCache
+from .corpus import CorpusStore, plain_articles, squad_articles
+from .materialize import AttributeTable
+from . import retrieval
+from .pipeline import Pipeline, Stage
+from .planner import make_plan, sample_ids
+from .stats import stage
+from .table import ResultTable
 
 _datadir = environ.get("DRQA_DATA_DIR", None) or "/drqa_shinra/data"
 
@@ -22,16 +30,107 @@ _datasets = {
 _model = path.join(_datadir, "drqa-models/train-multipleanswer/20190730-9760b184.mdl")
 _embedding_file = path.join(_datadir, 'embeddings/cc.ja.300.vec')
 _tokenizer = 'mecab'
+_workdir = path.join(_datadir, "work/show_a_table")
+_corpora = {}
+_indices = {}
+_materialized = {}
 _num_workers = 10
+_device = environ.get("DRQA_DEVICE", None) or "auto"
+_backend = environ.get("DQW_BACKEND", None) or "drqa"
+_server = environ.get("DQW_SERVER", None) or "http://127.0.0.1:8765"
 
+# Backend．読み込みに時間がかかるので初回利用時に作る
+_predictor = None
+_predictor_lock = threading.Lock()
 
-_predictor = Predictor(
-    model=_model,
-    tokenizer=_tokenizer,
-    embedding_file=_embedding_file,
-    num_workers=_num_workers,
-)
-_predictor.cuda()
+
+def set_backend(backend):
+    """
+    `run` などが用いる読解モデルを差し替える
+
+    Parameters
+    ----------
+    backend : Backend
+      None ならば次回利用時に既定のものを作りなおす
+    """
+    global _predictor
+    with _predictor_lock:
+        old, _predictor = _predictor, backend
+    if old is not None and old is not backend:
+        old.close()
+
+
+def configure(device=None, backend=None):
+    """
+    読解モデルの実行環境を指定する．読み込み済みのモデルは破棄される
+
+    Parameters
+    ----------
+    device : str
+      "cuda", "cpu", "auto" のいずれか．auto ならば GPU が使えるときに GPU を使う
+    backend : str
+      "drqa", "stub", "remote" のいずれか．remote ならば `server` で起動した推論サーバを用いる
+    """
+    global _device, _backend
+    device = device or _device
+    if device not in ("cuda", "cpu", "auto"):
+        raise ValueError(f"unknown device: {device}")
+    _device = device
+    _backend = backend or _backend
+    set_backend(None)
+
+
+def _default_backend():
+    if _backend == "drqa":
+        return make_backend("drqa", model=_model, embedding_file=_embedding_file,
+                            tokenizer=_tokenizer, num_workers=_num_workers, device=_device)
+    elif _backend == "remote":
+        return make_backend("remote", url=_server)
+    return make_backend(_backend)
+
+
+def _get_predictor():
+    """
+    読解モデルを返す．未指定ならば既定のものを作る
+
+    Returns
+    -------
+    Backend
+    """
+    global _predictor
+    with _predictor_lock:
+        if _predictor is None:
+            _predictor = _default_backend()
+        return _predictor
+
+
+def warmup(background=True):
+    """
+    読解モデルを先に読み込んでおく
+
+    Parameters
+    ----------
+    background : bool
+      True ならば別スレッドで読み込み，すぐに戻る
+
+    Returns
+    -------
+    threading.Thread or None
+      background の場合は読み込みを行うスレッド
+    """
+    if not background:
+        _get_predictor().load()
+        return None
+
+    def load():
+        try:
+            _get_predictor().load()
+        except Exception as e:
+            print(e, file=sys.stderr)
+
+    th = threading.Thread(target=load, name="dqwrapper-warmup", daemon=True)
+    th.start()
+    return th
 
 
 def _get_title_from_text(text):
@@ -42,6 +141,90 @@ def _get_title_from_text(text):
     return "NOTHING FOUND"
 
 
+def _pack_path(ds, whole=False):
+    """
+    `ds` に対応するアーカイブの位置を返す
+    """
+    if whole:
+        return path.join(_workdir, "corpus", f"PLAIN_{ds}.pack")
+    return path.join(_workdir, "corpus", path.basename(ds)[:-len(".json")] + ".pack")
+
+
+def _corpus(ds, whole=False):
+    """
+    `ds` のアーカイブを開く．`ingest` されていなければ None
+    """
+    packpath = _pack_path(ds, whole)
+    if packpath not in _corpora:
+        if not CorpusStore.exists(packpath):
+            return None
+        _corpora[packpath] = CorpusStore(packpath)
+    return _corpora[packpath]
+
+
+def _contexts(ds, whole=False):
+    """
+    `ds` の全段落(whole ならば全記事の窓)を返す
+    """
+    corpus = _corpus(ds, whole)
+    if whole:
+        arts = corpus.articles() if corpus is not None else \
+            plain_articles(path.join(_datadir, f"datasets/PLAIN/{ds}"), _get_title_from_text)
+        for art in arts:
+            yield from retrieval.windows(art["text"])
+    else:
+        arts = corpus.articles() if corpus is not None else squad_articles(ds)
+        for art in arts:
+            for prh in art["paragraphs"]:
+                yield prh["context"]
+
+
+def _bm25(ds, whole=False):
+    """
+    `ds` 全体の BM25 統計量．初回のみコーパスを走査する
+    """
+    key = (ds, whole)
+    if key not in _indices:
+        _indices[key] = retrieval.BM25Index(_contexts(ds, whole))
+    return _indices[key]
+
+
+def ingest(names=None, whole=False):
+    """
+    コーパスを一度だけ読み，索引付きのアーカイブにまとめる
+
+    以降の `_make_questions` / `_make_questions_from_ds` はこれを用いる
+
+    Parameters
+    ----------
+    names : [str]
+      whole なら PLAIN 配下のカテゴリ名(UpperCamelCase)，そうでなければ `_datasets` のキー．
+      SQuAD 形式で未指定の場合は全てを対象とする
+    whole : bool
+
+    Returns
+    -------
+    {str: int}
+      アーカイブと格納した記事数
+    """
+    os.makedirs(path.join(_workdir, "corpus"), exist_ok=True)
+    if whole:
+        sources = [(name, plain_articles(path.join(_datadir, f"datasets/PLAIN/{name}"),
+                                         _get_title_from_text))
+                   for name in names or []]
+    else:
+        sources = [(_datasets[name], squad_articles(_datasets[name]))
+                   for name in names or _datasets.keys()]
+    ret = {}
+    for ds, arts in sources:
+        packpath = _pack_path(ds, whole)
+        old = _corpora.pop(packpath, None)
+        if old:
+            old.close()
+        ret[packpath] = CorpusStore.build(arts, packpath)
+    return ret
+
+
 def _make_questions_from_ds(name, query, ids=None, titles=None):
     """
     Parameters
@@ -55,6 +238,10 @@ def _make_questions_from_ds(name, query, ids=None, titles=None):
     exs : [(str, str, str, str)]
       context, query, title, wiki_id
     """
+    corpus = _corpus(name, whole=True)
+    if corpus is not None:
+        return [(art["text"], query.get_query(art["title"]), art["title"], art["WikipediaID"])
+                for art in corpus.articles(ids, titles)]
     datapath = path.join(_datadir, f"datasets/PLAIN/{name}")
     exs = []
     for fn in glob.iglob(path.join(datapath, "*.txt")):
@@ -84,6 +271,11 @@ def _make_questions(ds, query, ids=None, titles=None):
     exs : [(str, str, str, str)]
       context, query, title, wiki_id
     """
+    corpus = _corpus(ds)
+    if corpus is not None:
+        return [(prh['context'], query.get_query(art['title']), art['title'], art['WikipediaID'])
+                for art in corpus.articles(ids, titles)
+                for prh in art['paragraphs']]
     with open(ds) as f:
         data = json.load(f)['data']
     exs = []
@@ -101,50 +293,546 @@ def _make_questions(ds, query, ids=None, titles=None):
     return exs
 
 
-def _update(store, qg, ds, batch_size=6, whole=False):
+def _top1(result):
+    """
+    predict_batch の1問分の結果から最上位の回答とスコアを取り出す
+
+    Returns
+    -------
+    (str, float) or None
+      回答が無い場合は None
+    """
+    if not len(result):
+        return None
+    best = result[0]
+    score = float(best[1]) if len(best) > 1 else None
+    return (best[0]['text'], score)
+
+
+def _batches(questions, batch_size=6, batcher=None):
+    """
+    Returns
+    -------
+    [[int]]
+      `questions` の添字をバッチごとにまとめたもの
+    """
+    if batcher is not None:
+        return batcher.batches(questions)
+    return [list(range(idx, min(idx+batch_size, len(questions))))
+            for idx in range(0, len(questions), batch_size)]
+
+
+def _predict(questions, batch_size=6, cache=None, cat="", batcher=None, stats=None):
+    """
+    質問をまとめて読解モデルに渡す．`cache` があればそれに無いものだけを渡す
+
+    Parameters
+    ----------
+    questions : [(str, str, str, str)]
+      context, query, title, wiki_id
+    batch_size : int
+    cache : AnswerCache
+    cat : str
+      キャッシュのキーに用いるカテゴリ名
+    batcher : TokenBudgetBatcher
+      指定された場合は `batch_size` の代わりにこれでバッチを組む
+    stats : RunStats
+      指定された場合は所要時間と件数を記録する
+
+    Returns
+    -------
+    answers : [(str, float) or None]
+      `questions` と同順の回答
+    """
+    answers = [None] * len(questions)
+    misses = []
+    with stage(stats, "cache"):
+        for idx, (ctx, q, _, wid) in enumerate(questions):
+            if cache is not None:
+                hit = cache.get(cat, wid, ctx, q)
+                if hit is not False:
+                    answers[idx] = hit
+                    continue
+            misses.append(idx)
+    if stats is not None:
+        stats.count("questions", len(questions))
+        stats.count("cache_hits", len(questions) - len(misses))
+    for bidxs in _batches([questions[i] for i in misses], batch_size, batcher):
+        idxs = [misses[i] for i in bidxs]
+        with stage(stats, "predict", size=len(idxs)):
+            results = _get_predictor().predict_batch([questions[i][:2] for i in idxs], top_n=1)
+        if stats is not None:
+            stats.count("batches")
+        rows = []
+        for i, res in zip(idxs, results):
+            answers[i] = _top1(res)
+            ctx, q, _, wid = questions[i]
+            ans, score = answers[i] if answers[i] else (None, None)
+            rows.append((cat, wid, ctx, q, ans, score))
+        if cache is not None:
+            cache.put_many(rows)
+    return answers
+
+
+def _questions(ds, qg, ids=None, whole=False):
+    if whole:
+        return _make_questions_from_ds(ds, qg, ids=ids)
+    return _make_questions(ds, qg, ids=ids)
+
+
+def _exam(qg, questions, answers, stats=None):
+    """
+    回答をまとめて `qg.exam_batch` に掛ける
+
+    Parameters
+    ----------
+    qg : DQQuery
+    questions : [(str, str, str, str)]
+    answers : [(str, float) or None]
+      `_predict` の戻り値
+
+    Returns
+    -------
+    [((str, str, str, str), str)]
+      質問と通過した回答の組
+    """
+    pairs = [(question, answer[0]) for question, answer in zip(questions, answers)
+             if answer is not None]
+    if not pairs:
+        return []
+    with stage(stats, "exam", size=len(pairs)):
+        passed = qg.exam_batch([text for _, text in pairs])
+    return [pair for pair, ok in zip(pairs, passed) if ok]
+
+
+def _passed(qg, questions, batch_size=6, cache=None, cat="", batcher=None, stats=None):
+    """
+    全ての質問を読解モデルに渡し，`qg.exam` を通過した回答を返す
+
+    Returns
+    -------
+    [((str, str, str, str), str)]
+      質問と通過した回答の組
+    """
+    answers = _predict(questions, batch_size, cache=cache, cat=cat, batcher=batcher, stats=stats)
+    return _exam(qg, questions, answers, stats)
+
+
+def _passed_exists(qg, questions, batch_size=6, cache=None, cat="", batcher=None, stats=None):
+    """
+    記事ごとに段落を順に読解モデルへ渡し，通過する回答が得られた記事はそれ以降を読まない
+
+    各記事の i 番目の段落をまとめて1巡とし，巡ごとにバッチを組む．段落は記事中の出現順(リード文が先頭)に読む
+
+    Returns
+    -------
+    [((str, str, str, str), str)]
+      質問と通過した回答の組．記事ごとに高々1つ
+    """
+    articles = OrderedDict()
+    for question in questions:
+        articles.setdefault(question[3], []).append(question)
+    ret = []
+    pending = list(articles.keys())
+    rnd = 0
+    while pending:
+        batch = [articles[wid][rnd] for wid in pending]
+        answers = _predict(batch, batch_size, cache=cache, cat=cat, batcher=batcher, stats=stats)
+        passed = _exam(qg, batch, answers, stats)
+        ret.extend(passed)
+        done = {question[3] for question, _ in passed}
+        rnd += 1
+        pending = [wid for wid in pending if wid not in done and rnd < len(articles[wid])]
+    return ret
+
+
+def _articles(ds, ids=None, whole=False):
+    """
+    `ds` の記事を1件ずつ返す
+
+    Yields
+    ------
+    dict
+      "title", "WikipediaID" と，"paragraphs"(SQuAD) あるいは "text"(whole)
+    """
+    corpus = _corpus(ds, whole)
+    if corpus is not None:
+        yield from corpus.articles(ids)
+        return
+    if whole:
+        arts = plain_articles(path.join(_datadir, f"datasets/PLAIN/{ds}"), _get_title_from_text)
+    else:
+        arts = squad_articles(ds)
+    for art in arts:
+        if ids and art["WikipediaID"] not in ids:
+            continue
+        yield art
+
+
+def _passed_pipelined(qg, ds, ids=None, whole=False, batch_size=6, cache=None, cat="",
+                      batcher=None, top_k=None, report=None, stats=None):
+    """
+    記事の読み込み，質問生成，バッチ化，推論，試験を別スレッドで重ねて実行する
+
+    Parameters
+    ----------
+    report : list
+      指定された場合は `Pipeline.report()` を追加する
+
+    Returns
+    -------
+    [((str, str, str, str), str)]
+      質問と通過した回答の組
+    """
+    def build(art):
+        title, wid = art["title"], art["WikipediaID"]
+        q = qg.get_query(title)
+        ctxs = retrieval.windows(art["text"]) if whole and top_k else \
+            [art["text"]] if whole else [prh["context"] for prh in art["paragraphs"]]
+        questions = [(ctx, q, title, wid) for ctx in ctxs if qg.check_context(ctx)]
+        if top_k:
+            questions = retrieval.top_k(_bm25(ds, whole), questions, top_k, qg.attr)
+        return questions
+
+    # batcher を使う場合は，ある程度溜めてから文脈長で並べる
+    window = batch_size if batcher is None else max(batch_size, 256)
+    buf = []
+
+    def batch(question):
+        buf.append(question)
+        if len(buf) < window:
+            return []
+        return flush()
+
+    def flush():
+        questions = buf[:]
+        del buf[:]
+        return [[questions[i] for i in idxs] for idxs in _batches(questions, batch_size, batcher)]
+
+    def predict(questions):
+        return [(questions, _predict(questions, len(questions), cache=cache, cat=cat,
+                                     stats=stats))]
+
+    def exam(batch):
+        return _exam(qg, *batch, stats=stats)
+
+    pipe = Pipeline(_articles(ds, ids, whole), [
+        Stage("build", build),
+        Stage("batch", batch, flush),
+        Stage("predict", predict),
+        Stage("exam", exam),
+    ])
+    passed = list(pipe)
+    if report is not None:
+        report.append(pipe.report())
+    return passed
+
+
+def _collect(ids, qg, ds, batch_size=6, whole=False, cache=None, cat="", exists=False,
+             batcher=None, top_k=None, pipeline=False, stats=None):
+    """
+    `ids` の記事について質問を作って読解モデルに渡し，`qg.exam` を通過した回答を集める
+
+    Parameters
+    ----------
+    ids : Set[str]
+      対象の wiki_id．空ならば全記事
+    qg : DQQuery
+    batch_size : int
+    cache : AnswerCache
+      指定された場合は回答をキャッシュし，キャッシュ済みの質問は読解モデルに渡さない
+    cat : str
+      キャッシュのキーに用いるカテゴリ名
+    exists : bool
+      True ならば記事ごとに通過する回答が1つ得られた時点で残りの段落を読まない
+    batcher : TokenBudgetBatcher
+      指定された場合は文脈長でまとめたバッチを用いる
+    top_k : int
+      指定された場合は記事ごとに BM25 で上位 `top_k` 件の段落(whole ならば窓)だけを読む
+    pipeline : bool or list
+      真ならば読み込みから試験までを `Pipeline` で重ねて実行する．
+      list ならば各段の稼働状況(`Pipeline.report()`)をこれに追加する
+    stats : RunStats
+      指定された場合は段階ごとの所要時間と件数を記録する
+
+    Returns
+    -------
+    [((str, str, str, str), str)]
+      質問と通過した回答の組
+    """
+    if pipeline is True or isinstance(pipeline, list):
+        if exists:
+            raise ValueError("exists cannot be combined with pipeline")
+        report = pipeline if isinstance(pipeline, list) else None
+        return _passed_pipelined(qg, ds, ids=ids, whole=whole, batch_size=batch_size,
+                                 cache=cache, cat=cat, batcher=batcher, top_k=top_k,
+                                 report=report, stats=stats)
+    with stage(stats, "questions"):
+        questions = _questions(ds, qg, ids=ids, whole=whole)
+    with stage(stats, "filter"):
+        if top_k and whole:
+            questions = retrieval.split_windows(questions)
+        # 必要条件を満たさない文脈は読むまでもない．件数は qg.ctx_skipped に残る
+        questions = [q for q in questions if qg.check_context(q[0])]
+        if top_k:
+            questions = retrieval.top_k(_bm25(ds, whole), questions, top_k, qg.attr)
+    if exists:
+        return _passed_exists(qg, questions, batch_size, cache=cache, cat=cat, batcher=batcher,
+                              stats=stats)
+    return _passed(qg, questions, batch_size, cache=cache, cat=cat, batcher=batcher, stats=stats)
+
+
+def _update(store, qg, ds, batch_size=6, whole=False, **kwargs):
     """
     Parameters
     ----------
     store : {str: {"title": str, "attrs": {str: [str]}}}
     qg : DQQuery
     batch_size : int
+    kwargs
+      `_collect` を参照．`exists` ならば `attrs` には回答が高々1つしか残らない
 
     Returns
     -------
     store : {str: {"title": str, "attrs": {str: [str]}}}
     """
-    if whole:
-        questions = _make_questions_from_ds(ds, qg, ids=set(store))
-    else:
-        questions = _make_questions(ds, qg, ids=set(store))
-    batches = [questions[idx:idx+batch_size] for idx in range(0, len(questions), batch_size)]
-    for batch in batches:
-        results = _predictor.predict_batch([b[:2] for b in batch], top_n=1)
-        for i in range(len(results)):
-            if not len(results[i]):
-                continue
-            res_text = results[i][0][0]['text']
-            if not qg.exam(res_text):
-                continue
-            wid = batch[i][3]
-            wobj = store.get(wid, {})
-            if not wobj:
-                wobj["title"] = batch[i][2]
-                wobj["attrs"] = {
-                    qg.attr: [res_text]
-                }
-                store[wid] = wobj
-            else:
-                _l = wobj["attrs"].get(qg.attr, [])
-                _l.append(res_text)
-                wobj["attrs"][qg.attr] = _l
+    passed = _collect(set(store), qg, ds, batch_size=batch_size, whole=whole, **kwargs)
+    return _store(store, qg, passed)
+
+
+def _store(store, qg, passed):
+    """
+    通過した回答を `store` に加え，`qg` を通過しなかった記事を除く
+
+    Parameters
+    ----------
+    store : {str: {"title": str, "attrs": {str: [str]}}}
+    qg : DQQuery
+    passed : [((str, str, str, str), str)]
+
+    Returns
+    -------
+    store : {str: {"title": str, "attrs": {str: [str]}}}
+    """
+    for question, res_text in passed:
+        wid = question[3]
+        wobj = store.get(wid, {})
+        if not wobj.get("attrs"):
+            wobj["title"] = question[2]
+            wobj["attrs"] = {
+                qg.attr: [res_text]
+            }
+            store[wid] = wobj
+        else:
+            _l = wobj["attrs"].get(qg.attr, [])
+            _l.append(res_text)
+            wobj["attrs"][qg.attr] = _l
     excludes = [wid for wid, wobj in store.items() if not wobj["attrs"].get(qg.attr, False)]
     for ex in excludes:
         store.pop(ex)
     return store
 
 
-def run(cs, full=True):
+def answer_cache(dbpath=None, max_entries=1000000):
+    """
+    既定の場所にある回答キャッシュを開く
+
+    Parameters
+    ----------
+    dbpath : str
+      未指定時は環境変数 `SHOW_A_TABLE_CACHE` あるいは `_datadir` 配下の answers.sqlite3
+    max_entries : int
+
+    Returns
+    -------
+    AnswerCache
+    """
+    dbpath = dbpath or environ.get("SHOW_A_TABLE_CACHE", None) or \
+        path.join(_workdir, "answers.sqlite3")
+    if dbpath != ":memory:":
+        os.makedirs(path.dirname(dbpath), exist_ok=True)
+    return AnswerCache(dbpath, max_entries=max_entries)
+
+
+def all_ids(cs):
+    """
+    Parameters
+    ----------
+    cs : CategorySelector
+
+    Returns
+    -------
+    List[str]
+      カテゴリの全記事の wiki_id
+    """
+    ds = _datasets[cs.cat.name]
+    corpus = _corpus(ds)
+    if corpus is not None:
+        return corpus.wids()
+    return sorted({q[3] for q in _make_questions(ds, cs.queries[0])})
+
+
+def plan_queries(cs, sample_size=50, seed=None, cache=None):
+    """
+    記事の無作為標本で各クエリの通過率とコストを見積り，実行順序を決める
+
+    Parameters
+    ----------
+    cs : CategorySelector
+      Query設定済みのもの．
+    sample_size : int
+      標本とする記事数
+    seed : int
+    cache : AnswerCache
+      指定された場合，標本に対する回答は本番の実行でも再利用される
+
+    Returns
+    -------
+    QueryPlan
+      `print` すれば見積りの一覧が得られる
+    """
+    ds = _datasets[cs.cat.name]
+    sample = sample_ids(all_ids(cs), sample_size, seed)
+
+    def evaluate(qg, ids):
+        questions = [q for q in _make_questions(ds, qg, ids=ids) if qg.check_context(q[0])]
+        answers = _predict(questions, cache=cache, cat=cs.cat.name)
+        passed = {q[3] for q, _ in _exam(qg, questions, answers)}
+        return passed, len(questions)
+
+    # 読み込みの時間が先頭のクエリのコストに入らないよう，先に読み込む
+    return make_plan(cs.queries, sample, evaluate, warmup=lambda: _get_predictor().load())
+
+
+def tune_batcher(cs, sample_size=100, seed=None, budgets=(2048, 4096, 8192, 16384, 32768)):
+    """
+    このマシンで処理量が最大となるトークン予算を計測し，それを設定した `TokenBudgetBatcher` を返す
+
+    Parameters
+    ----------
+    cs : CategorySelector
+      Query設定済みのもの．先頭のクエリで計測用の質問を作る
+    sample_size : int
+      計測に用いる記事数
+    seed : int
+    budgets : Iterable[int]
+
+    Returns
+    -------
+    (TokenBudgetBatcher, {int: float})
+      調整済みのバッチャと予算ごとの処理量(質問数/秒)
+    """
+    ds = _datasets[cs.cat.name]
+    sample = sample_ids(all_ids(cs), sample_size, seed)
+    questions = _make_questions(ds, cs.queries[0], ids=sample)
+    batcher = TokenBudgetBatcher()
+    # 読み込みの時間が最初の予算の計測に入らないようにする
+    _get_predictor().load()
+    report = batcher.autotune(lambda pairs: _get_predictor().predict_batch(pairs, top_n=1),
+                              questions, budgets)
+    return batcher, report
+
+
+def retrieval_report(cs, ks=(1, 2, 3, 5), sample_size=50, seed=None, cache=None):
+    """
+    標本の記事について全段落を読み，BM25 の上位 k 段落だけを読んだ場合と比べる
+
+    Parameters
+    ----------
+    cs : CategorySelector
+      Query設定済みのもの．
+    ks : Iterable[int]
+    sample_size : int
+    seed : int
+    cache : AnswerCache
+
+    Returns
+    -------
+    {str: {int: {"recall": float, "kept": float}}}
+      属性ごとの，k に対する再現率と読解モデルに渡す質問の割合
+    """
+    ds = _datasets[cs.cat.name]
+    sample = sample_ids(all_ids(cs), sample_size, seed)
+    index = _bm25(ds)
+    report = {}
+    for qg in cs.queries:
+        questions = _make_questions(ds, qg, ids=sample)
+        passed = _passed(qg, questions, cache=cache, cat=cs.cat.name)
+        report[qg.attr] = retrieval.recall_report(index, questions, passed, ks, qg.attr)
+    return report
+
+
+def _materialized_path(name):
+    return path.join(_workdir, "materialized", f"{name}.jsonl")
+
+
+def materialize(name, attrs=None, cache=None, batch_size=6, batcher=None):
+    """
+    カテゴリの全記事について，各属性の質問を全段落で読解モデルに渡し，回答を表として保存する
+
+    質問文は各 Refiner と同じ「{タイトル}の{属性}は?」とする
+
+    Parameters
+    ----------
+    name : str
+      `_datasets` のキー
+    attrs : List[str]
+      未指定時は config.toml にある全属性
+    cache : AnswerCache
+    batch_size : int
+    batcher : TokenBudgetBatcher
+
+    Returns
+    -------
+    str
+      保存先
+    """
+    from ..refiner.category_selector import CategorySelector
+    from ..refiner.refiner import Categories, FunQuery
+    ds = _datasets[name]
+    if not attrs:
+        cs = CategorySelector()
+        cs.cat = Categories[name]
+        attrs = cs.attributes()
+    table = AttributeTable()
+    for attr in attrs:
+        qg = FunQuery(lambda res: True, lambda tgt, attr=attr: f"{tgt}の{attr}は?")
+        questions = _make_questions(ds, qg)
+        answers = _predict(questions, batch_size, cache=cache, cat=name, batcher=batcher)
+        for question, answer in zip(questions, answers):
+            if answer is not None:
+                table.add(attr, question[3], question[2], answer[0])
+    fn = _materialized_path(name)
+    os.makedirs(path.dirname(fn), exist_ok=True)
+    table.save(fn)
+    _materialized.pop(name, None)
+    return fn
+
+
+def attribute_table(name):
+    """
+    `materialize` で保存した表を読み込む
+
+    Parameters
+    ----------
+    name : str
+
+    Returns
+    -------
+    AttributeTable
+
+    Raises
+    ------
+    FileNotFoundError
+      まだ `materialize` していない場合
+    """
+    if name not in _materialized:
+        _materialized[name] = AttributeTable.load(_materialized_path(name))
+    return _materialized[name]
+
+
+def run(cs, full=True, cache=None, plan=None, exists=False, batcher=None, top_k=None, ids=None,
+        pipeline=False, table=False, materialized=False, stats=None):
     """
     Parameters
     ----------
@@ -152,11 +840,82 @@ def run(cs, full=True):
       Query設定済みのもの．
     full : bool = True
       戻り値の型を決定する．Falseならば結果を[str]で返す
+    cache : AnswerCache
+      指定された場合は読解モデルの回答を再利用する．`answer_cache()` で得られる
+    plan : QueryPlan or bool
+      クエリの実行順序．True ならば `plan_queries` で見積る．未指定時は追加された順
+    exists : bool
+      True ならば各クエリを存在判定として扱い，記事ごとに最初に通過した回答で打ち切る
+    batcher : TokenBudgetBatcher
+      文脈長でバッチを組む場合に指定する．`tune_batcher` で調整できる
+    top_k : int
+      指定された場合は記事ごとに BM25 で上位 `top_k` 件の段落だけを読む．
+      `retrieval_report` で再現率との兼ね合いを確認できる
+    ids : Iterable[str]
+      指定された場合はこれらの記事だけを対象とする
+    pipeline : bool or list
+      真ならば読み込み，質問生成，推論，試験を別スレッドで重ねて実行する．
+      list ならばクエリごとの各段の稼働状況がこれに追加される
+    table : bool
+      True ならば結果を `ResultTable` で保持し，full の場合はそれを返す．
+      大きなカテゴリでの使用メモリを抑え，CSV/JSONL へ逐次書き出せる
+    materialized : bool
+      True ならば読解モデルを使わず，`materialize` で作成した表に各クエリの `exam` を適用する
+    stats : RunStats
+      指定された場合は段階ごとの所要時間，件数，メモリ，クエリごとの通過数をこれに集める．
+      `RunStats.trace_events` で trace event として書き出せる．run ごとに別のものを渡す
     """
+    with stage(stats, "run", category=cs.cat.name):
+        return _run(cs, full, cache, plan, exists, batcher, top_k, ids, pipeline, table,
+                    materialized, stats)
+
+
+def _run(cs, full, cache, plan, exists, batcher, top_k, ids, pipeline, table, materialized,
+         stats):
     ds = _datasets[cs.cat.name]
-    store = {}
-    for qg in cs.queries:
-        store = _update(store, qg, ds)
+    if plan is True:
+        plan = plan_queries(cs, cache=cache)
+    queries = plan.queries if plan else cs.queries
+    # 以前の run や見積りで数えた分を含めない
+    for qg in queries:
+        qg.reset_counts()
+    kwargs = dict(cache=cache, cat=cs.cat.name, exists=exists, batcher=batcher, top_k=top_k,
+                  pipeline=pipeline, stats=stats)
+    if materialized:
+        attr_table = attribute_table(cs.cat.name)
+
+        def collect(wids, qg):
+            with stage(stats, "exam"):
+                return attr_table.passed(qg, wids)
+    else:
+        def collect(wids, qg):
+            with stage(stats, "query", attr=qg.attr):
+                return _collect(wids, qg, ds, **kwargs)
+    if table:
+        res = ResultTable()
+        if ids:
+            res.restrict(ids)
+        for qg in queries:
+            wids = res.ids()
+            passed = collect(wids or set(), qg)
+            with stage(stats, "store"):
+                res.update(qg.attr, passed)
+            if stats is not None:
+                stats.add_query(qg, None if wids is None else len(wids), passed, len(res))
+            if not len(res):
+                break
+        return res if full else [title for _, title, _ in res.rows()]
+    store = {wid: {"title": "", "attrs": {}} for wid in ids} if ids else {}
+    for qg in queries:
+        candidates = len(store) if store else None
+        passed = collect(set(store), qg)
+        with stage(stats, "store"):
+            store = _store(store, qg, passed)
+        if stats is not None:
+            stats.add_query(qg, candidates, passed, len(store))
+        # 空の store は全記事を意味してしまうので，ここで打ち切る
+        if not store:
+            break
     if full:
         return store
     else:
@@ -0,0 +1,102 @@
+"""
+カテゴリごとに全属性・全記事の回答を事前に求めておく
+
+    python -m show_a_table.model.dqw.materialize CITY
+    python -m show_a_table.model.dqw.materialize COMPANY --attrs='["設立年", "本拠地"]'
+
+作成した表があれば `dqwrapper.run(cs, materialized=True)` は読解モデルを使わず，
+各クエリの `exam` を表の回答に適用するだけで結果を返す．
+"""
+import json
+
+
+class AttributeTable:
+    """
+    属性ごと・記事ごとの回答の表
+
+    Attributes
+    ----------
+    titles : {str: str}
+      wiki_id からタイトルへの対応
+    attrs : {str: {str: List[str]}}
+      属性ごとの，wiki_id から回答への対応．回答は段落ごとの top-1
+    """
+
+    def __init__(self, titles=None, attrs=None):
+        self.titles = titles or {}
+        self.attrs = attrs or {}
+
+    def add(self, attr, wid, title, answer):
+        self.titles[wid] = title
+        self.attrs.setdefault(attr, {}).setdefault(wid, []).append(answer)
+
+    def passed(self, qg, ids=None):
+        """
+        `qg.exam` を表の回答に適用する
+
+        Parameters
+        ----------
+        qg : DQQuery
+        ids : Set[str]
+          対象の wiki_id．空ならば全記事
+
+        Returns
+        -------
+        [((str, str, str, str), str)]
+          `dqwrapper._collect` と同じ形．文脈と質問文は空文字列
+
+        Raises
+        ------
+        KeyError
+          qg.attr が表に無い場合
+        """
+        col = self.attrs[qg.attr]
+        wids = [wid for wid in ids if wid in col] if ids else list(col.keys())
+        pairs = [(("", "", self.titles[wid], wid), ans) for wid in wids for ans in col[wid]]
+        passed = qg.exam_batch([ans for _, ans in pairs])
+        return [pair for pair, ok in zip(pairs, passed) if ok]
+
+    def save(self, fn):
+        """
+        1記事1行の JSON として保存する
+        """
+        with open(fn, "w") as f:
+            for wid, title in self.titles.items():
+                attrs = {attr: col[wid] for attr, col in self.attrs.items() if wid in col}
+                f.write(json.dumps({"wiki_id": wid, "title": title, "attrs": attrs},
+                                   ensure_ascii=False))
+                f.write("\n")
+
+    @classmethod
+    def load(cls, fn):
+        table = cls()
+        with open(fn) as f:
+            for line in f:
+                row = json.loads(line)
+                table.titles[row["wiki_id"]] = row["title"]
+                for attr, answers in row["attrs"].items():
+                    table.attrs.setdefault(attr, {})[row["wiki_id"]] = answers
+        return table
+
+
+def main(category, attrs=None, cache=False):
+    """
+    Parameters
+    ----------
+    category : str
+      `_datasets` のキー(CITY など)
+    attrs : List[str]
+      未指定時は config.toml にある全属性
+    cache : bool
+      True ならば既定の回答キャッシュを用いる
+    """
+    from . import dqwrapper
+    fn = dqwrapper.materialize(category, attrs=attrs,
+                               cache=dqwrapper.answer_cache() if cache else None)
+    print(fn)
+
+
+if __name__ == "__main__":
+    # dqwrapper から読み込まれる際には不要なので，ここで読み込む
+    import fire
+    fire.Fire(main)
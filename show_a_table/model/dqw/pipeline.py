@@ -0,0 +1,224 @@
+import queue
+import threading
+import time
+
+_END = object()
+# 停止の確認を兼ねたキューの待ち時間の上限(秒)
+_poll = 0.05
+
+
+class Stage:
+    """
+    パイプラインの1段．`process` は入力1件から出力の列を返す
+
+    Attributes
+    ----------
+    name : str
+    """
+
+    def __init__(self, name, process=None, flush=None):
+        """
+        Parameters
+        ----------
+        name : str
+        process : any -> Iterable[any]
+        flush : () -> Iterable[any]
+          入力が尽きたときに残りを吐き出す関数．バッチを組む段などで用いる
+        """
+        self.name = name
+        self._process = process
+        self._flush = flush
+
+    def process(self, item):
+        return self._process(item)
+
+    def flush(self):
+        return self._flush() if self._flush else ()
+
+
+class _Meter:
+    def __init__(self):
+        self.items_in = 0
+        self.items_out = 0
+        self.busy = 0.0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+
+
+class Pipeline:
+    """
+    各段を別スレッドで動かし，段の間を大きさ `maxsize` のキューでつなぐ
+
+    読み込み，質問生成，推論などを重ねて実行するためのもの．
+    段ごとに処理中・入力待ち・出力待ちの時間を計り，どこが律速しているかを `report` で示す
+    """
+
+    def __init__(self, source, stages, maxsize=8):
+        """
+        Parameters
+        ----------
+        source : Iterable[any]
+          最初の段への入力．これ自体も1つのスレッドで読み出す
+        stages : List[Stage]
+        maxsize : int
+          段の間のキューの大きさ
+        """
+        self.source = source
+        self.stages = stages
+        self.maxsize = maxsize
+        self.meters = {"source": _Meter()}
+        self.meters.update({st.name: _Meter() for st in stages})
+        self.wall = 0.0
+        self._error = None
+        self._stop = threading.Event()
+
+    def _put(self, q, item, meter=None):
+        """
+        Returns
+        -------
+        bool
+          False ならば停止が求められたので入れずに戻った
+        """
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_poll)
+                break
+            except queue.Full:
+                continue
+        if meter is not None:
+            meter.wait_out += time.perf_counter() - start
+        if self._stop.is_set():
+            return False
+        if meter is not None:
+            meter.items_out += 1
+        return True
+
+    def _get(self, q):
+        """
+        Returns
+        -------
+        any
+          キューの先頭．停止が求められた場合は `_END`
+        """
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_poll)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, e):
+        if self._error is None:
+            self._error = e
+        self._stop.set()
+
+    def _read(self, out):
+        meter = self.meters["source"]
+        it = iter(self.source)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                finally:
+                    meter.busy += time.perf_counter() - start
+                if not self._put(out, item, meter):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if self._stop.is_set() and hasattr(it, "close"):
+                # 読み出し途中の生成器を閉じ，ファイルなどを手放させる
+                it.close()
+            self._put(out, _END)
+
+    def _work(self, stage, inq, out):
+        meter = self.meters[stage.name]
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self._get(inq)
+                meter.wait_in += time.perf_counter() - start
+                if item is _END:
+                    break
+                meter.items_in += 1
+                start = time.perf_counter()
+                outputs = list(stage.process(item))
+                meter.busy += time.perf_counter() - start
+                for res in outputs:
+                    if not self._put(out, res, meter):
+                        return
+            if self._stop.is_set():
+                return
+            start = time.perf_counter()
+            outputs = list(stage.flush())
+            meter.busy += time.perf_counter() - start
+            for res in outputs:
+                if not self._put(out, res, meter):
+                    return
+        except Exception as e:
+            # 上流も下流も止める
+            self._fail(e)
+        finally:
+            self._put(out, _END)
+
+    def __iter__(self):
+        """
+        最後の段の出力を順に返す
+
+        途中で読むのをやめた(生成器を閉じた)場合や，いずれかの段で例外が起きた場合は
+        全ての段を止めてから戻る
+
+        Raises
+        ------
+        Exception
+          いずれかの段で起きた例外
+        """
+        start = time.perf_counter()
+        self._stop = threading.Event()
+        self._error = None
+        queues = [queue.Queue(self.maxsize) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._read, args=(queues[0],), name="pipeline-source",
+                                    daemon=True)]
+        threads += [threading.Thread(target=self._work, args=(st, queues[i], queues[i+1]),
+                                     name=f"pipeline-{st.name}", daemon=True)
+                    for i, st in enumerate(self.stages)]
+        for th in threads:
+            th.start()
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _END:
+                    break
+                yield item
+        finally:
+            # 全て読み終えていれば各段は既に終わっている．そうでなければ止める
+            self._stop.set()
+            for th in threads:
+                th.join()
+            self.wall = time.perf_counter() - start
+        if self._error is not None:
+            raise self._error
+
+    def report(self):
+        """
+        Returns
+        -------
+        {str: {str: number}}
+          段ごとの入出力件数，処理時間，入力待ち時間，出力待ち時間と，
+          全体時間に対する処理時間の割合(occupancy)．occupancy が1に近い段が律速している
+        """
+        return {
+            name: {
+                "items_in": m.items_in,
+                "items_out": m.items_out,
+                "busy": m.busy,
+                "wait_in": m.wait_in,
+                "wait_out": m.wait_out,
+                "occupancy": m.busy / self.wall if self.wall else 0.0,
+            }
+            for name, m in self.meters.items()
+        }
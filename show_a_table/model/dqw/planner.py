@@ -0,0 +1,155 @@
+import random
+import time
+
+
+class QueryEstimate:
+    """
+    標本上で計測したクエリ1つ分の見積り
+
+    Attributes
+    ----------
+    query : DQQuery
+    sample_size : int
+      標本の記事数
+    passed : int
+      標本のうち通過した記事数
+    questions : int
+      標本に対して発行した質問数
+    seconds : float
+      標本の評価にかかった時間
+    """
+
+    def __init__(self, query, sample_size, passed, questions, seconds):
+        self.query = query
+        self.sample_size = sample_size
+        self.passed = passed
+        self.questions = questions
+        self.seconds = seconds
+
+    @property
+    def pass_rate(self):
+        return self.passed / self.sample_size if self.sample_size else 1.0
+
+    @property
+    def cost(self):
+        """記事1件あたりの評価時間"""
+        return self.seconds / self.sample_size if self.sample_size else 0.0
+
+    @property
+    def rank(self):
+        """
+        小さいほど先に実行すべき値．独立なフィルタ列の期待コストを最小にする cost / (1 - pass_rate)
+        """
+        if self.pass_rate >= 1.0:
+            return float("inf")
+        return self.cost / (1.0 - self.pass_rate)
+
+    def as_dict(self):
+        return {
+            "attr": self.query.attr,
+            "priority": self.query.priori.name,
+            "sample_size": self.sample_size,
+            "passed": self.passed,
+            "questions": self.questions,
+            "seconds": self.seconds,
+            "pass_rate": self.pass_rate,
+            "cost": self.cost,
+            "rank": self.rank,
+        }
+
+
+class QueryPlan:
+    """
+    クエリの実行順序とその根拠
+
+    Priority の高いものを先に，同じ Priority の中では rank (同値なら通過率)の小さいものを先に並べる
+
+    Attributes
+    ----------
+    estimates : List[QueryEstimate]
+      実行順に並んだ見積り
+    """
+
+    def __init__(self, estimates):
+        self.estimates = sorted(
+            estimates, key=lambda e: (e.query.priori.value, e.rank, e.pass_rate))
+
+    @property
+    def queries(self):
+        return [e.query for e in self.estimates]
+
+    def expected_survivors(self, total):
+        """
+        Parameters
+        ----------
+        total : int
+          最初の記事数
+
+        Returns
+        -------
+        List[float]
+          各クエリの実行前に残っていると見込まれる記事数
+        """
+        ret = []
+        rest = float(total)
+        for e in self.estimates:
+            ret.append(rest)
+            rest *= e.pass_rate
+        return ret
+
+    def __str__(self):
+        lines = ["{:>3} {:<20} {:<8} {:>9} {:>10} {:>10}".format(
+            "#", "attr", "priority", "pass_rate", "cost[s]", "rank")]
+        for i, e in enumerate(self.estimates):
+            lines.append("{:>3} {:<20} {:<8} {:>9.3f} {:>10.4f} {:>10.4f}".format(
+                i, e.query.attr, e.query.priori.name, e.pass_rate, e.cost, e.rank))
+        return "\n".join(lines)
+
+
+def sample_ids(wids, size, seed=None):
+    """
+    Parameters
+    ----------
+    wids : List[str]
+    size : int
+    seed : int
+
+    Returns
+    -------
+    Set[str]
+      高々 `size` 件の無作為標本
+    """
+    wids = list(wids)
+    if len(wids) <= size:
+        return set(wids)
+    return set(random.Random(seed).sample(wids, size))
+
+
+def make_plan(queries, sample, evaluate, warmup=None):
+    """
+    各クエリを標本上で評価し，実行順序を決める
+
+    Parameters
+    ----------
+    queries : List[DQQuery]
+    sample : Set[str]
+      標本の wiki_id
+    evaluate : (DQQuery, Set[str]) -> (Set[str], int)
+      クエリと対象の wiki_id を受け取り，通過した wiki_id と発行した質問数を返す関数
+    warmup : () -> any
+      計測の前に1度だけ呼ぶ関数．初回の評価だけが払う準備(モデルの読み込みなど)を
+      先頭のクエリのコストに含めないために用いる
+
+    Returns
+    -------
+    QueryPlan
+    """
+    if warmup is not None:
+        warmup()
+    estimates = []
+    for query in queries:
+        start = time.perf_counter()
+        passed, questions = evaluate(query, set(sample))
+        seconds = time.perf_counter() - start
+        estimates.append(QueryEstimate(query, len(sample), len(passed), questions, seconds))
+    return QueryPlan(estimates)
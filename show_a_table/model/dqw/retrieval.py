@@ -0,0 +1,195 @@
+import math
+from collections import Counter, OrderedDict
+
+
+def bigrams(text):
+    """
+    文字 bigram に分割する．分かち書きに依存しないので日本語でもそのまま使える
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    List[str]
+    """
+    text = "".join(text.split())
+    if len(text) < 2:
+        return [text] if text else []
+    return [text[i:i+2] for i in range(len(text) - 1)]
+
+
+def windows(text, size=400, stride=200):
+    """
+    長い文章を重なりのある窓に分割する
+
+    Parameters
+    ----------
+    text : str
+    size : int
+      窓の文字数
+    stride : int
+      窓をずらす文字数
+
+    Returns
+    -------
+    List[str]
+    """
+    if len(text) <= size:
+        return [text]
+    ret = []
+    for start in range(0, len(text), stride):
+        ret.append(text[start:start+size])
+        if start + size >= len(text):
+            break
+    return ret
+
+
+class BM25Index:
+    """
+    段落(あるいは窓)を単位とした BM25 の統計量
+
+    文書頻度と平均長だけを保持し，各単位の語頻度は採点時に数える
+
+    Attributes
+    ----------
+    n_units : int
+    avgdl : float
+    df : Counter
+    """
+
+    def __init__(self, units, k1=1.2, b=0.75):
+        """
+        Parameters
+        ----------
+        units : Iterable[str]
+          カテゴリのコーパスの全段落
+        k1 : float
+        b : float
+        """
+        self.k1 = k1
+        self.b = b
+        self.df = Counter()
+        self.n_units = 0
+        total = 0
+        for unit in units:
+            toks = bigrams(unit)
+            self.df.update(set(toks))
+            self.n_units += 1
+            total += len(toks)
+        self.avgdl = total / self.n_units if self.n_units else 0.0
+
+    def idf(self, term):
+        df = self.df.get(term, 0)
+        return math.log(1 + (self.n_units - df + 0.5) / (df + 0.5))
+
+    def score(self, query_terms, unit):
+        """
+        Parameters
+        ----------
+        query_terms : List[str]
+        unit : str
+
+        Returns
+        -------
+        float
+        """
+        toks = bigrams(unit)
+        if not toks:
+            return 0.0
+        tf = Counter(toks)
+        norm = self.k1 * (1 - self.b + self.b * len(toks) / (self.avgdl or 1.0))
+        return sum(self.idf(t) * tf[t] * (self.k1 + 1) / (tf[t] + norm)
+                   for t in set(query_terms) if t in tf)
+
+
+def query_terms(question, title, attr):
+    """
+    質問文から記事タイトルを除き，属性名を加えたものを検索語とする
+
+    タイトルはその記事のほぼ全段落に現れるので順位付けの役に立たない
+    """
+    return bigrams(question.replace(title, "") + attr)
+
+
+def top_k(index, questions, k, attr=""):
+    """
+    記事ごとに BM25 の上位 k 段落の質問だけを残す
+
+    Parameters
+    ----------
+    index : BM25Index
+    questions : [(str, str, str, str)]
+      context, query, title, wiki_id
+    k : int
+    attr : str
+      検索語に加える属性名
+
+    Returns
+    -------
+    [(str, str, str, str)]
+      元の順序を保った質問の部分列
+    """
+    articles = OrderedDict()
+    for idx, q in enumerate(questions):
+        articles.setdefault(q[3], []).append(idx)
+    keep = set()
+    for idxs in articles.values():
+        if len(idxs) <= k:
+            keep.update(idxs)
+            continue
+        _, question, title, _ = questions[idxs[0]]
+        terms = query_terms(question, title, attr)
+        ranked = sorted(idxs, key=lambda i: -index.score(terms, questions[i][0]))
+        keep.update(ranked[:k])
+    return [q for idx, q in enumerate(questions) if idx in keep]
+
+
+def split_windows(questions, size=400, stride=200):
+    """
+    文脈を窓に分割した質問に展開する．記事全文を文脈とする場合に用いる
+
+    Parameters
+    ----------
+    questions : [(str, str, str, str)]
+
+    Returns
+    -------
+    [(str, str, str, str)]
+    """
+    return [(win, q, title, wid) for ctx, q, title, wid in questions
+            for win in windows(ctx, size, stride)]
+
+
+def recall_report(index, questions, passed, ks=(1, 2, 3, 5), attr=""):
+    """
+    k ごとに，全段落を読んだときに通過した記事のうち上位 k 段落だけで通過できる割合を求める
+
+    Parameters
+    ----------
+    index : BM25Index
+    questions : [(str, str, str, str)]
+      全段落の質問
+    passed : [((str, str, str, str), str)]
+      全段落を読解モデルに渡した結果，通過した質問と回答
+    ks : Iterable[int]
+    attr : str
+
+    Returns
+    -------
+    {int: {"recall": float, "kept": float}}
+      recall は記事単位の再現率，kept は読解モデルに渡す質問の割合
+    """
+    gold = {}
+    for q, _ in passed:
+        gold.setdefault(q[3], set()).add(q[0])
+    report = {}
+    for k in ks:
+        kept = top_k(index, questions, k, attr)
+        found = {q[3] for q in kept if q[0] in gold.get(q[3], ())}
+        report[k] = {
+            "recall": len(found) / len(gold) if gold else 1.0,
+            "kept": len(kept) / len(questions) if questions else 1.0,
+        }
+    return report
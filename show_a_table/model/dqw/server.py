@@ -0,0 +1,211 @@
+"""
+1つの読解モデルを複数のプロセスで共有するための推論サーバ
+
+    python -m show_a_table.model.dqw.server --port=8765
+    DQW_BACKEND=remote DQW_SERVER=http://127.0.0.1:8765 python ...
+
+同時に届いた `predict_batch` 要求は `max_wait` 秒まで待ってまとめ，1回の推論で処理する．
+"""
+import json
+import queue
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import fire
+
+
+class _Request:
+    def __init__(self, batch, top_n):
+        self.batch = batch
+        self.top_n = top_n
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class Coalescer:
+    """
+    複数の呼び出し元からの要求をまとめて Backend に渡す
+
+    Attributes
+    ----------
+    backend : Backend
+    max_batch : int
+      1回の推論でまとめる最大質問数
+    max_wait : float
+      最初の要求が届いてから他の要求を待つ最大秒数
+    calls : int
+      Backend を呼んだ回数
+    requests : int
+      受け付けた要求の数
+    """
+
+    def __init__(self, backend, max_batch=64, max_wait=0.01):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.calls = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._loop, name="coalescer", daemon=True)
+        self._worker.start()
+
+    def predict_batch(self, batch, top_n=1):
+        """
+        他の要求とまとめて推論する．結果が出るまで戻らない
+
+        Parameters
+        ----------
+        batch : [(str, str)]
+        top_n : int
+
+        Returns
+        -------
+        [[({"text": str}, float)]]
+        """
+        req = _Request(batch, top_n)
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.results
+
+    def _gather(self):
+        reqs = [self._queue.get()]
+        if reqs[0] is None:
+            return None
+        size = len(reqs[0].batch)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if req is None:
+                self._queue.put(None)
+                break
+            reqs.append(req)
+            size += len(req.batch)
+        return reqs
+
+    def _loop(self):
+        while True:
+            reqs = self._gather()
+            if reqs is None:
+                return
+            self.requests += len(reqs)
+            # top_n が異なる要求は別々に推論する
+            groups = {}
+            for req in reqs:
+                groups.setdefault(req.top_n, []).append(req)
+            for top_n, group in groups.items():
+                pairs = [pair for req in group for pair in req.batch]
+                try:
+                    results = self.backend.predict_batch(pairs, top_n=top_n)
+                    self.calls += 1
+                except Exception as e:
+                    for req in group:
+                        req.error = e
+                        req.done.set()
+                    continue
+                start = 0
+                for req in group:
+                    req.results = results[start:start+len(req.batch)]
+                    start += len(req.batch)
+                    req.done.set()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _send(self, code, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send(404, {"error": "not found"})
+            return
+        co = self.server.coalescer
+        self._send(200, {"requests": co.requests, "calls": co.calls})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            req = json.loads(self.rfile.read(length).decode("utf-8"))
+            batch = [tuple(pair) for pair in req["batch"]]
+            results = self.server.coalescer.predict_batch(batch, top_n=req.get("top_n", 1))
+        except Exception as e:
+            print(e, file=sys.stderr)
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, {"results": results})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class InferenceServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    `Coalescer` を HTTP で公開するサーバ
+
+    POST /predict に {"batch": [[文脈, 質問文], ...], "top_n": 1} を送ると
+    {"results": predict_batch の結果} が返る．GET /health は処理件数を返す
+    """
+    daemon_threads = True
+
+    def __init__(self, backend, host="127.0.0.1", port=8765, max_batch=64, max_wait=0.01):
+        super().__init__((host, port), _Handler)
+        self.coalescer = Coalescer(backend, max_batch=max_batch, max_wait=max_wait)
+
+    def server_close(self):
+        super().server_close()
+        self.coalescer.close()
+
+
+def serve(host="127.0.0.1", port=8765, backend=None, device=None, max_batch=64, max_wait=0.01):
+    """
+    Parameters
+    ----------
+    host : str
+    port : int
+    backend : str
+      "drqa" あるいは "stub"．未指定時は dqwrapper の既定
+    device : str
+    max_batch : int
+    max_wait : float
+    """
+    from . import dqwrapper
+    dqwrapper.configure(device=device, backend=backend)
+    predictor = dqwrapper._get_predictor()
+    predictor.load()
+    server = InferenceServer(predictor, host, port, max_batch=max_batch, max_wait=max_wait)
+    print(f"serving on http://{host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    fire.Fire(serve)
@@ -0,0 +1,324 @@
+"""
+`dqwrapper.run` を記事の分割(シャード)ごとに並列実行する
+
+1台で動かす場合は `run_sharded` を使う．読解モデルを読み込んでから fork するので，
+重みは copy-on-write で共有される．CUDA は fork と相性が悪いため CPU で推論する．
+トークナイザのプロセスプールは fork した子では動かないので，プールを持たないモデルを読み込む．
+回答キャッシュは子プロセスごとに開き直す．
+
+複数台で動かす場合は共有ディレクトリに `make_manifest` でシャードを書き出し，
+各マシンで同じ CategorySelector を組み立てて `run_manifest` を呼ぶ．
+未着手のシャードは rename で1つずつ確保するので，同じシャードを二重に処理することはない．
+確保したワーカーが落ちた場合は，同じマシンならばプロセスの有無で，
+他のマシンならば `timeout` 秒を過ぎたかどうかで判断して確保し直す．
+全て終わったら `merge_manifest` で結果をまとめる．
+"""
+import json
+import multiprocessing
+import os
+import socket
+import time
+from os import path
+
+from . import dqwrapper
+from .backend import DrQABackend
+from .cache import AnswerCache
+
+# fork した子プロセスに引き継ぐ状態．クエリは関数を含み pickle できないため
+_state = {}
+
+
+def make_shards(wids, n_shards):
+    """
+    Parameters
+    ----------
+    wids : List[str]
+    n_shards : int
+
+    Returns
+    -------
+    List[List[str]]
+      ほぼ同じ大きさの n_shards 個以下の分割
+    """
+    wids = list(wids)
+    n_shards = max(1, min(n_shards, len(wids)))
+    return [wids[i::n_shards] for i in range(n_shards)] if wids else []
+
+
+def merge(stores):
+    """
+    シャードごとの結果を1つにまとめる
+
+    Parameters
+    ----------
+    stores : Iterable[{str: {"title": str, "attrs": {str: [str]}}}]
+
+    Returns
+    -------
+    {str: {"title": str, "attrs": {str: [str]}}}
+    """
+    ret = {}
+    for store in stores:
+        ret.update(store)
+    return ret
+
+
+def _init_worker():
+    """
+    fork した子プロセスの初期化．読み込み済みのモデルを使い，回答キャッシュは開き直す
+    """
+    dqwrapper.set_backend(_state["predictor"])
+    cache = _state["kwargs"].get("cache")
+    if cache is not None:
+        # sqlite の接続は fork をまたいで使えない
+        _state["kwargs"] = dict(_state["kwargs"],
+                                cache=AnswerCache(cache.dbpath, max_entries=cache.max_entries))
+
+
+def _run_shard(idx):
+    return dqwrapper.run(_state["cs"], ids=_state["shards"][idx], **_state["kwargs"])
+
+
+def _fork_safe(predictor):
+    """
+    Returns
+    -------
+    Backend
+      fork した子で使える読解モデル．DrQA はトークナイザのプールを持たず，
+      CPU で推論するものを作り直す．CUDA は fork した子では初期化できない
+    """
+    if isinstance(predictor, DrQABackend) and \
+            (predictor.num_workers != 0 or predictor.device != "cpu"):
+        return DrQABackend(predictor.model, predictor.embedding_file, predictor.tokenizer,
+                           num_workers=0, device="cpu")
+    return predictor
+
+
+def _unsupported(kwargs):
+    """
+    Returns
+    -------
+    List[str]
+      子プロセスで実行すると失われる，あるいはまとめられない `dqwrapper.run` の引数
+    """
+    ret = []
+    # 見積りはシャードごとに行われ，所要時間や稼働状況は親に戻らない
+    if kwargs.get("plan") is True:
+        ret.append("plan")
+    if kwargs.get("stats") is not None:
+        ret.append("stats")
+    if kwargs.get("pipeline"):
+        ret.append("pipeline")
+    # ResultTable は `merge` で辞書としてまとめられない
+    if kwargs.get("table"):
+        ret.append("table")
+    return ret
+
+
+def run_sharded(cs, processes=None, n_shards=None, full=True, **kwargs):
+    """
+    Parameters
+    ----------
+    cs : CategorySelector
+      Query設定済みのもの．
+    processes : int
+      子プロセス数．未指定時は CPU 数
+    n_shards : int
+      分割数．未指定時は processes の4倍
+    full : bool = True
+      `dqwrapper.run` と同じ
+    kwargs
+      `dqwrapper.run` に渡す引数．plan=True，stats，pipeline，table は使えない
+
+    Returns
+    -------
+    {str: {"title": str, "attrs": {str: [str]}}} or [str]
+
+    Raises
+    ------
+    ValueError
+      子プロセスでは扱えない引数が指定された場合
+    """
+    unsupported = _unsupported(kwargs)
+    if unsupported:
+        raise ValueError(f"run_sharded does not support: {', '.join(unsupported)}")
+    processes = processes or os.cpu_count() or 1
+    shards = make_shards(dqwrapper.all_ids(cs), n_shards or processes * 4)
+    # 子プロセスで読み込まないよう，fork の前に読み込む
+    predictor = _fork_safe(dqwrapper._get_predictor())
+    predictor.load()
+    _state.update(cs=cs, shards=shards, kwargs=kwargs, predictor=predictor)
+    try:
+        with multiprocessing.get_context("fork").Pool(processes, initializer=_init_worker) as pool:
+            store = merge(pool.imap_unordered(_run_shard, range(len(shards))))
+    finally:
+        _state.clear()
+    if full:
+        return store
+    return [v["title"] for _, v in store.items()]
+
+
+def make_manifest(cs, dirname, n_shards):
+    """
+    シャードを作業待ちとして `dirname` に書き出す
+
+    Parameters
+    ----------
+    cs : CategorySelector
+    dirname : str
+      全マシンから見えるディレクトリ
+    n_shards : int
+
+    Returns
+    -------
+    int
+      書き出したシャード数
+    """
+    os.makedirs(dirname, exist_ok=True)
+    shards = make_shards(dqwrapper.all_ids(cs), n_shards)
+    with open(path.join(dirname, "manifest.json"), "w") as f:
+        json.dump({"category": cs.cat.name, "attrs": [q.attr for q in cs.queries],
+                   "shards": len(shards)}, f, ensure_ascii=False)
+    for idx, wids in enumerate(shards):
+        with open(path.join(dirname, f"{idx:05d}.todo"), "w") as f:
+            json.dump(wids, f, ensure_ascii=False)
+    return len(shards)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 他のユーザのプロセスとして存在する
+        return True
+    return True
+
+
+def _stale(dirname, fn, timeout=None):
+    """
+    `fn` が確保したワーカーの落ちた ".running.<host>-<pid>" かどうか
+
+    Parameters
+    ----------
+    timeout : float
+      最後の更新からこの秒数を過ぎた確保は，他のマシンのものでも放棄されたとみなす．None なら無期限
+    """
+    host, _, pid = fn.split(".running.", 1)[1].rpartition("-")
+    if host == socket.gethostname() and pid.isdigit() and not _alive(int(pid)):
+        return True
+    if timeout is None:
+        return False
+    try:
+        return time.time() - os.path.getmtime(path.join(dirname, fn)) > timeout
+    except OSError:
+        return False
+
+
+def _claim(dirname, timeout=None):
+    """
+    未着手のシャード，あるいは放棄されたシャードを1つ確保する
+
+    Parameters
+    ----------
+    timeout : float
+      `_stale` を参照
+
+    Returns
+    -------
+    (str, str, List[str]) or None
+      確保したファイル，シャード名，その wiki_id．残っていなければ None
+    """
+    owner = f"{socket.gethostname()}-{os.getpid()}"
+    fns = sorted(os.listdir(dirname))
+    stale = [fn for fn in fns if ".running." in fn and _stale(dirname, fn, timeout)]
+    for fn in [fn for fn in fns if fn.endswith(".todo")] + stale:
+        name = fn.split(".", 1)[0]
+        if path.exists(path.join(dirname, f"{name}.result.json")):
+            continue
+        running = path.join(dirname, f"{name}.running.{owner}")
+        try:
+            os.rename(path.join(dirname, fn), running)
+        except OSError:
+            # 他のワーカーが先に確保した
+            continue
+        # 確保した時刻を `timeout` の起点とする
+        os.utime(running)
+        with open(running) as f:
+            return running, name, json.load(f)
+    return None
+
+
+def run_manifest(cs, dirname, timeout=None, **kwargs):
+    """
+    `make_manifest` で書き出したシャードを無くなるまで処理する
+
+    Parameters
+    ----------
+    cs : CategorySelector
+      `make_manifest` に渡したものと同じクエリを設定したもの
+    dirname : str
+    timeout : float
+      確保からこの秒数を過ぎても終わらないシャードは，ワーカーが落ちたとみなして確保し直す．
+      シャード1つの処理時間より十分長くする．None ならば同じマシンのワーカーの生死だけを見る
+    kwargs
+      `dqwrapper.run` に渡す引数
+
+    Returns
+    -------
+    int
+      このワーカーが処理したシャード数
+    """
+    with open(path.join(dirname, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest["category"] != cs.cat.name or manifest["attrs"] != [q.attr for q in cs.queries]:
+        raise ValueError("manifest does not match the given CategorySelector")
+    done = 0
+    while True:
+        claimed = _claim(dirname, timeout)
+        if claimed is None:
+            return done
+        running, name, wids = claimed
+        store = dqwrapper.run(cs, ids=wids, **kwargs)
+        tmp = path.join(dirname, f"{name}.result.{socket.gethostname()}-{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(store, f, ensure_ascii=False)
+        os.rename(tmp, path.join(dirname, f"{name}.result.json"))
+        try:
+            os.remove(running)
+        except FileNotFoundError:
+            # 遅れている間に他のワーカーが確保し直した．結果は同じなので構わない
+            pass
+        done += 1
+
+
+def merge_manifest(dirname, full=True):
+    """
+    Parameters
+    ----------
+    dirname : str
+    full : bool = True
+
+    Returns
+    -------
+    {str: {"title": str, "attrs": {str: [str]}}} or [str]
+
+    Raises
+    ------
+    RuntimeError
+      未完了のシャードが残っている場合
+    """
+    with open(path.join(dirname, "manifest.json")) as f:
+        manifest = json.load(f)
+    results = sorted(fn for fn in os.listdir(dirname) if fn.endswith(".result.json"))
+    if len(results) != manifest["shards"]:
+        raise RuntimeError(f"{manifest['shards'] - len(results)} shards are not finished")
+    stores = []
+    for fn in results:
+        with open(path.join(dirname, fn)) as f:
+            stores.append(json.load(f))
+    store = merge(stores)
+    if full:
+        return store
+    return [v["title"] for _, v in store.items()]
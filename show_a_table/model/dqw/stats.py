@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows には無い
+    resource = None
+
+
+def _maxrss():
+    """
+    Returns
+    -------
+    int
+      プロセスの最大常駐メモリ(byte)．取得できなければ 0
+    """
+    if resource is None:
+        return 0
+    # Linux では KiB 単位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _Span:
+    def __init__(self, stats, name, args):
+        self.stats = stats
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats._finish(self, time.perf_counter(), time.process_time())
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_nospan = _NoSpan()
+
+
+class RunStats:
+    """
+    `dqwrapper.run` の段階ごとの所要時間，件数，メモリを集める
+
+    Attributes
+    ----------
+    stages : {str: {"wall": float, "cpu": float, "count": int}}
+      段階ごとの累計．cpu はプロセス全体の CPU 時間なので，スレッドを使う場合は目安
+    queries : List[dict]
+      クエリごとの対象記事数，質問数，回答数，通過数など
+    counters : {str: int}
+      バッチ数などの件数
+    peak_memory : int
+      プロセス開始以来の最大常駐メモリ(byte)．ru_maxrss は下がらないので run ごとの値ではない
+    base_memory : int
+      この RunStats を作った時点の `peak_memory`．差が run の間に増えた最大常駐メモリとなる
+    events : List[dict]
+      trace event 形式の記録
+    """
+
+    def __init__(self, trace=True):
+        """
+        Parameters
+        ----------
+        trace : bool
+          False ならば trace event を記録しない
+        """
+        self.stages = {}
+        self.queries = []
+        self.counters = {}
+        self.base_memory = _maxrss()
+        self.peak_memory = self.base_memory
+        self.events = []
+        self.trace = trace
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def stage(self, name, **args):
+        """
+        with 文で囲んだ区間を `name` の段階として計測する
+        """
+        return _Span(self, name, args)
+
+    def _finish(self, span, wall, cpu):
+        with self._lock:
+            st = self.stages.setdefault(span.name, {"wall": 0.0, "cpu": 0.0, "count": 0})
+            st["wall"] += wall - span.wall
+            st["cpu"] += cpu - span.cpu
+            st["count"] += 1
+            if self.trace:
+                self.events.append({
+                    "name": span.name, "cat": "dqwrapper", "ph": "X",
+                    "ts": (span.wall - self._origin) * 1e6, "dur": (wall - span.wall) * 1e6,
+                    "pid": os.getpid(), "tid": threading.get_ident(), "args": span.args,
+                })
+            self.peak_memory = max(self.peak_memory, _maxrss())
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_query(self, qg, candidates, passed, survivors):
+        """
+        クエリ1つ分の結果を記録する
+
+        Parameters
+        ----------
+        qg : DQQuery
+        candidates : int or None
+          適用前の記事数．None は全記事
+        passed : [((str, str, str, str), str)]
+          通過した回答
+        survivors : int
+          適用後の記事数
+        """
+        self.queries.append({
+            "attr": qg.attr,
+            "priority": qg.priori.name,
+            "candidates": candidates,
+            "passed_answers": len(passed),
+            "survivors": survivors,
+            "ctx_checked": qg.ctx_checked,
+            "ctx_skipped": qg.ctx_skipped,
+        })
+
+    def as_dict(self):
+        return {
+            "stages": self.stages,
+            "queries": self.queries,
+            "counters": self.counters,
+            "peak_memory": self.peak_memory,
+            "base_memory": self.base_memory,
+        }
+
+    def trace_events(self, fn=None):
+        """
+        chrome://tracing や Perfetto で読める形式にする
+
+        Parameters
+        ----------
+        fn : str
+          指定された場合は JSON として書き出す
+
+        Returns
+        -------
+        {"traceEvents": List[dict]}
+        """
+        obj = {"traceEvents": list(self.events)}
+        if fn:
+            with open(fn, "w") as f:
+                json.dump(obj, f, ensure_ascii=False)
+        return obj
+
+    def __str__(self):
+        lines = ["{:<12} {:>10} {:>10} {:>8}".format("stage", "wall[s]", "cpu[s]", "count")]
+        for name, st in self.stages.items():
+            lines.append("{:<12} {:>10.3f} {:>10.3f} {:>8}".format(
+                name, st["wall"], st["cpu"], st["count"]))
+        for q in self.queries:
+            lines.append("query {attr}: {candidates} -> {survivors} articles, "
+                         "{passed_answers} answers passed, "
+                         "{ctx_skipped} contexts skipped".format(**q))
+        lines.append("peak memory: {:.1f} MiB (+{:.1f} MiB during run)".format(
+            self.peak_memory / 2**20, (self.peak_memory - self.base_memory) / 2**20))
+        return "\n".join(lines)
+
+
+def stage(stats, name, **args):
+    """
+    stats が None でも使える `RunStats.stage`
+    """
+    return stats.stage(name, **args) if stats is not None else _nospan
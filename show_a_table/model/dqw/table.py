@@ -0,0 +1,218 @@
+import csv
+import json
+
+
+# 1バイトの値から立っているビットの位置への対応
+_byte_positions = [tuple(i for i in range(8) if b >> i & 1) for b in range(256)]
+
+
+def _popcount(bits):
+    return bin(bits).count("1")
+
+
+def _from_positions(positions):
+    """
+    位置の集まりからビット列を作る
+
+    ビットを1つずつ `|=` すると毎回ビット列全体の長さの int を作り直すので，
+    bytearray に立ててから1度で int にする
+
+    Parameters
+    ----------
+    positions : Iterable[int]
+
+    Returns
+    -------
+    int
+    """
+    positions = list(positions)
+    if not positions:
+        return 0
+    buf = bytearray(max(positions) // 8 + 1)
+    for pos in positions:
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _positions(bits):
+    """
+    Yields
+    ------
+    int
+      `bits` の立っている位置を小さい順に
+    """
+    buf = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for i, b in enumerate(buf):
+        if b:
+            base = i << 3
+            for j in _byte_positions[b]:
+                yield base + j
+
+
+class ResultTable:
+    """
+    `run` の結果を列指向で保持する表
+
+    wiki_id は出現順に整数の位置へ割り当て，生き残っている記事の集合はその位置のビット列で表す．
+    クエリの適用はビット列の AND になり，属性ごとの回答は位置をキーとした列に持つ．
+    タイトルや属性名を記事ごとに重複して持たないので，`dict` による store より小さく済む．
+
+    Attributes
+    ----------
+    wids : List[str]
+      位置から wiki_id への対応
+    titles : List[str]
+      位置からタイトルへの対応
+    alive : int
+      生き残っている記事の位置のビット列
+    columns : {str: {int: List[str]}}
+      属性ごとの，位置から回答への対応
+    started : bool
+      一度でもクエリを適用したか．適用前の表は全記事を意味する
+    """
+
+    def __init__(self):
+        self.wids = []
+        self.titles = []
+        self._pos = {}
+        self.alive = 0
+        self.columns = {}
+        self.started = False
+
+    def intern(self, wid, title=""):
+        """
+        Parameters
+        ----------
+        wid : str
+        title : str
+
+        Returns
+        -------
+        int
+          wid の位置
+        """
+        pos = self._pos.get(wid)
+        if pos is None:
+            pos = self._pos[wid] = len(self.wids)
+            self.wids.append(wid)
+            self.titles.append(title)
+        elif title and not self.titles[pos]:
+            self.titles[pos] = title
+        return pos
+
+    def ids(self):
+        """
+        Returns
+        -------
+        Set[str] or None
+          生き残っている wiki_id．クエリ適用前ならば None(全記事)
+        """
+        if not self.started:
+            return None
+        return set(self)
+
+    def restrict(self, wids):
+        """
+        対象を `wids` に限る
+
+        Parameters
+        ----------
+        wids : Iterable[str]
+
+        Returns
+        -------
+        ResultTable
+          self
+        """
+        bits = _from_positions(self.intern(wid) for wid in wids)
+        self.alive = self.alive & bits if self.started else bits
+        self.started = True
+        return self
+
+    def update(self, attr, passed):
+        """
+        クエリ1つ分の結果を加え，それを通過しなかった記事を落とす
+
+        Parameters
+        ----------
+        attr : str
+        passed : [((str, str, str, str), str)]
+          質問と通過した回答の組
+
+        Returns
+        -------
+        ResultTable
+          self
+        """
+        col = self.columns.setdefault(attr, {})
+        positions = []
+        for question, answer in passed:
+            pos = self.intern(question[3], question[2])
+            col.setdefault(pos, []).append(answer)
+            positions.append(pos)
+        bits = _from_positions(positions)
+        self.alive = self.alive & bits if self.started else bits
+        self.started = True
+        return self
+
+    def __len__(self):
+        return _popcount(self.alive)
+
+    def __iter__(self):
+        """生き残っている wiki_id を位置の順に返す"""
+        for pos in _positions(self.alive):
+            yield self.wids[pos]
+
+    def __contains__(self, wid):
+        pos = self._pos.get(wid)
+        return pos is not None and bool(self.alive >> pos & 1)
+
+    def rows(self):
+        """
+        Yields
+        ------
+        (str, str, {str: List[str]})
+          生き残っている記事の wiki_id，タイトル，属性ごとの回答
+        """
+        for wid in self:
+            pos = self._pos[wid]
+            yield wid, self.titles[pos], {attr: col[pos] for attr, col in self.columns.items()
+                                          if pos in col}
+
+    def to_store(self):
+        """
+        Returns
+        -------
+        {str: {"title": str, "attrs": {str: [str]}}}
+          `run` の既定の戻り値と同じ形
+        """
+        return {wid: {"title": title, "attrs": attrs} for wid, title, attrs in self.rows()}
+
+    def export_csv(self, f, sep="|"):
+        """
+        1行ずつ CSV に書き出す．1列目が wiki_id，2列目がタイトル，以降が属性
+
+        Parameters
+        ----------
+        f : file
+        sep : str
+          1つの属性に複数の回答がある場合の区切り
+        """
+        attrs = list(self.columns.keys())
+        writer = csv.writer(f)
+        writer.writerow(["wiki_id", "title"] + attrs)
+        for wid, title, values in self.rows():
+            writer.writerow([wid, title] + [sep.join(values.get(a, [])) for a in attrs])
+
+    def export_jsonl(self, f):
+        """
+        1記事1行の JSON として書き出す
+
+        Parameters
+        ----------
+        f : file
+        """
+        for wid, title, attrs in self.rows():
+            f.write(json.dumps({"wiki_id": wid, "title": title, "attrs": attrs},
+                               ensure_ascii=False))
+            f.write("\n")
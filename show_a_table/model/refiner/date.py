@@ -1,96 +1,180 @@
 import datetime
 import re
 import sys
+from bisect import bisect_left, bisect_right
 
-from dateutil.parser import parse as datetime_parser
-from dateutil.parser._parser import ParserError
-from japanera import Japanera
-
+from .date_normalizer import DateNormalizer
 from .refiner import (Candidate, Candidates, DQQuery, FunQuery, NumCandidates,
                       Refiner)
 
-_td1 = str.maketrans("０１２３４５６７８９（）", "0123456789()")
-_td2 = str.maketrans("年月日", "---")
+# `_preprocess_date` が解釈できる回答は必ず数字，漢数字，「元(年)」のいずれかを含む
+_ctx_filter = re.compile(r"[0-9０-９元〇一二三四五六七八九十百千万]")
+_normalizer = DateNormalizer()
 
 
-def _from_mtgrp_to_str(gs, wy: int, y: int, fy: int, wmd: int, wd: int, m: int, d: int):
+def _preprocess_date(result):
     """
-    マッチオブジェクトのグループリストから結果を返す
-
     Parameters
     ----------
-    gs : [str]
-      マッチ結果のグループリスト
-    wy : int
-      年を示す位置番号
-    y : int
-      年の数値を示す位置番号
-    fy : int
-      年のフィルサイズ(2 or 4 と思われ)
-    wmd : int
-      月日全体の位置番号
-    wd : int
-      日全体の位置番号
-    m : int
-      月を示す位置番号
-    d : int
-      日を示す位置番号
+    result : str
+      実行結果．日付けらしいことを求める
 
     Returns
     -------
-    datestr : str
-      yyyy年mm月dd日 あるいは 元号XX年mm月dd日形式の文字列
+    date
+      result を datetime の date として表現したもの
     """
-    return "{year}{month}{day}".format(
-        year=gs[wy].replace(gs[y], gs[y].zfill(fy)) if gs[y] else gs[wy],
-        month=(gs[wmd].replace(gs[wd], "")
-               if gs[wd] else gs[wmd]).replace(gs[m], gs[m].zfill(2)) if gs[wmd] else "",
-        day=gs[wd].replace(gs[d], gs[d].zfill(2)) if gs[wd] else ""
-    )
+    return _normalizer.normalize(result)
 
 
-def _preprocess_date(result):
+def _date_exam(check, errors=RuntimeError):
     """
     Parameters
     ----------
-    result : str
-      実行結果．日付けらしいことを求める
+    check : date -> bool
+    errors : type
+      変換に失敗したものとして扱う例外
 
     Returns
     -------
-    date
-      result を datetime の date として表現したもの
+    str -> bool
+      回答を日付に直して `check` に掛ける関数
     """
-    result = result.translate(_td1)
-    mmdd = r'((\d{1,2})月((\d{1,2})日)?)?'
-    eraname = r'(天平)?[^\d]{2}((\d{1,2})|元)年?'
-    years = r'(\d{1,4})年?'
-    mt = re.match(r'({})(\({}\))?'.format(years, eraname)+mmdd, result)
-    if mt:
-        result = _from_mtgrp_to_str(mt.groups(), 0, 1, 4, 6, 8, 7, 9).translate(_td2)
+    def exam(result):
         try:
-            if result.endswith("-"):
-                date = datetime_parser(result[:-1]).date()
-            else:
-                date = datetime_parser(result).date()
-            return date
-        except ParserError as e:
+            res_date = _preprocess_date(result)
+        except errors as e:
             print(e, file=sys.stderr)
-            raise RuntimeError("Cannot parser as date '{}'".format(result)) from e
-    mt = re.match(r'({})(\({}\))?'.format(eraname, years)+mmdd, result)
-    if mt:
-        result = _from_mtgrp_to_str(mt.groups(), 0, 3, 2, 6, 8, 7, 9)
-    mt = re.match(r'\(({})\){}'.format(eraname, mmdd), result)
-    if mt:
-        result = _from_mtgrp_to_str(mt.groups(), 0, 3, 2, 4, 6, 5, 7)
-    jn = Japanera()
-    fmt = "%-E%-kO年"
-    fmt += "%m月%d日" if "月" in result and "日" in result else "%m月" if "月" in result else ""
-    res = jn.strptime(result, fmt)
-    if res:
-        return res[0].date()
-    else:
-        raise RuntimeError("Cannot parse as date '{}' by '{}'".format(result, fmt))
+            return False
+        return bool(check(res_date))
+    return exam
+
+
+def _date_exam_batch(check):
+    """
+    Returns
+    -------
+    List[str] -> List[bool]
+      `_date_exam` を複数の回答にまとめて適用する関数
+    """
+    def exam_batch(results):
+        return [d is not None and bool(check(d)) for d in _normalizer.normalize_many(results)]
+    return exam_batch
+
+
+def _parse_expression(expr):
+    """
+    Parameters
+    ----------
+    expr : str
+      `JustOneDateRefiner.expression` の形式．BCE で始まれば紀元前
+
+    Returns
+    -------
+    [int or None, int or None, int or None]
+      年，月，日．年は天文学で使われる紀元前1年を0とする数え方．"*" は None
+    """
+    bce = expr.startswith("BCE")
+    ymd = [int(c) if c.isdigit() else None for c in (expr[3:] if bce else expr).split("-")]
+    if bce and ymd[0] is not None:
+        ymd[0] = -(ymd[0] - 1)
+    return ymd
+
+
+def day_key(year, month, day):
+    """
+    年月日を大小関係を保ったまま整数にする．月日は暦の上で正しくなくともよい
+    """
+    return (year * 13 + month) * 32 + day
+
+
+def _full_key(date):
+    return (date.year * 13 + date.month) * 32 + date.day
+
+
+def _md_key(date):
+    return date.month * 32 + date.day
+
+
+def _d_key(date):
+    return date.day
+
+
+class DateSpan:
+    """
+    開始と終了の日付け(ワイルドカードを含む)を整数の閉区間の集まりにしたもの
+
+    年が指定されていれば年月日を `day_key` で，両端とも年が無ければ毎年の月日を，
+    月も無ければ日だけを整数にして比べる．指定されていない月日は区間が最も広くなるよう補う．
+    区間は整列済みの列の二分探索にも使える
+
+    Attributes
+    ----------
+    key : date -> int
+      日付けを区間と比べる整数にする関数
+    intervals : List[(int, int)]
+      区間の下端と上端．いずれも含む
+    """
+
+    def __init__(self, start, end):
+        """
+        Parameters
+        ----------
+        start : str
+        end : str
+          `JustOneDateRefiner.expression` の形式
+        """
+        (sy, sm, sd), (ey, em, ed) = _parse_expression(start), _parse_expression(end)
+        inf = float("inf")
+        if sy is not None or ey is not None:
+            self.key = _full_key
+            lo = day_key(sy, sm or 1, sd or 1) if sy is not None else -inf
+            hi = day_key(ey, em or 12, ed or 31) if ey is not None else inf
+        elif sm is not None or em is not None:
+            self.key = _md_key
+            lo = (sm or 1) * 32 + (sd or 1)
+            hi = (em or 12) * 32 + (ed or 31)
+        else:
+            self.key = _d_key
+            lo, hi = sd or 1, ed or 31
+        if lo <= hi:
+            self.intervals = [(lo, hi)]
+        elif self.key is _full_key:
+            self.intervals = []
+        else:
+            # 11月から2月のように年を跨ぐ
+            self.intervals = [(lo, inf), (-inf, hi)]
+
+    def match(self, date):
+        """
+        Parameters
+        ----------
+        date : datetime.date
+
+        Returns
+        -------
+        bool
+          date が区間のいずれかに含まれるか
+        """
+        k = self.key(date)
+        for lo, hi in self.intervals:
+            if lo <= k <= hi:
+                return True
+        return False
+
+    def scan(self, keys):
+        """
+        Parameters
+        ----------
+        keys : List[int]
+          `key` で整数にした日付けを昇順に並べたもの
+
+        Returns
+        -------
+        List[(int, int)]
+          区間に含まれる要素の添字の範囲 [i, j)
+        """
+        return [(bisect_left(keys, lo), bisect_right(keys, hi)) for lo, hi in self.intervals]
 
 
 class DateRefiner(Refiner):
@@ -116,6 +200,8 @@ class DateRangeRefiner(Refiner):
         self._sref = None
         self._end = None
         self._eref = None
+        # 範囲が確定すると DateSpan が入る
+        self.span = None
 
     def refine(self, choice):
         if not self._sref:
@@ -138,72 +224,20 @@ class DateRangeRefiner(Refiner):
             ret = self._eref.refine(choice)
             if isinstance(ret, DQQuery):
                 self._end = self._eref.expression()
-                return FunQuery(self._mk_exam(),
-                                lambda tgt: "{tgt}の{attr}は?".format(tgt=tgt, attr=self.attr))
+                check = self._mk_check()
+                return FunQuery(_date_exam(check),
+                                lambda tgt: "{tgt}の{attr}は?".format(tgt=tgt, attr=self.attr),
+                                ctx_filter=_ctx_filter, refine_batch=_date_exam_batch(check))
             else:
                 ret.title = "終了" + ret.title
                 return ret
 
     def _mk_exam(self):
-        # 天文学などで使われる単位に変換
-        if self._start.startswith("BCE"):
-            start = self._start = [int(c) if c.isdigit() else None for c in self._start.split("-")]
-            start[0] = -(start[0]-1)
-        else:
-            start = self._start = [int(c) if c.isdigit() else None for c in self._start.split("-")]
-        if self._end.startswith("BCE"):
-            end = self._start = [int(c) if c.isdigit() else None for c in self._end.split("-")]
-            end[0] = -(end[0]-1)
-        else:
-            end = self._start = [int(c) if c.isdigit() else None for c in self._end.split("-")]
-        _s = start
-        _e = end
-
-        def both(idx):
-            return _s[idx] and _e[idx]
+        return _date_exam(self._mk_check())
 
-        def flgs(idx, item):
-            # item, is in range, equal to start, queal to end, greater than start, smaller than end
-            if not both(idx):
-                return (item, False, False, False, False, False)
-            else:
-                return (item, _s[idx] < item < _e[idx], _s[idx] == item, _e[idx] == item,
-                        _s[idx] <= item, _e[idx] >= item)
-
-        def exam(result):
-            res_date = None
-            try:
-                res_date = _preprocess_date(result)
-            except RuntimeError as e:
-                print(e, file=sys.stderr)
-            if not res_date:
-                return False
-            y = flgs(0, res_date.year)
-            m = flgs(1, res_date.month)
-            d = flgs(2, res_date.day)
-            return any([
-                # Year-Month-Day
-                both(0) and any([y[1],
-                                 y[2] and y[5] and any([m[4],
-                                                        m[2] and m[3] and d[1],
-                                                        m[2] and m[5] and d[4]]),
-                                 y[4] and y[3] and any([m[5],
-                                                        m[2] and m[3] and d[1],
-                                                        m[4] and m[3] and d[5]]),
-                                 y[2] and y[3] and any([m[1],
-                                                        m[2] and m[5] and d[4],
-                                                        m[2] and m[3] and d[1],
-                                                        m[4] and m[3] and d[5]])]),
-                # Month-Day
-                both(1) and any([m[1],
-                                 m[2] and m[5] and d[4],
-                                 m[2] and m[3] and d[1],
-                                 m[4] and m[3] and d[5]]),
-                # Day
-                both(2) and d[1]
-            ])
-
-        return exam
+    def _mk_check(self):
+        self.span = DateSpan(self._start, self._end)
+        return self.span.match
 
 
 class JustOneDateRefiner(Refiner):
@@ -243,12 +277,10 @@ class JustOneDateRefiner(Refiner):
         self.bce = False
 
     def _solo_exam(self):
-        def exam(result):
-            try:
-                res_date = _preprocess_date(result)
-            except Exception as e:
-                print(e, file=sys.stderr)
-                return False
+        return _date_exam(self._solo_check(), errors=Exception)
+
+    def _solo_check(self):
+        def check(res_date):
             if all([self.year != "*",
                     self.month != "*",
                     self.day != "*"]):
@@ -260,7 +292,7 @@ class JustOneDateRefiner(Refiner):
                 return all([self.year == "*" or res_date.year == int(self.year),
                            self.month == "*" or res_date.month == int(self.month),
                            self.day == "*" or res_date.day == int(self.day)])
-        return exam
+        return check
 
     def refine(self, choice):
         """"""
@@ -309,7 +341,9 @@ class JustOneDateRefiner(Refiner):
         self.day = choice.ref
         if self._solo:
             return FunQuery(self._solo_exam(),
-                            lambda tgt: "{tgt}の{attr}は?".format(tgt=tgt, attr=self.attr))
+                            lambda tgt: "{tgt}の{attr}は?".format(tgt=tgt, attr=self.attr),
+                            ctx_filter=_ctx_filter,
+                            refine_batch=_date_exam_batch(self._solo_check()))
         else:
             # メッセージとして返す
             return DQQuery()
@@ -0,0 +1,233 @@
+"""
+読解モデルの回答を日付に変換する
+
+`date._preprocess_date` の実体．正規表現は事前にコンパイルし，元号は表を引いて西暦に直す．
+よく現れる yyyy年mm月dd日 と yyyy-mm-dd は正規表現1回で変換し，
+それ以外も回答の文字列ごとに結果を覚えておく．
+"""
+import calendar
+import datetime
+import re
+from functools import lru_cache
+
+from dateutil.parser import parse as datetime_parser
+from dateutil.parser._parser import ParserError
+from japanera import Japanera
+# japanera が内部で用いているものと同じ関数で漢数字を変換する
+from japanera.japanera import kanji2int
+
+_td1 = str.maketrans("０１２３４５６７８９（）", "0123456789()")
+_td2 = str.maketrans("年月日", "---")
+
+_mmdd = r'((\d{1,2})月((\d{1,2})日)?)?'
+_eraname = r'(天平)?[^\d]{2}((\d{1,2})|元)年?'
+_years = r'(\d{1,4})年?'
+_western = re.compile(r'({})(\({}\))?'.format(_years, _eraname) + _mmdd)
+_era_first = re.compile(r'({})(\({}\))?'.format(_eraname, _years) + _mmdd)
+_era_paren = re.compile(r'\(({})\){}'.format(_eraname, _mmdd))
+_ymd_kanji = re.compile(r'(\d{4})年(\d{1,2})月(\d{1,2})日')
+_ymd_iso = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})(?!\d)')
+_kanji_num = re.compile("[一二三四五六七八九十百千万億兆京垓𥝱]+")
+
+# Japanera.strptime の "%-E%-kO年" 以降に相当する．%y は2桁，%m と %d は time.strptime と同じ
+_era_formats = {
+    "": ("%-E%-kO年", re.compile(r"(?P<y>\d\d)年", re.IGNORECASE)),
+    "m": ("%-E%-kO年%m月", re.compile(r"(?P<y>\d\d)年(?P<m>1[0-2]|0[1-9]|[1-9])月", re.IGNORECASE)),
+    "md": ("%-E%-kO年%m月%d日",
+           re.compile(r"(?P<y>\d\d)年(?P<m>1[0-2]|0[1-9]|[1-9])月"
+                      r"(?P<d>3[01]|[12]\d|0[1-9]|[1-9]| [1-9])日", re.IGNORECASE)),
+}
+
+
+def _era_table():
+    """
+    Returns
+    -------
+    {str: List[int]}
+      元号から元年の西暦への対応．同名の元号は Japanera.strptime が試す順に並べる．
+      名前の無い期間は Japanera にならい「不明」とする
+    """
+    table = {}
+    eras = Japanera.era_common + Japanera.era_jimyouin + Japanera.era_daikakuji
+    for era in eras + [Japanera.christ_ad]:
+        table.setdefault(era.kanji or "不明", []).append(era.start.year)
+    return table
+
+
+_eras = _era_table()
+_era_lengths = sorted({len(k) for k in _eras})
+
+
+def _from_mtgrp_to_str(gs, wy: int, y: int, fy: int, wmd: int, wd: int, m: int, d: int):
+    """
+    マッチオブジェクトのグループリストから結果を返す
+
+    Parameters
+    ----------
+    gs : [str]
+      マッチ結果のグループリスト
+    wy : int
+      年を示す位置番号
+    y : int
+      年の数値を示す位置番号
+    fy : int
+      年のフィルサイズ(2 or 4 と思われ)
+    wmd : int
+      月日全体の位置番号
+    wd : int
+      日全体の位置番号
+    m : int
+      月を示す位置番号
+    d : int
+      日を示す位置番号
+
+    Returns
+    -------
+    datestr : str
+      yyyy年mm月dd日 あるいは 元号XX年mm月dd日形式の文字列
+    """
+    return "{year}{month}{day}".format(
+        year=gs[wy].replace(gs[y], gs[y].zfill(fy)) if gs[y] else gs[wy],
+        month=(gs[wmd].replace(gs[wd], "")
+               if gs[wd] else gs[wmd]).replace(gs[m], gs[m].zfill(2)) if gs[wmd] else "",
+        day=gs[wd].replace(gs[d], gs[d].zfill(2)) if gs[wd] else ""
+    )
+
+
+class DateNormalizer:
+    """
+    回答の文字列を `datetime.date` に変換する
+
+    月や日を含まない回答は dateutil と同じく今日の月日で補う．
+    そのため覚えた結果は日付が変わると捨てる
+    """
+
+    def __init__(self, maxsize=65536):
+        """
+        Parameters
+        ----------
+        maxsize : int
+          覚えておく回答の数
+        """
+        self._today = datetime.date.today()
+        self._memo = lru_cache(maxsize=maxsize)(self._normalize)
+
+    def normalize(self, result):
+        """
+        Parameters
+        ----------
+        result : str
+          実行結果．日付けらしいことを求める
+
+        Returns
+        -------
+        date
+          result を datetime の date として表現したもの
+
+        Raises
+        ------
+        RuntimeError
+          日付として解釈できない場合
+        """
+        today = datetime.date.today()
+        if today != self._today:
+            self._memo.cache_clear()
+            self._today = today
+        res = self._memo(result)
+        if isinstance(res, str):
+            raise RuntimeError(res)
+        return res
+
+    def normalize_many(self, results):
+        """
+        Parameters
+        ----------
+        results : Iterable[str]
+
+        Returns
+        -------
+        List[date or None]
+          解釈できなかった回答は None
+        """
+        ret = []
+        for result in results:
+            try:
+                ret.append(self.normalize(result))
+            except RuntimeError:
+                ret.append(None)
+        return ret
+
+    def cache_info(self):
+        return self._memo.cache_info()
+
+    def _normalize(self, result):
+        """
+        Returns
+        -------
+        date or str
+          解釈できなかった場合はその理由
+        """
+        result = result.translate(_td1)
+        mt = _ymd_kanji.match(result) or _ymd_iso.match(result)
+        if mt:
+            return self._date(*mt.groups())
+        mt = _western.match(result)
+        if mt:
+            return self._western(mt.groups())
+        return self._era(result)
+
+    def _date(self, year, month, day, text=None):
+        try:
+            return datetime.date(int(year), int(month), int(day))
+        except ValueError:
+            if text is None:
+                text = "{}-{}-{}-".format(year, month.zfill(2), day.zfill(2))
+            return "Cannot parser as date '{}'".format(text)
+
+    def _western(self, gs):
+        text = _from_mtgrp_to_str(gs, 0, 1, 4, 6, 8, 7, 9).translate(_td2)
+        year, month, day = int(gs[1]), gs[7], gs[9]
+        if month and day and gs[0].endswith("年"):
+            return self._date(year, month, day, text)
+        # 3桁以下の年や年の無い月を dateutil は別の意味に取るので，そのまま任せる
+        if year >= 100 and (not month or gs[0].endswith("年")):
+            month = int(month) if month else self._today.month
+            if not 1 <= month <= 12:
+                return "Cannot parser as date '{}'".format(text)
+            day = min(self._today.day, calendar.monthrange(year, month)[1])
+            return datetime.date(year, month, day)
+        try:
+            return datetime_parser(text[:-1] if text.endswith("-") else text).date()
+        except ParserError:
+            return "Cannot parser as date '{}'".format(text)
+
+    def _era(self, result):
+        mt = _era_first.match(result)
+        if mt:
+            result = _from_mtgrp_to_str(mt.groups(), 0, 3, 2, 6, 8, 7, 9)
+        mt = _era_paren.match(result)
+        if mt:
+            result = _from_mtgrp_to_str(mt.groups(), 0, 3, 2, 4, 6, 5, 7)
+        key = "md" if "月" in result and "日" in result else "m" if "月" in result else ""
+        fmt, pattern = _era_formats[key]
+        cands = [(result[:n], start) for n in _era_lengths for start in _eras.get(result[:n], ())]
+        if cands:
+            # Japanera.strptime と同じく「元」を1年とし，漢数字を2桁の数字に直す
+            kanjis = _kanji_num.findall(result)
+            nums = [str(kanji2int(k)).zfill(2) for k in kanjis]
+            text = result.replace("元", "01")
+            for k, i in zip(kanjis, nums):
+                text = text.replace(k, i)
+            for name, start in cands:
+                if not text.startswith(name):
+                    continue
+                mt = pattern.match(text, len(name))
+                if not mt or mt.end() != len(text):
+                    continue
+                gs = mt.groupdict()
+                try:
+                    return datetime.date(start + int(gs["y"]) - 1, int(gs.get("m") or 1),
+                                         int(gs.get("d") or 1))
+                except ValueError:
+                    continue
+        return "Cannot parse as date '{}' by '{}'".format(result, fmt)
@@ -4,6 +4,7 @@ import toml
 from SPARQLWrapper import JSON, SPARQLWrapper
 
 from .refiner import Candidate, FunQuery, KanaCandidates, Refiner
+from .sparql_cache import sparql_cache
 from .util import read_text
 
 
@@ -15,8 +16,7 @@ class GeoRefiner(Refiner):
             # "https://yago-knowledge.org/sparql/query"
         self._data = toml.loads(read_text(__file__, "geo.toml"))
         self._place = []
-        self._sparql = SPARQLWrapper(self._endpoint)
-        self._sparql.setReturnFormat(JSON)
+        self._cache = sparql_cache()
         self._buf = None
 
     def refine(self, choice=None):
@@ -31,8 +31,11 @@ class GeoRefiner(Refiner):
             self._place.append(choice.key)
             return self._other_place(choice)
         else:
+            # 回答に含まれるべき地名は文脈にも含まれていなければならない
             fq = FunQuery(self._make_exam(),
-                          lambda tgt: "{tgt}の{attr}は?".format(tgt=tgt, attr=self.attr))
+                          lambda tgt: "{tgt}の{attr}は?".format(tgt=tgt, attr=self.attr),
+                          ctx_filter=set(self._place[1:]) or None,
+                          refine_batch=self._make_exam_batch())
             print(self._place)
             return fq
 
@@ -48,6 +51,20 @@ class GeoRefiner(Refiner):
                 return all([place in result for place in needs])
         return exam
 
+    def _make_exam_batch(self):
+        def exam_batch(results):
+            if len(self._place) == 1:
+                raise NotImplementedError("国名のみの場合はまだ実装されていない")
+            # 地名ごとに残った回答だけを調べる
+            idxs = range(len(results))
+            for place in self._place[1:]:
+                idxs = [i for i in idxs if place in results[i]]
+            passed = [False] * len(results)
+            for i in idxs:
+                passed[i] = True
+            return passed
+        return exam_batch
+
     def _country(self):
         """
         国レベルの絞り込みを行う．
@@ -60,10 +77,7 @@ class GeoRefiner(Refiner):
         -------
         Candidates
         """
-        self._sparql.setQuery(self._data["countries"])
-        results = self._sparql.query().convert()
-        bindings = results["results"]["bindings"]
-        _list = [(row["s"]["value"], row["l"]["value"]) for row in bindings]
+        _list = self._select(self._data["countries"])
         country_cands = [Candidate(key=l, ref=s) for (s, l) in _list]
         return KanaCandidates(title="地名の選択/国の選択", cands=country_cands, parent=self)
 
@@ -79,11 +93,26 @@ class GeoRefiner(Refiner):
         place : Candidate
         """
         uri = place.ref
-        query = self._data["other_place"].format(uri)
-        self._sparql.setQuery(query)
-        results = self._sparql.query().convert()
-        bindings = results["results"]["bindings"]
-        _list = [(row["s"]["value"], row["l"]["value"]) for row in bindings]
+        _list = self._select(self._data["other_place"].format(uri))
         _cands = [Candidate(key=l, ref=s) for (s, l) in _list]
         _cands.append(Candidate(key="完了"))
         return KanaCandidates(title="地名の選択/国以下の選択", cands=_cands, parent=self)
+
+    def _select(self, query):
+        """
+        `query` の結果をキャッシュを通して得る
+
+        Returns
+        -------
+        List[Tuple[str, str]]
+          (主語，ラベル)のリスト
+        """
+        bindings = self._cache.get(query, self._fetch)
+        return [(row["s"]["value"], row["l"]["value"]) for row in bindings]
+
+    def _fetch(self, query):
+        # 裏で問い合わせ直すこともあるので，SPARQLWrapper は呼び出しごとに作る
+        sparql = SPARQLWrapper(self._endpoint)
+        sparql.setReturnFormat(JSON)
+        sparql.setQuery(query)
+        return sparql.query().convert()["results"]["bindings"]
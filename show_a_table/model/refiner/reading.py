@@ -0,0 +1,249 @@
+"""
+ラベルのカナ読みを求める
+
+読みはラベルをキーとしてメモリとディスク(sqlite)に覚えておくので，
+一度見たラベルの一覧から `make_n_dict` を作り直す際は辞書を引くだけで済む．
+変換器は pykakasi と MeCab(unidic) から選べ，プロセス内で1つを使い回す．
+未知のラベルが多い場合は複数のプロセスで変換する．
+"""
+import os
+import threading
+from functools import lru_cache
+from multiprocessing import Pool
+from os import environ
+
+from .sqlite_cache import SharedCache, connect
+
+_engine = environ.get("SHOW_A_TABLE_READING_ENGINE", None) or "kakasi"
+_workers = int(environ.get("SHOW_A_TABLE_READING_WORKERS", None) or os.cpu_count() or 1)
+# これ以上の未知のラベルがあればプロセスを分ける
+_pool_threshold = 2000
+_chunksize = 500
+
+# プロセスごとの変換器
+_converters = {}
+
+
+def _pykakasi():
+    if "pykakasi" not in _converters:
+        import pykakasi
+        _converters["pykakasi"] = pykakasi.kakasi()
+    return _converters["pykakasi"]
+
+
+def _kakasi():
+    kks = _pykakasi()
+
+    def convert(label):
+        return "".join(d["kana"] for d in kks.convert(label))
+    return convert
+
+
+def _mecab():
+    import MeCab
+    tagger = MeCab.Tagger()
+    kks = _converter("kakasi")
+
+    def token(line):
+        surface, _, feature = line.partition("\t")
+        fs = feature.split(",")
+        # unidic の kana 欄．未知語は欄が足りないので pykakasi で読む
+        if len(fs) > 20 and fs[20] not in ("", "*"):
+            return fs[20]
+        return kks(surface)
+
+    def convert(label):
+        lines = tagger.parse(label).splitlines()
+        return "".join(token(line) for line in lines if line and line != "EOS")
+    return convert
+
+
+_factories = {"kakasi": _kakasi, "mecab": _mecab}
+
+
+def _converter(engine):
+    """
+    Returns
+    -------
+    str -> str
+      ラベルをカタカナの読みにする関数．プロセス内で1つだけ作る
+    """
+    if engine not in _converters:
+        if engine not in _factories:
+            raise ValueError("Unknown reading engine '{}'".format(engine))
+        _converters[engine] = _factories[engine]()
+    return _converters[engine]
+
+
+@lru_cache(maxsize=65536)
+def romaji(kana):
+    """
+    Parameters
+    ----------
+    kana : str
+      カタカナの読み
+
+    Returns
+    -------
+    str
+      ヘボン式のローマ字(小文字)
+    """
+    return "".join(d["hepburn"] for d in _pykakasi().convert(kana)).lower()
+
+
+def _convert_chunk(args):
+    engine, labels = args
+    convert = _converter(engine)
+    return [convert(label) for label in labels]
+
+
+def convert_many(labels, engine="kakasi", workers=1):
+    """
+    キャッシュを通さずに読みを求める
+
+    Parameters
+    ----------
+    labels : List[str]
+    engine : str
+      "kakasi" あるいは "mecab"
+    workers : int
+      2 以上で `_pool_threshold` 件以上ならばプロセスを分ける
+
+    Returns
+    -------
+    List[str]
+      labels と同じ順の読み
+    """
+    labels = list(labels)
+    if workers <= 1 or len(labels) < _pool_threshold:
+        return _convert_chunk((engine, labels))
+    chunks = [(engine, labels[i:i + _chunksize]) for i in range(0, len(labels), _chunksize)]
+    with Pool(min(workers, len(chunks))) as pool:
+        return [kana for chunk in pool.map(_convert_chunk, chunks) for kana in chunk]
+
+
+class ReadingCache:
+    """
+    ラベルから読みへの対応をメモリとディスクに持つ
+
+    キーは (変換器, ラベル)．変換器が変わると読みの区切りも変わるので分けて持つ．
+
+    Attributes
+    ----------
+    hits : int
+    misses : int
+    """
+
+    _schema = """
+    CREATE TABLE IF NOT EXISTS readings (
+      engine TEXT NOT NULL,
+      label TEXT NOT NULL,
+      kana TEXT NOT NULL,
+      PRIMARY KEY (engine, label)
+    );
+    """
+
+    def __init__(self, dbpath, engine="kakasi", workers=1):
+        """
+        Parameters
+        ----------
+        dbpath : str
+          sqlite のファイル．":memory:" も可
+        engine : str
+          "kakasi" あるいは "mecab"
+        workers : int
+          変換に用いる最大プロセス数
+        """
+        if engine not in _factories:
+            raise ValueError("Unknown reading engine '{}'".format(engine))
+        self.dbpath = dbpath
+        self.engine = engine
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        self._memo = {}
+        self._lock = threading.Lock()
+        self._conn = connect(dbpath, self._schema)
+
+    def readings(self, labels):
+        """
+        Parameters
+        ----------
+        labels : Iterable[str]
+
+        Returns
+        -------
+        List[str]
+          labels と同じ順の読み
+        """
+        labels = list(labels)
+        with self._lock:
+            missing = [label for label in set(labels) if label not in self._memo]
+            if missing:
+                self._load(missing)
+                missing = [label for label in missing if label not in self._memo]
+            self.misses += len(missing)
+            self.hits += len(set(labels)) - len(missing)
+        if missing:
+            kanas = convert_many(missing, self.engine, self.workers)
+            with self._lock:
+                self._memo.update(zip(missing, kanas))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO readings VALUES (?, ?, ?)",
+                    [(self.engine, label, kana) for label, kana in zip(missing, kanas)])
+                self._conn.commit()
+        return [self._memo[label] for label in labels]
+
+    def _load(self, labels):
+        # sqlite の変数の上限を越えないように分けて引く
+        for i in range(0, len(labels), 500):
+            chunk = labels[i:i + 500]
+            rows = self._conn.execute(
+                "SELECT label, kana FROM readings WHERE engine=? AND label IN ({})".format(
+                    ",".join("?" * len(chunk))), [self.engine] + chunk)
+            self._memo.update(rows)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM readings WHERE engine=?", (self.engine,)).fetchone()[0]
+
+    def stats(self):
+        """
+        Returns
+        -------
+        {str: number}
+          hits, misses, hit_rate, entries
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+_shared = SharedCache(lambda dbpath: ReadingCache(dbpath, engine=_engine, workers=_workers),
+                      "SHOW_A_TABLE_READINGS", "readings.sqlite3")
+
+
+def reading_cache(dbpath=None):
+    """
+    既定の場所にある読みのキャッシュを開く．プロセス内では同じものを返す
+
+    Parameters
+    ----------
+    dbpath : str
+      未指定時は環境変数 `SHOW_A_TABLE_READINGS` あるいは ~/.cache/show_a_table/readings.sqlite3
+
+    Returns
+    -------
+    ReadingCache
+    """
+    return _shared.get(dbpath)
@@ -1,9 +1,15 @@
 import math
+import re
 import sys
+import unicodedata
+from bisect import bisect_left
 from collections import OrderedDict
 from enum import Enum, auto
 
-from .util import make_n_dict
+import jaconv
+
+from .reading import reading_cache, romaji
+from .util import make_kana_trie
 
 
 class RefinerState(Enum):
@@ -72,6 +78,163 @@ class Candidate:
         return self.key
 
 
+class Pager:
+    """
+    変更されない列をページに分けて辿る
+
+    ページの取り出しは列の長さによらず，ページの大きさだけの手間で済む．
+    `range` を渡せば数値の列も作らずに扱える
+
+    Attributes
+    ----------
+    items : Sequence
+      ページに分ける列．tuple か range
+    size : int
+      1ページの要素数．0 以下ならば全体で1ページ
+    page : int
+      現在のページ番号(0始まり)
+    """
+
+    def __init__(self, items, size=30):
+        self.items = items if isinstance(items, (tuple, range)) else tuple(items)
+        self.size = size
+        self.page = 0
+
+    @property
+    def num_pages(self):
+        if self.size <= 0:
+            return 1
+        return max(1, math.ceil(len(self.items) / self.size))
+
+    def current(self):
+        """
+        Returns
+        -------
+        Sequence
+          現在のページの要素
+        """
+        if self.size <= 0:
+            return self.items
+        return self.items[self.page * self.size:(self.page + 1) * self.size]
+
+    def has_next(self):
+        return self.page + 1 < self.num_pages
+
+    def has_prev(self):
+        return self.page > 0
+
+    def next(self):
+        return self.jump(self.page + 1)
+
+    def prev(self):
+        return self.jump(self.page - 1)
+
+    def jump(self, page):
+        """
+        Parameters
+        ----------
+        page : int
+          移動先のページ番号
+
+        Returns
+        -------
+        Sequence
+          移動先のページの要素
+
+        Raises
+        ------
+        IndexError
+          ページが存在しない場合
+        """
+        if not 0 <= page < self.num_pages:
+            raise IndexError(f"page {page} is out of range")
+        self.page = page
+        return self.current()
+
+    def resize(self, size):
+        """
+        1ページの要素数を変える．現在のページの先頭要素を含むページに移る
+        """
+        if size != self.size:
+            first = self.page * self.size if self.size > 0 else 0
+            self.size = size
+            self.page = first // size if size > 0 else 0
+
+
+def _with_nav(keys, pager):
+    """
+    表示する候補に "PREV" と "NEXT" を必要に応じて加える
+    """
+    keys = list(keys)
+    if pager.has_prev():
+        keys.append("PREV")
+    if pager.has_next():
+        keys.append("NEXT")
+    return keys
+
+
+def _search_key(text):
+    """
+    検索のために全角半角，大文字小文字，ひらがなカタカナの違いを無くす
+    """
+    return jaconv.hira2kata(unicodedata.normalize("NFKC", text).lower())
+
+
+class SearchIndex:
+    """
+    候補の表示値，カナ読み，ローマ字の前方一致で候補を探す
+
+    3種の文字列をまとめて整列しておき，二分探索で一致する範囲を求める．
+    一致した件数を k とすると，1回の検索は O(log n + k) で済む
+    """
+
+    def __init__(self, cands):
+        """
+        Parameters
+        ----------
+        cands : List[Candidate]
+          検索対象．"完了" のような操作用の候補は含めない
+        """
+        self.cands = list(cands)
+        kanas = reading_cache().readings(c.key for c in self.cands)
+        rows = set()
+        for i, (c, kana) in enumerate(zip(self.cands, kanas)):
+            for key in (c.key, kana, romaji(kana)):
+                if key:
+                    rows.add((_search_key(key), i))
+        rows = sorted(rows)
+        self._keys = [k for k, _ in rows]
+        self._idxs = [i for _, i in rows]
+
+    def search(self, prefix, limit=0):
+        """
+        Parameters
+        ----------
+        prefix : str
+          表示値，カナ読み，ローマ字のいずれかの先頭．ひらがなでもよい
+        limit : int
+          返す最大件数．0 ならば全て
+
+        Returns
+        -------
+        List[Candidate]
+          一致した候補．同じ候補は1度だけ，一致した文字列の順に並ぶ
+        """
+        prefix = _search_key(prefix)
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + "\U0010ffff", lo)
+        seen = set()
+        ret = []
+        for i in self._idxs[lo:hi]:
+            if i in seen:
+                continue
+            seen.add(i)
+            ret.append(self.cands[i])
+            if len(ret) == limit:
+                break
+        return ret
+
+
 class Candidates:
     """
     Refinerが返す候補一覧を保持するクラス
@@ -111,10 +274,10 @@ class Candidates:
         if not (len(cands) == len(set([c.key for c in cands]))):
             raise ValueError("候補値に被りがあります．")
         self._expects = {c.key: c for c in cands}
-        self._lk = list(self._expects.keys())
+        self._pager = Pager(self._expects.keys())
+        self._index = None
         self.title = title
         self.parent = parent
-        self._last_idx = None
 
     def cands(self, num_cands=30):
         """
@@ -128,14 +291,51 @@ class Candidates:
         Returns
         -------
         List[str]
-          表示する候補のリスト
+          表示する候補のリスト．前後のページがあれば "PREV" や "NEXT" を含む
+        """
+        self._pager.resize(num_cands)
+        return _with_nav(self._pager.current(), self._pager)
+
+    def jump(self, page, num_cands=30):
+        """
+        Parameters
+        ----------
+        page : int
+          表示するページ番号(0始まり)
+        num_cands : int
+
+        Returns
+        -------
+        List[str]
+          そのページの候補のリスト
+
+        Raises
+        ------
+        IndexError
+          ページが存在しない場合
+        """
+        self._pager.resize(num_cands)
+        self._pager.jump(page)
+        return self.cands(num_cands)
+
+    def search(self, prefix, num_cands=30):
+        """
+        表示値，カナ読み，ローマ字が `prefix` で始まる候補を返す．返した候補は `select` で選べる
+
+        Parameters
+        ----------
+        prefix : str
+        num_cands : int
+          返す最大件数．0 ならば全て
+
+        Returns
+        -------
+        List[str]
+          一致した候補の表示値
         """
-        if len(self._lk) <= num_cands:
-            return self._lk
-        tmp = self._lk[:num_cands]
-        tmp.append("NEXT")
-        self._lk = self._lk[num_cands:]
-        return tmp
+        if self._index is None:
+            self._index = SearchIndex(self._expects.values())
+        return [c.key for c in self._index.search(prefix, num_cands)]
 
     def select(self, num_cands, choice):
         """
@@ -157,7 +357,9 @@ class Candidates:
           if choice not in proposal
         """
         if choice == "NEXT":
-            return self.cands(num_cands)
+            return self.jump(self._pager.page + 1, num_cands)
+        if choice == "PREV":
+            return self.jump(self._pager.page - 1, num_cands)
         if choice not in self._expects:
             raise ValueError(f"{choice} is not in proposal")
         return self._expects[choice]
@@ -176,12 +378,15 @@ class KanaCandidates:
     title : str
     parent : Refiner
     _cands : List[Candidate]
-    _last : List[str]
+    _path : List[(KanaNode, Pager, OrderedDict or None)]
+      根から表示中の節までの節とそのページ．葉ならば表示値から Candidate への対応も持つ
 
     Examples
     --------
     国名の場合，国名をカナで書いたときの先頭N文字（1で足りる？）がまず選択肢となる．
     カナを選択したのちに，そのカナから始まる国名一覧によって国名が選択可能となる．
+    候補の多いカナはさらに次の文字で分けるので，何件あっても対数回程度の選択で辿りつく．
+    先頭ページで "PREV" を選ぶと1つ上の段に戻る．
     """
 
     def __init__(self, title, cands, parent):
@@ -205,10 +410,19 @@ class KanaCandidates:
         self.title = title
         self.parent = parent
         self._cands = cands
-        self._last = []
-        self._kana = ""
         self._proposal = []
-        self._cands_dict = None
+        self._trie = None
+        self._has_complete = False
+        self._path = []
+        self._index = None
+        self._found = {}
+
+    def _enter(self, node, num_cands):
+        if node.is_leaf():
+            leaf = OrderedDict([(l, Candidate(key=l, ref=s, kana=k)) for (s, l, k) in node.entries])
+            self._path.append((node, Pager(leaf.keys(), num_cands), leaf))
+        else:
+            self._path.append((node, Pager(sorted(node.children), num_cands), None))
 
     def cands(self, num_cands=30):
         """
@@ -224,32 +438,43 @@ class KanaCandidates:
         List[str]
           表示する候補のリスト
         """
-        # 辞書がないなら作る
-        if self._cands_dict is None:
-            pl = [(c.ref, c.key) for c in self._cands]
-            self._cands_dict = {
-                kana: [Candidate(key=l, ref=s, kana=k) for (s, l, k) in val]
-                for kana, val in make_n_dict(pl, num_cands).items()
-            }
-        if self._last:
-            tmpl = self._last[:num_cands]
-            self._last = self._last[num_cands:]
-            if len(self._last) > 0:
-                tmpl.append("NEXT")
-            self._proposal = tmpl
-            return tmpl
-        elif len(self._cands_dict.keys()) <= num_cands:
-            self._proposal = list(sorted(self._cands_dict.keys()))
-            return self._proposal
-        else:
-            tmpl = list(sorted(self._cands_dict.keys()))
-            self._last = tmpl[num_cands:]
-            tmpl = tmpl[:num_cands]
-            tmpl.append("NEXT")
-            if "完了" in self._cands_dict.keys() and "完了" not in tmpl:
-                tmpl.append("完了")
-            self._proposal = tmpl
-            return tmpl
+        # 木がないなら作る
+        if self._trie is None:
+            pl = [(c.ref, c.key) for c in self._cands if c.key != "完了"]
+            self._has_complete = len(pl) != len(self._cands)
+            self._trie = make_kana_trie(pl, num_cands)
+            self._enter(self._trie, num_cands)
+        _, pager, _ = self._path[-1]
+        pager.resize(num_cands)
+        tmpl = _with_nav(pager.current(), pager)
+        if len(self._path) > 1:
+            if not pager.has_prev():
+                tmpl.insert(len(pager.current()), "PREV")
+        elif self._has_complete:
+            tmpl.append("完了")
+        self._proposal = tmpl
+        self._found = {}
+        return tmpl
+
+    def jump(self, page, num_cands=30):
+        """
+        表示中の段の `page` 番目のページを返す．`Candidates.jump` を参照
+        """
+        self.cands(num_cands)
+        self._path[-1][1].jump(page)
+        return self.cands(num_cands)
+
+    def search(self, prefix, num_cands=30):
+        """
+        カナの段を辿らずに候補を探す．`Candidates.search` を参照
+
+        返した候補は次の `select` で選べる．"NEXT" や "PREV" を選ぶと元の段の表示に戻る
+        """
+        if self._index is None:
+            self._index = SearchIndex([c for c in self._cands if c.key != "完了"])
+        self.cands(num_cands)
+        self._found = OrderedDict((c.key, c) for c in self._index.search(prefix, num_cands))
+        return list(self._found.keys())
 
     def select(self, num_cands, choice):
         """
@@ -270,28 +495,61 @@ class KanaCandidates:
         ValueError
           if choice not in proposal
         """
+        if choice in self._found:
+            return self._found[choice]
+        node, pager, leaf = self._path[-1]
         if choice == "NEXT":
+            return self.jump(pager.page + 1, num_cands)
+        if choice == "PREV" and len(self._path) > 1 and not pager.has_prev():
+            # 1つ上の段に戻る
+            self._path.pop()
             return self.cands(num_cands)
+        if choice == "PREV":
+            return self.jump(pager.page - 1, num_cands)
         if choice not in self._proposal:
             raise ValueError("not in proposal")
         if choice == "完了":
             return Candidate("完了")
-        if self._kana == "":
-            self._kana = choice
-            self._proposal = OrderedDict([(c.key, c) for c in self._cands_dict[choice]])
-            return list(self._proposal.keys())
-        else:
-            return self._proposal[choice]
+        if leaf is not None:
+            return leaf[choice]
+        self._enter(node.children[choice], num_cands)
+        return self.cands(num_cands)
 
     def __str__(self):
         return super().__str__()
 
 
+def _linear_edges(start, end, n):
+    """
+    [start, end] を幅の等しい高々 n 個の区間に分けたときの各区間の下端
+    """
+    width = -(-(end - start + 1) // n)
+    return list(range(start, end + 1, width))
+
+
+def _log_edges(start, end, n):
+    """
+    [start, end] (start >= 1) を桁で分けたときの各区間の下端．
+    n 個に収まれば 1, 2, 5 倍の刻みも使い，収まらなければ数桁ずつまとめる
+    """
+    lo_exp, hi_exp = len(str(start)) - 1, len(str(end)) - 1
+    for steps in ((1, 2, 5), (1,)):
+        edges = [start] + [m * 10**e for e in range(lo_exp, hi_exp + 1) for m in steps
+                           if start < m * 10**e <= end]
+        if len(edges) <= n:
+            return edges
+    stride = -(-(hi_exp - lo_exp + 1) // (n - 1)) if n > 1 else hi_exp + 1
+    return [start] + [10**e for e in range(lo_exp + stride, hi_exp + 1, stride)]
+
+
 class NumCandidates:
     """
     数値に関する候補を提示して絞り込みの補助を行う
+
+    範囲が広ければ区間を候補とし，狭ければ個々の数値をページに分けて候補とする．
+    区間の境界は計算で求めるので，範囲の大きさによらず1回の選択の手間は候補数程度で済む
     """
-    def __init__(self, title, start, end, parent, skippable=False):
+    def __init__(self, title, start, end, parent, skippable=False, scale="linear"):
         """
         Parameters
         ----------
@@ -303,42 +561,70 @@ class NumCandidates:
         parent : Refiner
         skippable : bool = False
           Trueなら選択肢にSKIPが追加され，その選択をSKIPできる
+        scale : str
+          区間の分け方．"linear" は等幅，"log" は桁ごと，
+          "auto" は範囲が3桁以上にわたるときだけ桁ごととする．
+          売上高や従業員数のように桁の幅が広い値には "log" か "auto" を用いる
         """
+        if scale not in ("linear", "log", "auto"):
+            raise ValueError(f"unknown scale {scale}")
         self.title = title
         self.parent = parent
         self._start = start
         self._end = end
         self._skippable = skippable
+        self._scale = scale
         self._num = ""
         self._n_cands = 0
-        self._last = None
+        self._pager = None
+
+    def _edges(self, n):
+        start, end = self._start, self._end
+        low = max(start, 1)
+        if self._scale == "linear" or end < low * (1000 if self._scale == "auto" else 10):
+            return _linear_edges(start, end, n)
+        # 0 以下は1つの区間にまとめる
+        if start < 1:
+            return [start] + _log_edges(1, end, n - 1)
+        return _log_edges(start, end, n)
 
     def _mk_range(self, ncands):
-        self._cands = [i for i in range(self._start, self._end+1)]
-        width = math.ceil(len(self._cands) / ncands)
-        if self._skippable:
-            width -= 1
+        self._pager = None
+        edges = self._edges(ncands - 1 if self._skippable else ncands)
+        bounds = zip(edges, edges[1:] + [self._end + 1])
         self._proposal = OrderedDict(
-            [("{s}-{e}".format(s=self._cands[idx], e=self._cands[idx:idx+width][-1]),
-              self._cands[idx:idx+width])
-             for idx in range(0, len(self._cands), width)]
+            [("{s}-{e}".format(s=lo, e=hi - 1), (lo, hi - 1)) for lo, hi in bounds]
         )
         if self._skippable:
             self._proposal["SKIP"] = Candidate("SKIP", ref="*")
             self._proposal.move_to_end("SKIP")
 
+    def _page_size(self, ncands):
+        """
+        Returns
+        -------
+        int
+          SKIP と PREV/NEXT を加えても `ncands` 個以下となる，1ページの数値の個数
+        """
+        if ncands <= 0:
+            return 0
+        room = ncands - 1 if self._skippable else ncands
+        if self._end - self._start + 1 <= room:
+            return room
+        # 複数ページになるならば PREV と NEXT の分も空けておく
+        return max(1, room - 2)
+
     def _mk_next(self, ncands):
-        self._cands = [i for i in range(self._start, self._end+1)]
-        if self._last:
-            self._proposal = self._last
-        else:
-            tps = [(str(c), c) for c in self._cands]
-            if self._skippable:
-                tps.append(("SKIP", Candidate("SKIP", ref="*")))
-            if len(tps) > ncands:
-                tps.insert(ncands-1, ("NEXT", "NEXT"))
-            self._last = OrderedDict(tps[ncands:])
-            self._proposal = OrderedDict(tps[:ncands])
+        nums = range(self._start, self._end+1)
+        size = self._page_size(ncands)
+        if self._pager is None or self._pager.items != nums:
+            self._pager = Pager(nums, size)
+        self._pager.resize(size)
+        tps = [(str(c), c) for c in self._pager.current()]
+        tps += [(nav, nav) for nav in _with_nav([], self._pager)]
+        if self._skippable:
+            tps.append(("SKIP", Candidate("SKIP", ref="*")))
+        self._proposal = OrderedDict(tps)
 
     def cands(self, num_cands=30):
         """
@@ -361,6 +647,16 @@ class NumCandidates:
         retl = list(self._proposal.keys())
         return retl
 
+    def jump(self, page, num_cands=30):
+        """
+        個別の数値を表示している場合に `page` 番目のページを返す．`Candidates.jump` を参照
+        """
+        self.cands(num_cands)
+        if self._pager is None:
+            raise IndexError(f"page {page} is out of range")
+        self._pager.jump(page)
+        return self.cands(num_cands)
+
     def select(self, num_cands, choice):
         """
         Parameters
@@ -385,12 +681,13 @@ class NumCandidates:
         ret = self._proposal[choice]
         if isinstance(ret, Candidate):
             return ret
-        elif type(ret) is list:
-            self._start = ret[0]
-            self._end = ret[-1]
+        elif type(ret) is tuple:
+            self._start, self._end = ret
             return self.cands(num_cands)
         elif choice == "NEXT":
-            return self.cands(num_cands)
+            return self.jump(self._pager.page + 1, num_cands)
+        elif choice == "PREV":
+            return self.jump(self._pager.page - 1, num_cands)
         elif type(ret) == int:
             return Candidate(choice)
         else:
@@ -420,14 +717,60 @@ class DQQuery:
     Attributes
     ----------
     priori : Priority
+    ctx_filter : re or Set[str] or (str -> bool) or None
+      文脈がこのクエリを通過しうるための必要条件．
+      正規表現ならどこかに一致すること，文字列の集合なら全てを含むこと，関数ならTrueを返すこと
+    ctx_checked : int
+      `check_context` で調べた文脈の数．`reset_counts` で0に戻る
+    ctx_skipped : int
+      `check_context` で読解モデルに渡す必要が無いと判断した文脈の数
     """
 
-    def __init__(self, priori=None):
+    def __init__(self, priori=None, ctx_filter=None):
         self.attr = ""
         if priori and priori in Priority:
             self.priori = priori
         else:
             self.priori = Priority.MIDDLE
+        if isinstance(ctx_filter, str):
+            ctx_filter = re.compile(ctx_filter)
+        elif isinstance(ctx_filter, (list, tuple, set)):
+            ctx_filter = frozenset(ctx_filter)
+        self.ctx_filter = ctx_filter
+        self.reset_counts()
+
+    def reset_counts(self):
+        """
+        `ctx_checked` と `ctx_skipped` を0に戻す．`dqwrapper.run` が実行のはじめに呼ぶ
+        """
+        self.ctx_checked = 0
+        self.ctx_skipped = 0
+
+    def check_context(self, context):
+        """
+        Parameters
+        ----------
+        context : str
+          QAシステムに渡す予定の文脈
+
+        Returns
+        -------
+        bool
+          False ならばその文脈から得られる回答は決して `exam` を通過しない
+        """
+        flt = self.ctx_filter
+        if flt is None:
+            return True
+        self.ctx_checked += 1
+        if isinstance(flt, frozenset):
+            ok = all(kw in context for kw in flt)
+        elif callable(flt):
+            ok = flt(context)
+        else:
+            ok = flt.search(context) is not None
+        if not ok:
+            self.ctx_skipped += 1
+        return ok
 
     def exam(self, result):
         """
@@ -443,6 +786,29 @@ class DQQuery:
         """
         return False
 
+    def exam_batch(self, results):
+        """
+        `exam` を複数の回答にまとめて適用する．同じ回答は1度しか調べない
+
+        Parameters
+        ----------
+        results : List[str]
+
+        Returns
+        -------
+        List[bool]
+          `results` と同じ順の `exam` の結果
+        """
+        distinct = list(set(results))
+        passed = dict(zip(distinct, self._exam_distinct(distinct)))
+        return [passed[r] for r in results]
+
+    def _exam_distinct(self, results):
+        """
+        重複の無い回答について `exam` の結果を返す．派生クラスはまとめて調べる方法があれば上書きする
+        """
+        return [self.exam(r) for r in results]
+
     def get_query(self, target):
         """
         Parameters
@@ -469,7 +835,7 @@ class RegQuery(DQQuery):
       絞りのための正規表現オブジェクト
     """
 
-    def __init__(self, regex, gen_query, priori=None):
+    def __init__(self, regex, gen_query, priori=None, ctx_filter=None):
         """
         Parameters
         ----------
@@ -478,14 +844,20 @@ class RegQuery(DQQuery):
           グループ化してもよいが，特別使用する方法は用意しない
         gen_query : str -> str
           質問生成のための関数
+        ctx_filter : re or Set[str] or (str -> bool)
+          文脈の必要条件．`DQQuery` を参照
         """
-        super().__init__(priori)
+        super().__init__(priori, ctx_filter)
         self.reg = regex
         self.gen = gen_query
 
     def exam(self, result):
         return True if self.reg.match(result) else False
 
+    def _exam_distinct(self, results):
+        match = self.reg.match
+        return [match(r) is not None for r in results]
+
     def get_query(self, target):
         return self.gen(target)
 
@@ -497,10 +869,11 @@ class FunQuery(DQQuery):
     Attributes
     ----------
     refine : str -> bool
+    refine_batch : List[str] -> List[bool] or None
     gen : str -> str
     """
 
-    def __init__(self, refine, gen_query, priori=None):
+    def __init__(self, refine, gen_query, priori=None, ctx_filter=None, refine_batch=None):
         """
         Parameters
         ----------
@@ -508,13 +881,23 @@ class FunQuery(DQQuery):
           絞りを実施する関数．bool値を返す
         gen_query : str -> str
           質問文を生成する関数
+        ctx_filter : re or Set[str] or (str -> bool)
+          文脈の必要条件．`DQQuery` を参照
+        refine_batch : List[str] -> List[bool]
+          `refine` を複数の回答にまとめて適用する関数．`exam_batch` で用いる
         """
-        super().__init__(priori)
+        super().__init__(priori, ctx_filter)
         self.refine = refine
+        self.refine_batch = refine_batch
         self.gen = gen_query
 
     def exam(self, result):
         return self.refine(result)
 
+    def _exam_distinct(self, results):
+        if self.refine_batch is None:
+            return super()._exam_distinct(results)
+        return self.refine_batch(results)
+
     def get_query(self, target):
         return self.gen(target)
@@ -0,0 +1,236 @@
+"""
+SPARQL の問い合わせ結果を覚えておく
+
+YAGO のデータはほとんど変わらないので，同じ問い合わせ文には同じ結果を返す．
+メモリとディスク(sqlite)の2段で持ち，`ttl` 秒を過ぎたものは問い合わせ直す．
+`stale_while_revalidate` ならば古い結果をすぐに返し，裏で問い合わせ直す．
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from os import environ
+
+from .sqlite_cache import SharedCache, connect, env_seconds, fresh
+
+_ttl = env_seconds("SPARQL_CACHE_TTL", 30 * 24 * 3600)
+_swr = (environ.get("SPARQL_CACHE_SWR", None) or "1") not in ("0", "false", "False")
+
+
+def query_hash(query):
+    """
+    Returns
+    -------
+    str
+      問い合わせ文の sha1 の16進表記
+    """
+    return hashlib.sha1(query.encode("utf-8")).hexdigest()
+
+
+class SparqlCache:
+    """
+    問い合わせ文から結果(bindings)への対応をメモリとディスクに持つ
+
+    Attributes
+    ----------
+    hits : int
+      期限内の結果を返した数
+    stale_hits : int
+      期限切れの結果を返した数
+    misses : int
+      問い合わせを待った数
+    refreshes : int
+      裏で問い合わせ直した数
+    errors : int
+      問い合わせに失敗した数．古い結果があればそれを返す
+    """
+
+    _schema = """
+    CREATE TABLE IF NOT EXISTS results (
+      hash TEXT PRIMARY KEY,
+      query TEXT NOT NULL,
+      bindings TEXT NOT NULL,
+      fetched REAL NOT NULL
+    );
+    """
+
+    def __init__(self, dbpath, ttl=_ttl, stale_while_revalidate=_swr, max_memory=256):
+        """
+        Parameters
+        ----------
+        dbpath : str
+          sqlite のファイル．":memory:" も可
+        ttl : float
+          結果の有効期間(秒)．0 以下なら無期限
+        stale_while_revalidate : bool
+          True ならば期限切れの結果を待たずに返し，裏で問い合わせ直す
+        max_memory : int
+          メモリに置く結果の数．越えた場合は最終参照が古いものから捨てる
+        """
+        self.dbpath = dbpath
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_memory = max_memory
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._conn = connect(dbpath, self._schema)
+
+    def get(self, query, fetch):
+        """
+        Parameters
+        ----------
+        query : str
+          問い合わせ文
+        fetch : str -> List[dict]
+          実際に問い合わせて bindings を返す関数
+
+        Returns
+        -------
+        List[dict]
+          SPARQL の JSON 形式の bindings
+        """
+        key = query_hash(query)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None and self._fresh(entry):
+                self.hits += 1
+                return entry[1]
+            if entry is not None and self.stale_while_revalidate:
+                self.stale_hits += 1
+                self._revalidate(key, query, fetch)
+                return entry[1]
+        try:
+            bindings = fetch(query)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+                if entry is None:
+                    raise
+                # 繋がらなくても古い結果で続けられるようにする
+                self.stale_hits += 1
+            return entry[1]
+        with self._lock:
+            self.misses += 1
+            self._store(key, query, bindings)
+        return bindings
+
+    def _fresh(self, entry):
+        return fresh(entry[0], self.ttl)
+
+    def _lookup(self, key):
+        """
+        Returns
+        -------
+        (float, List[dict]) or None
+          取得時刻と bindings
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        row = self._conn.execute(
+            "SELECT fetched, bindings FROM results WHERE hash=?", (key,)).fetchone()
+        if row is None:
+            return None
+        entry = (row[0], json.loads(row[1]))
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def _store(self, key, query, bindings):
+        entry = (time.time(), bindings)
+        self._remember(key, entry)
+        self._conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                           (key, query, json.dumps(bindings, ensure_ascii=False), entry[0]))
+        self._conn.commit()
+
+    def _revalidate(self, key, query, fetch):
+        # 同じ問い合わせを重ねて投げない
+        if key in self._pending:
+            return
+
+        def work():
+            try:
+                bindings = fetch(query)
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                    self._pending.pop(key, None)
+                return
+            with self._lock:
+                self.refreshes += 1
+                self._store(key, query, bindings)
+                self._pending.pop(key, None)
+
+        th = threading.Thread(target=work, daemon=True)
+        self._pending[key] = th
+        th.start()
+
+    def wait(self):
+        """
+        裏で実行中の問い合わせが終わるまで待つ
+        """
+        with self._lock:
+            threads = list(self._pending.values())
+        for th in threads:
+            th.join()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def stats(self):
+        """
+        Returns
+        -------
+        {str: number}
+          hits, stale_hits, misses, refreshes, errors, hit_rate, entries．
+          hit_rate は問い合わせを待たずに返せた割合
+        """
+        served = self.hits + self.stale_hits
+        total = served + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "hit_rate": served / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        self.wait()
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+_shared = SharedCache(SparqlCache, "SPARQL_CACHE", "sparql.sqlite3")
+
+
+def sparql_cache(dbpath=None):
+    """
+    既定の場所にある SPARQL のキャッシュを開く．プロセス内では同じものを返す
+
+    Parameters
+    ----------
+    dbpath : str
+      未指定時は環境変数 `SPARQL_CACHE` あるいは ~/.cache/show_a_table/sparql.sqlite3
+
+    Returns
+    -------
+    SparqlCache
+    """
+    return _shared.get(dbpath)
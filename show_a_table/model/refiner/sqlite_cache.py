@@ -0,0 +1,109 @@
+"""
+sqlite に覚えておくキャッシュの共通部分
+
+既定の場所は環境変数あるいは ~/.cache/show_a_table/ の下とし，
+書き込めない場所ならばメモリ上だけで覚える．プロセス内では同じものを使い回す．
+"""
+import os
+import sqlite3
+import threading
+import time
+from os import environ, path
+
+
+def connect(dbpath, schema):
+    """
+    Parameters
+    ----------
+    dbpath : str
+      sqlite のファイル．":memory:" も可
+    schema : str
+      接続時に実行する CREATE 文
+
+    Returns
+    -------
+    sqlite3.Connection
+      複数のスレッドから使えるもの．呼び出し側で排他する
+    """
+    conn = sqlite3.connect(dbpath, check_same_thread=False)
+    conn.executescript(schema)
+    return conn
+
+
+def env_seconds(name, default):
+    """
+    Returns
+    -------
+    float
+      環境変数 `name` の秒数．未設定ならば default
+    """
+    return float(environ.get(name, None) or default)
+
+
+def fresh(fetched, ttl):
+    """
+    Parameters
+    ----------
+    fetched : float
+      取得時刻(UNIX 時間)
+    ttl : float
+      有効期間(秒)．0 以下なら無期限
+
+    Returns
+    -------
+    bool
+      有効期間内かどうか
+    """
+    return ttl <= 0 or time.time() - fetched < ttl
+
+
+class SharedCache:
+    """
+    既定の場所にあるキャッシュをプロセス内で1つだけ開く
+
+    Attributes
+    ----------
+    factory : str -> object
+      sqlite のファイルからキャッシュを作る関数．作ったものは `dbpath` 属性を持つ
+    env : str
+      場所を指定する環境変数
+    filename : str
+      ~/.cache/show_a_table/ の下のファイル名
+    """
+
+    def __init__(self, factory, env, filename):
+        self.factory = factory
+        self.env = env
+        self.filename = filename
+        self._cache = None
+        self._lock = threading.Lock()
+
+    def default_path(self):
+        return environ.get(self.env, None) or \
+            path.join(path.expanduser("~"), ".cache", "show_a_table", self.filename)
+
+    def get(self, dbpath=None):
+        """
+        Parameters
+        ----------
+        dbpath : str
+          未指定時は `default_path()`．開いているものと異なれば開き直す
+
+        Returns
+        -------
+        object
+          `factory` で作ったキャッシュ
+        """
+        with self._lock:
+            if self._cache is None or (dbpath and dbpath != self._cache.dbpath):
+                self._cache = self._open(dbpath or self.default_path())
+            return self._cache
+
+    def _open(self, dbpath):
+        try:
+            if dbpath != ":memory:":
+                os.makedirs(path.dirname(dbpath), exist_ok=True)
+            return self.factory(dbpath)
+        except (OSError, sqlite3.Error):
+            # 書き込めない場所ならばメモリ上だけで覚える
+            return self.factory(":memory:")
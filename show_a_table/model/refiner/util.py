@@ -1,9 +1,10 @@
 import os
 from itertools import groupby
 
-import pykakasi
 import toml
 
+from .reading import reading_cache
+
 
 def _gbh(lst, key=0, idx=0):
     """
@@ -42,11 +43,119 @@ def _merge_dict(base, additional, key):
     return base
 
 
+class KanaNode:
+    """
+    カナの接頭辞木の節
+
+    Attributes
+    ----------
+    prefix : str
+      この節の接頭辞．この節以下の全てのカナはこれで始まる
+    entries : List[Tuple[str, str, str]]
+      葉ならばこの節以下の全ての(主語，ラベル，カナ)．内部節ならば空
+    children : Dict[str, KanaNode]
+      接頭辞から子への対応．葉ならば空
+    """
+
+    def __init__(self, prefix, entries=None, children=None):
+        self.prefix = prefix
+        self.entries = entries or []
+        self.children = children or {}
+
+    def is_leaf(self):
+        return not self.children
+
+    def leaves(self):
+        """
+        Yields
+        ------
+        KanaNode
+          この節以下の葉を接頭辞の順に
+        """
+        if self.is_leaf():
+            yield self
+            return
+        for key in sorted(self.children):
+            yield from self.children[key].leaves()
+
+
+def _split(entries, prefix, max_cands):
+    """
+    `entries` を接頭辞 `prefix` の次の1文字で分け，`max_cands` 件以下になるまで繰り返す
+
+    子が1つしかできない段は飛ばす．カナが `prefix` で尽きるものは `prefix` 自身を接頭辞とする葉にまとめる
+    """
+    depth = len(prefix)
+    while True:
+        if len(entries) <= max_cands:
+            return KanaNode(prefix, entries)
+        exact = [e for e in entries if len(e[2]) <= depth]
+        if len(exact) == len(entries):
+            # 同じ読みばかりでこれ以上分けられない
+            return KanaNode(prefix, entries)
+        groups = _gbh([e for e in entries if len(e[2]) > depth], 2, depth)
+        if exact or len(groups) > 1:
+            break
+        # 子が1つなら1文字伸ばしてやり直す
+        (ch, entries), = groups.items()
+        prefix += ch
+        depth += 1
+    children = _children(groups, prefix, max_cands)
+    if exact:
+        children[prefix] = KanaNode(prefix, exact)
+    return KanaNode(prefix, children=children)
+
+
+def _children(groups, prefix, max_cands):
+    children = {}
+    for ch, val in groups.items():
+        node = _split(val, prefix + ch, max_cands)
+        children[node.prefix] = node
+    return children
+
+
+def _readings(_list):
+    """
+    Returns
+    -------
+    List[Tuple[str, str, str]]
+      (主語，ラベル，ラベルのカナ)のリスト
+    """
+    kanas = reading_cache().readings(l for _, l in _list)
+    return [(s, l, k) for (s, l), k in zip(_list, kanas)]
+
+
+def make_kana_trie(_list, max_cands=0):
+    """
+    ラベルのカナの接頭辞木を作る
+
+    根は必ず先頭1文字で分け，それ以降は `max_cands` 件を超える節だけをもう1文字で分ける．
+    カナの短いラベルは，それ以上分けられない節に残る
+
+    Parameters
+    ----------
+    _list : List[Tuple[str, str]]
+      subject, label のペアのリスト．"完了" は含めない
+    max_cands : int
+      葉1つあたりの最大候補数．0 ならば config.toml の値
+
+    Returns
+    -------
+    KanaNode
+      根
+    """
+    if max_cands == 0:
+        max_cands = toml.loads(read_text(__file__, "config.toml"))["max_cands"]
+    lst = [e for e in _readings(_list) if e[2]]
+    return KanaNode("", children=_children(_gbh(lst, 2, 0), "", max_cands))
+
+
 def make_n_dict(_list, max_cands=0):
     """
     リストを受けとり，`max_cands`数を下回るグループになるまで，先頭仮名文字で分割する
 
     例えば， `{"あ": [...], "いあ": [...]}` のように，最大が20になるまで削りつづける．
+    `make_kana_trie` の葉を並べたものに等しい
 
     Parameters
     ----------
@@ -60,23 +169,9 @@ def make_n_dict(_list, max_cands=0):
     Dict[str, List[Tuple[str, str, str]] :
       カナをキーとした，(主語，ラベル，カナ)のリスト
     """
-    if max_cands == 0:
-        max_cands = toml.loads(read_text(__file__, "config.toml"))["max_cands"]
-    has_complete = False
-    if "完了" in {s for s, _ in _list}:
-        _list.remove(("完了", "完了"))
-        has_complete = True
-    kks = pykakasi.kakasi()
-    lst = [(s, l, "".join([d["kana"] for d in kks.convert(l)])) for s, l in _list]
-    dic = _gbh(lst, 2, 0)
-    # TODO 2文字目以降を使う方法を考える（StringOutOfIndexで中断中）
-    # checked = [k for k, v in dic.items() if len(v) > max_cands]
-    # idx = 0
-    # while checked:
-    #     for k in checked:
-    #         dic = _merge_dict(dic, {f"{k}{_k}": v for _k, v in _gbh(dic[k], key=2, idx=idx).items()}, k)
-    #     checked = [k for k, v in dic.items() if len(v) > max_cands]
-    #     idx += 1
+    has_complete = ("完了", "完了") in _list
+    trie = make_kana_trie([p for p in _list if p != ("完了", "完了")], max_cands)
+    dic = {leaf.prefix: leaf.entries for leaf in trie.leaves()}
     if has_complete:
         dic["完了"] = [("完了", "完了", "完了")]
     return dic
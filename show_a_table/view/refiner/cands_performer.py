@@ -33,7 +33,9 @@ class CandsPerformer:
 
     def __init__(self):
         self._cands = None      # 候補一覧
-        self._max_cands = toml.loads(read_text(__file__, "config.toml"))["max_cands"]
+        _conf = toml.loads(read_text(__file__, "config.toml"))
+        self._max_cands = _conf["max_cands"]
+        self._warmup = _conf.get("warmup", False)
         self._refiner = None
         self._cat_sel = None
         self._expects = None
@@ -69,6 +71,9 @@ class CandsPerformer:
         if not self._cat:
             self._cat_sel.set_category(choice)
             self._cat = True
+            if self._warmup:
+                # 属性を選んでいる間に読解モデルを読み込んでおく
+                dqwrapper.warmup()
             attrs = self._cat_sel.attributes()
             return ("属性の選択", attrs)
         # `refiner`が無い = 属性未選択 = `choice` は属性名
@@ -80,7 +85,7 @@ class CandsPerformer:
                 return ("結果", [v["title"] for v in res.values()])
             self._refiner = self._cat_sel.refiners(choice)
             self._cands = self._refiner.refine()
-            return (self._cands.title, self._cands.cands())
+            return (self._cands.title, self._cands.cands(self._max_cands))
         # `cands` がある = 選択途中 = choice は cands のなかみの一つ
         if self._cands:
             _cds = self._cands.select(self._max_cands, choice)
@@ -94,10 +99,50 @@ class CandsPerformer:
                     return ("属性の選択", attrs)
                 else:
                     self._cands = _cds
-                return (self._cands.title, self._cands.cands())
+                return (self._cands.title, self._cands.cands(self._max_cands))
             else:
                 return (self._cands.title, _cds)
 
+    def jump(self, page):
+        """
+        表示中の候補の `page` 番目(0始まり)のページを表示する
+
+        Parameters
+        ----------
+        page : int
+
+        Returns
+        -------
+        (str, List[str])
+          タイトルと選択肢の表示値リスト．
+
+        Raises
+        ------
+        IndexError
+          ページが存在しない場合
+        """
+        return (self._cands.title, self._cands.jump(page, self._max_cands))
+
+    def search(self, prefix):
+        """
+        表示中の候補を前方一致で絞る．入力に合わせて呼ぶことを想定する
+
+        返した選択肢はそのまま `show` に渡せる．数値の候補のように検索できなければ今の選択肢を返す
+
+        Parameters
+        ----------
+        prefix : str
+          表示値，カナ読み，ローマ字のいずれかの先頭．空文字列ならば今の選択肢
+
+        Returns
+        -------
+        (str, List[str])
+          タイトルと選択肢の表示値リスト．
+        """
+        if not prefix or not hasattr(self._cands, "search"):
+            return (self._cands.title, self._cands.cands(self._max_cands))
+        return (self._cands.title, self._cands.search(prefix, self._max_cands))
+
     def complete(self):
         """
         完了処理 といっても戻り値のためにある
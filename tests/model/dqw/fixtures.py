@@ -0,0 +1,42 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from show_a_table.model.dqw import dqwrapper
+from show_a_table.model.dqw.backend import StubBackend
+from show_a_table.model.refiner.category_selector import CategorySelector
+
+
+class CityCorpusCase(unittest.TestCase):
+    """
+    一時ディレクトリに SQuAD 形式の市区町村名のデータを書き出し，
+    スタブの読解モデルとクエリ未設定の CategorySelector を用意する
+
+    Attributes
+    ----------
+    articles : List[dict]
+      書き出す記事．サブクラスで定める
+    patterns : List[(str, str)]
+      `StubBackend` に渡す質問と回答のパターン．None ならば既定のもの
+    """
+
+    articles = []
+    patterns = None
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        ds = os.path.join(self.tmp.name, "squad_City.json")
+        with open(ds, "w") as f:
+            json.dump({"data": self.articles}, f, ensure_ascii=False)
+        self.patch = mock.patch.dict(dqwrapper._datasets, {"CITY": ds})
+        self.patch.start()
+        dqwrapper.set_backend(StubBackend(self.patterns))
+        self.cs = CategorySelector()
+        self.cs.set_category("市区町村名")
+
+    def tearDown(self):
+        self.patch.stop()
+        dqwrapper.set_backend(None)
+        self.tmp.cleanup()
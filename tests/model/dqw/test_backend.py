@@ -0,0 +1,28 @@
+import unittest
+
+from show_a_table.model.dqw.backend import StubBackend, make_backend
+
+
+class TestStubBackend(unittest.TestCase):
+    def test_pattern(self):
+        stub = StubBackend()
+        res = stub.predict_batch([("札幌市は1922年に市制を施行した", "札幌市の成立年は?")])
+        self.assertEqual(res[0][0][0]["text"], "1922年")
+
+    def test_no_answer(self):
+        stub = StubBackend()
+        self.assertEqual(stub.predict_batch([("なにもない", "札幌市の成立年は?")]), [[]])
+
+    def test_fixtures(self):
+        stub = StubBackend(fixtures={"札幌市の首長は?": "秋元克広"})
+        res = stub.predict_batch([("", "札幌市の首長は?")])
+        self.assertEqual(res[0][0], ({"text": "秋元克広"}, 1.0))
+        self.assertEqual(stub.calls, 1)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            make_backend("nothing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from show_a_table.model.dqw.batching import TokenBudgetBatcher
+
+
+class TestTokenBudgetBatcher(unittest.TestCase):
+    def setUp(self):
+        self.questions = [("a" * n, "", "title", str(i)) for i, n in enumerate([50, 1, 3, 40, 2])]
+
+    def test_covers_all(self):
+        batcher = TokenBudgetBatcher(token_budget=60)
+        idxs = [i for b in batcher.batches(self.questions) for i in b]
+        self.assertEqual(sorted(idxs), list(range(len(self.questions))))
+
+    def test_grouped_by_length(self):
+        batcher = TokenBudgetBatcher(token_budget=60)
+        self.assertEqual(batcher.batches(self.questions), [[1, 4, 2], [3], [0]])
+
+    def test_max_batch(self):
+        batcher = TokenBudgetBatcher(token_budget=1000, max_batch=2)
+        self.assertEqual([len(b) for b in batcher.batches(self.questions)], [2, 2, 1])
+
+    def test_autotune(self):
+        batcher = TokenBudgetBatcher()
+        report = batcher.autotune(lambda pairs: None, self.questions, budgets=(10, 100))
+        self.assertEqual(set(report), {10, 100})
+        self.assertIn(batcher.token_budget, (10, 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+from show_a_table.model.dqw.cache import AnswerCache
+
+
+class TestAnswerCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = AnswerCache(":memory:", max_entries=2)
+
+    def test_miss_and_hit(self):
+        self.assertIs(self.cache.get("CITY", "1", "本文", "質問"), False)
+        self.cache.put("CITY", "1", "本文", "質問", "東京都", 0.5)
+        self.assertEqual(self.cache.get("CITY", "1", "本文", "質問"), ("東京都", 0.5))
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_no_answer(self):
+        self.cache.put("CITY", "1", "本文", "質問", None)
+        self.assertIsNone(self.cache.get("CITY", "1", "本文", "質問"))
+
+    def test_context_changed(self):
+        self.cache.put("CITY", "1", "本文", "質問", "東京都", 0.5)
+        self.assertIs(self.cache.get("CITY", "1", "別の本文", "質問"), False)
+
+    def test_evict_lru(self):
+        self.cache.put("CITY", "1", "a", "q", "x", 0.1)
+        self.cache.put("CITY", "2", "a", "q", "y", 0.1)
+        self.cache.get("CITY", "1", "a", "q")
+        self.cache.put("CITY", "3", "a", "q", "z", 0.1)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIs(self.cache.get("CITY", "2", "a", "q"), False)
+        self.assertEqual(self.cache.get("CITY", "1", "a", "q"), ("x", 0.1))
+
+    def test_shared_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dbpath = os.path.join(tmp, "answers.sqlite3")
+            a = AnswerCache(dbpath)
+            b = AnswerCache(dbpath)
+            a.put("CITY", "1", "a", "q", "x", 0.1)
+            self.assertEqual(a.get("CITY", "1", "a", "q"), ("x", 0.1))
+            # 参照しただけでは書き込みのトランザクションを残さない
+            self.assertFalse(a._conn.in_transaction)
+            b.put("CITY", "2", "a", "q", "y", 0.2)
+            self.assertEqual(a.get("CITY", "2", "a", "q"), ("y", 0.2))
+            a.close()
+            b.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
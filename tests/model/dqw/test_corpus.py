@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+
+from show_a_table.model.dqw.corpus import CorpusStore
+
+
+class TestCorpusStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.packpath = os.path.join(self.tmp.name, "squad_City.pack")
+        arts = [
+            {"title": "札幌市", "WikipediaID": "1", "paragraphs": [{"context": "札幌市は北海道の市"}]},
+            {"title": "仙台市", "WikipediaID": "2", "paragraphs": [{"context": "仙台市は宮城県の市"}]},
+            {"title": "福岡市", "WikipediaID": "3", "paragraphs": [{"context": "福岡市は福岡県の市"}]},
+        ]
+        CorpusStore.build(arts, self.packpath)
+        self.corpus = CorpusStore(self.packpath)
+
+    def tearDown(self):
+        self.corpus.close()
+        self.tmp.cleanup()
+
+    def test_all(self):
+        self.assertEqual(self.corpus.wids(), ["1", "2", "3"])
+
+    def test_ids(self):
+        arts = list(self.corpus.articles(ids={"3", "1", "99"}))
+        self.assertEqual([a["title"] for a in arts], ["札幌市", "福岡市"])
+
+    def test_titles(self):
+        arts = list(self.corpus.articles(ids={"1", "2"}, titles={"仙台市", "福岡市"}))
+        self.assertEqual(arts[0]["paragraphs"][0]["context"], "仙台市は宮城県の市")
+        self.assertEqual(len(arts), 1)
+
+    def test_empty(self):
+        packpath = os.path.join(self.tmp.name, "empty.pack")
+        CorpusStore.build([], packpath)
+        corpus = CorpusStore(packpath)
+        self.assertEqual(corpus.wids(), [])
+        corpus.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
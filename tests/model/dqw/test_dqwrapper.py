@@ -0,0 +1,185 @@
+import re
+import threading
+import time
+import unittest
+from unittest import mock
+
+from show_a_table.model.dqw import dqwrapper
+from show_a_table.model.dqw.backend import Backend, StubBackend
+from show_a_table.model.dqw.stats import RunStats
+from show_a_table.model.refiner.refiner import FunQuery, RegQuery
+
+from .fixtures import CityCorpusCase
+
+
+class _Predictor(Backend):
+    """文脈をそのまま回答とする読解モデルの代わり"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict_batch(self, batch, top_n=1):
+        self.calls += len(batch)
+        return [[({"text": ctx}, 1.0)] if ctx else [] for ctx, _ in batch]
+
+
+class _SlowLoad(StubBackend):
+    """読み込みに時間のかかる読解モデルの代わり"""
+
+    loaded = False
+    cold_calls = 0
+
+    def load(self):
+        if not self.loaded:
+            time.sleep(0.2)
+            self.loaded = True
+
+    def predict_batch(self, batch, top_n=1):
+        if not self.loaded:
+            self.cold_calls += 1
+        self.load()
+        return super().predict_batch(batch, top_n)
+
+
+class TestDQWrapper(unittest.TestCase):
+    def setUp(self):
+        self.predictor = _Predictor()
+        dqwrapper.set_backend(self.predictor)
+        self.query = FunQuery(lambda res: "東京" in res, lambda tgt: f"{tgt}の所在地は?")
+        self.query.attr = "所在地"
+        self.questions = [
+            ("東京都にある", "q", "A", "1"),
+            ("東京の港区", "q", "A", "1"),
+            ("", "q", "B", "2"),
+            ("大阪府にある", "q", "B", "2"),
+            ("大阪", "q", "C", "3"),
+        ]
+
+    def tearDown(self):
+        dqwrapper.set_backend(None)
+
+    def test_passed(self):
+        passed = dqwrapper._passed(self.query, self.questions, batch_size=2)
+        self.assertEqual([q[3] for q, _ in passed], ["1", "1"])
+        self.assertEqual(self.predictor.calls, 5)
+
+    def test_passed_exists(self):
+        passed = dqwrapper._passed_exists(self.query, self.questions, batch_size=2)
+        self.assertEqual(passed, [(self.questions[0], "東京都にある")])
+        self.assertEqual(self.predictor.calls, 4)
+
+    def test_configure(self):
+        with self.assertRaises(ValueError):
+            dqwrapper.configure("tpu")
+
+
+class TestRun(CityCorpusCase):
+    articles = [
+        {"title": "札幌市", "WikipediaID": "1", "paragraphs": [
+            {"context": "札幌市は北海道にある市．"}, {"context": "1922年に市制を施行した．"}]},
+        {"title": "那覇市", "WikipediaID": "2", "paragraphs": [
+            {"context": "那覇市は沖縄県にある市．"}, {"context": "1921年に市制を施行した．"}]},
+    ]
+    patterns = [(".*所在地", "北海道|沖縄県"), (".*成立年", r"\d+年")]
+
+    def setUp(self):
+        super().setUp()
+        self.cs.attr = "所在地"
+        self.cs.add_query(RegQuery(re.compile("北海道"), lambda tgt: f"{tgt}の所在地は?"))
+        self.cs.attr = "成立年"
+        self.cs.add_query(RegQuery(re.compile("19"), lambda tgt: f"{tgt}の成立年は?"))
+
+    def test_run(self):
+        res = dqwrapper.run(self.cs)
+        self.assertEqual(res, {"1": {"title": "札幌市",
+                                     "attrs": {"所在地": ["北海道"], "成立年": ["1922年"]}}})
+
+    def test_run_exists(self):
+        backend = StubBackend([(".*所在地", "北海道|沖縄県"), (".*成立年", r"\d+年")])
+        dqwrapper.set_backend(backend)
+        expected = dqwrapper.run(self.cs)
+        calls = backend.calls
+        backend.calls = 0
+        self.assertEqual(dqwrapper.run(self.cs, exists=True), expected)
+        # 札幌市は1段落目で所在地が決まるので2段落目を読まない
+        self.assertEqual(backend.calls, calls - 1)
+        with self.assertRaises(ValueError):
+            dqwrapper.run(self.cs, exists=True, pipeline=True)
+
+    def test_run_pipeline(self):
+        report = []
+        self.assertEqual(dqwrapper.run(self.cs, pipeline=report), dqwrapper.run(self.cs))
+        self.assertEqual(len(report), 2)
+        self.assertEqual(report[0]["source"]["items_out"], 2)
+        self.assertEqual(report[1]["source"]["items_out"], 1)
+
+    def test_run_table(self):
+        self.assertEqual(dqwrapper.run(self.cs, table=True).to_store(), dqwrapper.run(self.cs))
+
+    def test_run_materialized(self):
+        with mock.patch.object(dqwrapper, "_workdir", self.tmp.name):
+            dqwrapper.materialize("CITY", attrs=["所在地", "成立年"])
+            table = dqwrapper.attribute_table("CITY")
+            self.assertEqual(table.attrs["成立年"], {"1": ["1922年"], "2": ["1921年"]})
+            self.assertEqual(dqwrapper.run(self.cs, materialized=True), dqwrapper.run(self.cs))
+        dqwrapper._materialized.clear()
+
+    def test_run_stats(self):
+        stats = RunStats(trace=True)
+        self.assertEqual(dqwrapper.run(self.cs, stats=stats), dqwrapper.run(self.cs))
+        self.assertEqual([q["attr"] for q in stats.queries], ["所在地", "成立年"])
+        self.assertEqual([q["survivors"] for q in stats.queries], [1, 1])
+        self.assertIsNone(stats.queries[0]["candidates"])
+        self.assertEqual(stats.queries[1]["candidates"], 1)
+        for name in ["run", "questions", "filter", "predict", "exam", "store"]:
+            self.assertIn(name, stats.stages)
+        self.assertEqual(stats.stages["run"]["count"], 1)
+        self.assertGreater(stats.counters["questions"], 0)
+        self.assertEqual(stats.counters["cache_hits"], 0)
+        events = stats.trace_events()["traceEvents"]
+        self.assertEqual(len(events), sum(st["count"] for st in stats.stages.values()))
+        self.assertIn("peak memory", str(stats))
+
+    def test_run_stats_threads(self):
+        # 同時に実行しても互いの RunStats に書き込まない
+        stats = [RunStats(trace=False) for _ in range(4)]
+        threads = [threading.Thread(target=dqwrapper.run, args=(self.cs,), kwargs={"stats": st})
+                   for st in stats]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        for st in stats:
+            self.assertEqual(st.stages["run"]["count"], 1)
+            self.assertEqual(len(st.queries), 2)
+        self.assertGreaterEqual(stats[0].peak_memory, stats[0].base_memory)
+
+    def test_plan_warmup(self):
+        dqwrapper.set_backend(_SlowLoad([(".*所在地", "北海道|沖縄県"), (".*成立年", r"\d+年")]))
+        plan = dqwrapper.plan_queries(self.cs)
+        # 読み込みの時間は先頭のクエリのコストに含まれない
+        self.assertTrue(all(e.seconds < 0.1 for e in plan.estimates))
+
+    def test_tune_warmup(self):
+        backend = _SlowLoad([(".*所在地", "北海道|沖縄県")])
+        dqwrapper.set_backend(backend)
+        batcher, report = dqwrapper.tune_batcher(self.cs, budgets=(64, 128))
+        # 計測の前に読み込みを済ませている
+        self.assertEqual(backend.cold_calls, 0)
+        self.assertIn(batcher.token_budget, report)
+
+    def test_run_ctx_counts(self):
+        qg = RegQuery(re.compile("19"), lambda tgt: f"{tgt}の成立年は?", ctx_filter=r"\d")
+        self.cs.queries[1] = qg
+        dqwrapper.run(self.cs)
+        counts = (qg.ctx_checked, qg.ctx_skipped)
+        self.assertEqual(counts, (2, 1))
+        dqwrapper.run(self.cs, plan=True)
+        self.assertEqual((qg.ctx_checked, qg.ctx_skipped), counts)
+
+    def test_run_titles(self):
+        self.assertEqual(dqwrapper.run(self.cs, full=False), ["札幌市"])
+
+
+if __name__ == "__main__":
+    unittest.main()
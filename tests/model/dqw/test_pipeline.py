@@ -0,0 +1,67 @@
+import threading
+import unittest
+
+from show_a_table.model.dqw.pipeline import Pipeline, Stage
+
+
+class TestPipeline(unittest.TestCase):
+    def test_order_and_flush(self):
+        buf = []
+
+        def pair(x):
+            buf.append(x)
+            if len(buf) < 2:
+                return []
+            ret = [tuple(buf)]
+            del buf[:]
+            return ret
+
+        def rest():
+            return [tuple(buf)] if buf else []
+
+        pipe = Pipeline(range(5), [Stage("double", lambda x: [x * 2]), Stage("pair", pair, rest)],
+                        maxsize=1)
+        self.assertEqual(list(pipe), [(0, 2), (4, 6), (8,)])
+        report = pipe.report()
+        self.assertEqual(report["double"]["items_in"], 5)
+        self.assertEqual(report["pair"]["items_out"], 3)
+
+    def test_error(self):
+        def fail(x):
+            raise RuntimeError("boom")
+
+        pipe = Pipeline(range(100), [Stage("fail", fail)], maxsize=1)
+        with self.assertRaises(RuntimeError):
+            list(pipe)
+
+    def test_error_midway(self):
+        def fail(x):
+            if x == 3:
+                raise RuntimeError("boom")
+            return [x]
+
+        pipe = Pipeline(range(1000), [Stage("fail", fail), Stage("id", lambda x: [x])], maxsize=1)
+        with self.assertRaises(RuntimeError):
+            list(pipe)
+        self.assertLess(pipe.report()["source"]["items_out"], 1000)
+
+    def test_early_exit(self):
+        read = []
+
+        def source():
+            for i in range(10000):
+                read.append(i)
+                yield i
+
+        pipe = Pipeline(source(), [Stage("double", lambda x: [x * 2]), Stage("id", lambda x: [x])],
+                        maxsize=1)
+        for item in pipe:
+            if item == 4:
+                break
+        # 読むのをやめたら全ての段が止まり，元の列も読み切らない
+        self.assertFalse([th for th in threading.enumerate() if th.name.startswith("pipeline-")])
+        self.assertLess(len(read), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import time
+import unittest
+
+from show_a_table.model.dqw import planner
+from show_a_table.model.refiner.refiner import FunQuery, Priority
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        self.sample = {str(i) for i in range(10)}
+
+    def _query(self, attr, keep, priori=None):
+        q = FunQuery(lambda r: True, lambda t: t, priori=priori)
+        q.attr = attr
+        q.keep = keep
+        return q
+
+    def _evaluate(self, query, ids):
+        return {wid for wid in ids if int(wid) < query.keep}, len(ids)
+
+    def test_selective_first(self):
+        loose = self._query("loose", 9)
+        tight = self._query("tight", 1)
+        plan = planner.make_plan([loose, tight], self.sample, self._evaluate)
+        self.assertEqual([q.attr for q in plan.queries], ["tight", "loose"])
+        self.assertAlmostEqual(plan.estimates[0].pass_rate, 0.1)
+
+    def test_priority_first(self):
+        loose = self._query("loose", 9, priori=Priority.HIGHEST)
+        tight = self._query("tight", 1)
+        plan = planner.make_plan([tight, loose], self.sample, self._evaluate)
+        self.assertEqual([q.attr for q in plan.queries], ["loose", "tight"])
+        self.assertIn("loose", str(plan))
+
+    def test_warmup(self):
+        # 初回の評価だけが準備の時間を払う
+        state = {"loaded": False}
+
+        def load():
+            time.sleep(0.2)
+            state["loaded"] = True
+
+        def evaluate(query, ids):
+            if not state["loaded"]:
+                load()
+            return self._evaluate(query, ids)
+
+        queries = [self._query("first", 5), self._query("second", 6)]
+        plan = planner.make_plan(queries, self.sample, evaluate)
+        self.assertEqual([q.attr for q in plan.queries], ["second", "first"])
+        self.assertGreaterEqual(plan.estimates[1].seconds, 0.2)
+        state["loaded"] = False
+        plan = planner.make_plan(queries, self.sample, evaluate, warmup=load)
+        seconds = {e.query.attr: e.seconds for e in plan.estimates}
+        self.assertLess(seconds["first"], 0.1)
+
+    def test_sample_ids(self):
+        ids = planner.sample_ids([str(i) for i in range(100)], 5, seed=0)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(ids, planner.sample_ids([str(i) for i in range(100)], 5, seed=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from show_a_table.model.dqw import retrieval
+
+
+class TestRetrieval(unittest.TestCase):
+    def setUp(self):
+        self.questions = [
+            ("札幌市は日本の都市である．", "札幌市の人口は?", "札幌市", "1"),
+            ("札幌市の人口は約197万人である．", "札幌市の人口は?", "札幌市", "1"),
+            ("札幌市には時計台がある．", "札幌市の人口は?", "札幌市", "1"),
+            ("那覇市は沖縄県の県庁所在地．", "那覇市の人口は?", "那覇市", "2"),
+        ]
+        self.index = retrieval.BM25Index([q[0] for q in self.questions])
+
+    def test_bigrams(self):
+        self.assertEqual(retrieval.bigrams("人 口数"), ["人口", "口数"])
+        self.assertEqual(retrieval.bigrams("人"), ["人"])
+
+    def test_windows(self):
+        wins = retrieval.windows("abcdefghij", size=4, stride=3)
+        self.assertEqual(wins, ["abcd", "defg", "ghij"])
+
+    def test_top_k(self):
+        kept = retrieval.top_k(self.index, self.questions, 1, "人口")
+        self.assertEqual(kept, [self.questions[1], self.questions[3]])
+
+    def test_recall_report(self):
+        passed = [(self.questions[1], "197万人")]
+        report = retrieval.recall_report(self.index, self.questions, passed, ks=(1, 3), attr="人口")
+        self.assertEqual(report[1], {"recall": 1.0, "kept": 0.5})
+        self.assertEqual(report[3]["kept"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import threading
+import unittest
+
+from show_a_table.model.dqw.backend import RemoteBackend, StubBackend
+from show_a_table.model.dqw.server import Coalescer, InferenceServer
+
+
+class TestCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubBackend()
+        self.co = Coalescer(self.stub, max_batch=64, max_wait=0.2)
+
+    def tearDown(self):
+        self.co.close()
+
+    def test_merge(self):
+        results = {}
+
+        def call(i):
+            results[i] = self.co.predict_batch([(f"{1900+i}年に設立", "設立年は?")])
+
+        ths = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+        for th in ths:
+            th.start()
+        for th in ths:
+            th.join()
+        self.assertEqual({i: r[0][0][0]["text"] for i, r in results.items()},
+                         {i: f"{1900+i}年" for i in range(4)})
+        self.assertLess(self.co.calls, 4)
+
+
+class TestInferenceServer(unittest.TestCase):
+    def setUp(self):
+        self.server = InferenceServer(StubBackend(), port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = RemoteBackend(f"http://127.0.0.1:{self.server.server_address[1]}")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_predict(self):
+        res = self.client.predict_batch([("1922年に市制", "成立年は?"), ("なし", "成立年は?")])
+        self.assertEqual(res, [[({"text": "1922年"}, 1.0)], []])
+        self.assertEqual(self.client.load()["requests"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
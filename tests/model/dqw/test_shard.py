@@ -0,0 +1,92 @@
+import os
+import re
+import socket
+import subprocess
+import sys
+import unittest
+
+from show_a_table.model.dqw import dqwrapper, shard
+from show_a_table.model.dqw.backend import DrQABackend, StubBackend
+from show_a_table.model.dqw.cache import AnswerCache
+from show_a_table.model.dqw.stats import RunStats
+from show_a_table.model.refiner.refiner import RegQuery
+
+from .fixtures import CityCorpusCase
+
+
+class TestShard(CityCorpusCase):
+    articles = [
+        {"title": f"市{i}", "WikipediaID": str(i),
+         "paragraphs": [{"context": f"{1900 + i}年に市制を施行した．"}]}
+        for i in range(20)
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.cs.attr = "成立年"
+        self.cs.add_query(RegQuery(re.compile(r"190\d年"), lambda tgt: f"{tgt}の成立年は?"))
+        self.expected = dqwrapper.run(self.cs)
+
+    def test_make_shards(self):
+        shards = shard.make_shards([str(i) for i in range(10)], 3)
+        self.assertEqual(sorted(w for s in shards for w in s), sorted(str(i) for i in range(10)))
+        self.assertEqual(len(shards), 3)
+        self.assertEqual(shard.make_shards([], 3), [])
+
+    def test_run_sharded(self):
+        self.assertEqual(len(self.expected), 10)
+        self.assertEqual(shard.run_sharded(self.cs, processes=2, n_shards=4), self.expected)
+
+    def test_run_sharded_unsupported(self):
+        for kwargs in ({"plan": True}, {"stats": RunStats()}, {"pipeline": True},
+                       {"table": True}):
+            with self.assertRaises(ValueError):
+                shard.run_sharded(self.cs, processes=2, **kwargs)
+
+    def test_manifest(self):
+        dirname = os.path.join(self.tmp.name, "work")
+        self.assertEqual(shard.make_manifest(self.cs, dirname, 3), 3)
+        self.assertEqual(shard.run_manifest(self.cs, dirname), 3)
+        self.assertEqual(shard.run_manifest(self.cs, dirname), 0)
+        self.assertEqual(shard.merge_manifest(dirname), self.expected)
+
+    def test_fork_safe(self):
+        drqa = DrQABackend("model", "embedding", num_workers=10, device="cpu")
+        safe = shard._fork_safe(drqa)
+        self.assertEqual((safe.num_workers, safe.model, safe.device), (0, "model", "cpu"))
+        drqa = DrQABackend("model", "embedding", num_workers=0, device="cuda")
+        self.assertEqual(shard._fork_safe(drqa).device, "cpu")
+        drqa = DrQABackend("model", "embedding", num_workers=0, device="cpu")
+        self.assertIs(shard._fork_safe(drqa), drqa)
+        stub = StubBackend()
+        self.assertIs(shard._fork_safe(stub), stub)
+
+    def test_run_sharded_cache(self):
+        cache = AnswerCache(os.path.join(self.tmp.name, "answers.sqlite3"))
+        self.assertEqual(shard.run_sharded(self.cs, processes=2, n_shards=4, cache=cache),
+                         self.expected)
+        # 子プロセスがそれぞれ開いたキャッシュに書き込まれている
+        self.assertEqual(len(cache), 20)
+
+    def test_stale_claim(self):
+        dirname = os.path.join(self.tmp.name, "work")
+        shard.make_manifest(self.cs, dirname, 3)
+        proc = subprocess.Popen([sys.executable, "-c", "pass"])
+        proc.wait()
+        os.rename(os.path.join(dirname, "00000.todo"),
+                  os.path.join(dirname, f"00000.running.{socket.gethostname()}-{proc.pid}"))
+        os.rename(os.path.join(dirname, "00001.todo"),
+                  os.path.join(dirname, "00001.running.otherhost-1"))
+        self.assertEqual(shard.run_manifest(self.cs, dirname), 2)
+        with self.assertRaises(RuntimeError):
+            shard.merge_manifest(dirname)
+        # 他のマシンの確保は期限を過ぎてから取り直す
+        self.assertEqual(shard.run_manifest(self.cs, dirname, timeout=3600), 0)
+        old = os.path.join(dirname, "00001.running.otherhost-1")
+        os.utime(old, (0, 0))
+        self.assertEqual(shard.run_manifest(self.cs, dirname, timeout=3600), 1)
+        self.assertEqual(shard.merge_manifest(dirname), self.expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
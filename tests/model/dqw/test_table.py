@@ -0,0 +1,55 @@
+import io
+import json
+import unittest
+
+from show_a_table.model.dqw.table import ResultTable
+
+
+def _q(wid, title):
+    return ("ctx", "q", title, wid)
+
+
+class TestResultTable(unittest.TestCase):
+    def setUp(self):
+        self.table = ResultTable()
+        self.table.update("所在地", [(_q("1", "札幌市"), "北海道"), (_q("2", "那覇市"), "沖縄県"),
+                                  (_q("1", "札幌市"), "北海道札幌")])
+        self.table.update("成立年", [(_q("1", "札幌市"), "1922年"), (_q("3", "福岡市"), "1889年")])
+
+    def test_and(self):
+        self.assertEqual(list(self.table), ["1"])
+        self.assertEqual(len(self.table), 1)
+        self.assertIn("1", self.table)
+        self.assertNotIn("2", self.table)
+
+    def test_to_store(self):
+        self.assertEqual(self.table.to_store(), {"1": {"title": "札幌市", "attrs": {
+            "所在地": ["北海道", "北海道札幌"], "成立年": ["1922年"]}}})
+
+    def test_restrict(self):
+        table = ResultTable().restrict(["2", "3"])
+        self.assertEqual(table.ids(), {"2", "3"})
+        table.update("所在地", [(_q("2", "那覇市"), "沖縄県"), (_q("1", "札幌市"), "北海道")])
+        self.assertEqual(list(table), ["2"])
+        self.assertEqual(table.titles[table.wids.index("2")], "那覇市")
+
+    def test_large(self):
+        n = 100000
+        table = ResultTable()
+        table.update("a", [(_q(str(i), ""), "x") for i in range(n)])
+        table.update("b", [(_q(str(i), ""), "y") for i in range(0, n, 3)])
+        self.assertEqual(len(table), len(range(0, n, 3)))
+        self.assertEqual(list(table), [str(i) for i in range(0, n, 3)])
+
+    def test_export(self):
+        f = io.StringIO()
+        self.table.export_csv(f)
+        self.assertEqual(f.getvalue().splitlines(),
+                         ["wiki_id,title,所在地,成立年", "1,札幌市,北海道|北海道札幌,1922年"])
+        f = io.StringIO()
+        self.table.export_jsonl(f)
+        self.assertEqual(json.loads(f.getvalue())["title"], "札幌市")
+
+
+if __name__ == "__main__":
+    unittest.main()
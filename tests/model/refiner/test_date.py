@@ -1,3 +1,4 @@
+import datetime
 import unittest
 
 from show_a_table.model.refiner import date
@@ -44,5 +45,57 @@ class TestJO(unittest.TestCase):
         self.assertEqual(cds.get_query("猫"), q)
 
 
+class TestDateSpan(unittest.TestCase):
+    def _match(self, start, end, *ymds):
+        span = date.DateSpan(start, end)
+        return [span.match(datetime.date(*ymd)) for ymd in ymds]
+
+    def test_years(self):
+        self.assertEqual(self._match("1900-*-*", "1950-*-*",
+                                     (1899, 12, 31), (1900, 1, 1), (1950, 12, 31), (1951, 1, 1)),
+                         [False, True, True, False])
+
+    def test_full(self):
+        self.assertEqual(self._match("1900-4-10", "1900-5-*",
+                                     (1900, 4, 9), (1900, 4, 10), (1900, 5, 31), (1901, 4, 20)),
+                         [False, True, True, False])
+
+    def test_open(self):
+        self.assertEqual(self._match("1900-*-*", "*-*-*", (1899, 1, 1), (2020, 1, 1)),
+                         [False, True])
+
+    def test_bce(self):
+        span = date.DateSpan("BCE100-*-*", "10-*-*")
+        self.assertEqual(span.intervals[0][0], date.day_key(-99, 1, 1))
+        self.assertTrue(span.match(datetime.date(1, 1, 1)))
+        self.assertFalse(span.match(datetime.date(11, 1, 1)))
+
+    def test_month_day(self):
+        self.assertEqual(self._match("*-4-1", "*-6-*", (1800, 3, 31), (2000, 4, 1), (1900, 6, 30)),
+                         [False, True, True])
+        # 年を跨ぐ範囲
+        self.assertEqual(self._match("*-11-*", "*-2-*", (2000, 12, 1), (2000, 1, 5), (2000, 3, 1)),
+                         [True, True, False])
+
+    def test_day(self):
+        self.assertEqual(self._match("*-*-10", "*-*-20", (2000, 1, 9), (2000, 5, 15)),
+                         [False, True])
+
+    def test_scan(self):
+        span = date.DateSpan("1900-*-*", "1950-*-*")
+        dates = [datetime.date(y, 1, 1) for y in range(1890, 1960, 5)]
+        keys = [span.key(d) for d in dates]
+        (i, j), = span.scan(keys)
+        self.assertEqual([d.year for d in dates[i:j]], list(range(1900, 1951, 5)))
+
+    def test_refiner(self):
+        dr = date.DateRangeRefiner("成立年")
+        dr._start, dr._end = "1900-*-*", "1950-*-*"
+        exam = dr._mk_exam()
+        self.assertEqual([exam(r) for r in ["1900年", "大正11年4月1日", "1951年1月1日", "不明"]],
+                         [True, True, False, False])
+        self.assertIsNotNone(dr.span)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,59 @@
+import calendar
+import datetime
+import unittest
+
+from show_a_table.model.refiner.date_normalizer import DateNormalizer
+
+
+class TestDateNormalizer(unittest.TestCase):
+    def setUp(self):
+        self.norm = DateNormalizer()
+        self.today = datetime.date.today()
+
+    def test_western(self):
+        self.assertEqual(self.norm.normalize("1922年4月1日"), datetime.date(1922, 4, 1))
+        self.assertEqual(self.norm.normalize("１９２２年４月１日生まれ"), datetime.date(1922, 4, 1))
+        self.assertEqual(self.norm.normalize("922年4月1日"), datetime.date(922, 4, 1))
+        self.assertEqual(self.norm.normalize("1922年(大正11年)4月1日"), datetime.date(1922, 4, 1))
+
+    def test_iso(self):
+        self.assertEqual(self.norm.normalize("2020-09-01"), datetime.date(2020, 9, 1))
+        self.assertEqual(self.norm.normalize("2020-9-1"), datetime.date(2020, 9, 1))
+
+    def test_partial(self):
+        # 月日が無ければ今日の月日で補う
+        last = calendar.monthrange(1922, self.today.month)[1]
+        self.assertEqual(self.norm.normalize("1922年"),
+                         datetime.date(1922, self.today.month, min(self.today.day, last)))
+        self.assertEqual(self.norm.normalize("1922年4月").replace(day=1), datetime.date(1922, 4, 1))
+
+    def test_era(self):
+        self.assertEqual(self.norm.normalize("大正11年"), datetime.date(1922, 1, 1))
+        self.assertEqual(self.norm.normalize("令和元年5月1日"), datetime.date(2019, 5, 1))
+        self.assertEqual(self.norm.normalize("昭和二十年八月十五日"), datetime.date(1945, 8, 15))
+        self.assertEqual(self.norm.normalize("天平勝宝元年"), datetime.date(749, 1, 1))
+        self.assertEqual(self.norm.normalize("(大正11年)4月1日"), datetime.date(1922, 4, 1))
+        self.assertEqual(self.norm.normalize("大正11年(1922年)4月1日"), datetime.date(1922, 4, 1))
+
+    def test_error(self):
+        for result in ["2020年2月30日", "昭和", "大正11年13月", "不明な点が多い"]:
+            with self.assertRaises(RuntimeError):
+                self.norm.normalize(result)
+
+    def test_memo(self):
+        self.norm.normalize("大正11年")
+        self.norm.normalize("大正11年")
+        with self.assertRaises(RuntimeError):
+            self.norm.normalize("昭和")
+        with self.assertRaises(RuntimeError):
+            self.norm.normalize("昭和")
+        info = self.norm.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 2))
+
+    def test_normalize_many(self):
+        self.assertEqual(self.norm.normalize_many(["大正11年", "昭和", "2020-09-01"]),
+                         [datetime.date(1922, 1, 1), None, datetime.date(2020, 9, 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
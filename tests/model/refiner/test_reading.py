@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+
+from show_a_table.model.refiner import reading
+from show_a_table.model.refiner.reading import ReadingCache, convert_many
+
+
+class TestReadingCache(unittest.TestCase):
+    def test_readings(self):
+        rc = ReadingCache(":memory:")
+        self.assertEqual(rc.readings(["東京", "京都", "東京"]), ["トウキョウ", "キョウト", "トウキョウ"])
+        self.assertEqual((rc.hits, rc.misses), (0, 2))
+        rc.readings(["京都"])
+        self.assertEqual(rc.stats()["hits"], 1)
+        self.assertEqual(len(rc), 2)
+
+    def test_persist(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fn = os.path.join(tmp, "readings.sqlite3")
+            rc = ReadingCache(fn)
+            rc.readings(["大阪"])
+            rc.close()
+            rc = ReadingCache(fn)
+            self.assertEqual(rc.readings(["大阪"]), ["オオサカ"])
+            self.assertEqual((rc.hits, rc.misses), (1, 0))
+            # 変換器ごとに分けて持つ
+            self.assertEqual(len(ReadingCache(fn, engine="mecab")), 0)
+
+    def test_engine(self):
+        with self.assertRaises(ValueError):
+            ReadingCache(":memory:", engine="unknown")
+
+    def test_pool(self):
+        threshold = reading._pool_threshold
+        reading._pool_threshold = 4
+        try:
+            labels = ["東京", "大阪", "京都", "奈良", "札幌"] * 200
+            self.assertEqual(convert_many(labels, workers=2), convert_many(labels))
+        finally:
+            reading._pool_threshold = threshold
+
+
+if __name__ == "__main__":
+    unittest.main()
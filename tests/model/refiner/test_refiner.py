@@ -0,0 +1,199 @@
+import re
+import unittest
+
+from show_a_table.model.refiner import date, reading, refiner
+
+
+class TestContextFilter(unittest.TestCase):
+    def _query(self, ctx_filter):
+        return refiner.FunQuery(lambda res: True, lambda tgt: tgt, ctx_filter=ctx_filter)
+
+    def test_none(self):
+        q = self._query(None)
+        self.assertTrue(q.check_context("なんでも"))
+        self.assertEqual(q.ctx_checked, 0)
+
+    def test_regex(self):
+        q = self._query(re.compile(r"\d"))
+        self.assertTrue(q.check_context("1922年"))
+        self.assertFalse(q.check_context("なし"))
+        self.assertEqual((q.ctx_checked, q.ctx_skipped), (2, 1))
+
+    def test_str_regex(self):
+        q = refiner.RegQuery(re.compile("東京"), lambda tgt: tgt, ctx_filter="東京")
+        self.assertFalse(q.check_context("大阪"))
+
+    def test_keywords(self):
+        q = self._query({"東京都", "港区"})
+        self.assertTrue(q.check_context("東京都港区芝公園"))
+        self.assertFalse(q.check_context("東京都新宿区"))
+
+    def test_callable(self):
+        q = self._query(lambda ctx: len(ctx) > 3)
+        self.assertFalse(q.check_context("短い"))
+        self.assertEqual(q.ctx_skipped, 1)
+        q.reset_counts()
+        self.assertEqual((q.ctx_checked, q.ctx_skipped), (0, 0))
+
+    def test_date_kanji(self):
+        # 漢数字だけで書かれた日付の文脈も読む
+        q = self._query(date._ctx_filter)
+        for ctx, ans in [("平成十年に開業した．", "平成十年"),
+                         ("昭和二十年八月十五日に終戦を迎えた．", "昭和二十年八月十五日")]:
+            self.assertTrue(q.check_context(ctx))
+            self.assertIsNotNone(date._preprocess_date(ans))
+        self.assertFalse(q.check_context("特筆すべき事項は無い．"))
+
+
+class TestExamBatch(unittest.TestCase):
+    def test_dedup(self):
+        calls = []
+
+        def refine(res):
+            calls.append(res)
+            return res.startswith("東京")
+        q = refiner.FunQuery(refine, lambda tgt: tgt)
+        self.assertEqual(q.exam_batch(["東京都", "大阪府", "東京都", "東京都"]),
+                         [True, False, True, True])
+        self.assertCountEqual(calls, ["東京都", "大阪府"])
+
+    def test_refine_batch(self):
+        q = refiner.FunQuery(lambda res: False, lambda tgt: tgt,
+                             refine_batch=lambda results: [len(r) > 2 for r in results])
+        self.assertEqual(q.exam_batch(["東京都", "港区", "東京都"]), [True, False, True])
+
+    def test_regex(self):
+        q = refiner.RegQuery(re.compile(r"\d+年"), lambda tgt: tgt)
+        results = ["1922年", "不明", "1922年", "昭和"]
+        self.assertEqual(q.exam_batch(results), [q.exam(r) for r in results])
+
+    def test_date(self):
+        jo = date.JustOneDateRefiner("成立年")
+        jo.year, jo.month = "*", "4"
+        q = jo._day(refiner.Candidate("SKIP", ref="*"))
+        dr = date.DateRangeRefiner("成立年")
+        dr._start, dr._end = "1900-*-*", "1950-*-*"
+        check = dr._mk_check()
+        qr = refiner.FunQuery(date._date_exam(check), lambda tgt: tgt,
+                              refine_batch=date._date_exam_batch(check))
+        results = ["1922年4月1日", "大正11年4月1日", "1960年4月1日", "不明", "1922年4月1日"]
+        for qg in [q, qr]:
+            self.assertEqual(qg.exam_batch(results), [qg.exam(r) for r in results])
+        self.assertEqual(q.exam_batch(results), [True, True, True, False, True])
+        self.assertEqual(qr.exam_batch(results), [True, True, False, False, True])
+
+
+class TestPager(unittest.TestCase):
+    def test_navigation(self):
+        pager = refiner.Pager(range(1, 46), 20)
+        self.assertEqual(pager.num_pages, 3)
+        self.assertEqual(list(pager.current()), list(range(1, 21)))
+        self.assertEqual(list(pager.next()), list(range(21, 41)))
+        self.assertEqual(list(pager.jump(2)), list(range(41, 46)))
+        self.assertFalse(pager.has_next())
+        self.assertEqual(list(pager.prev()), list(range(21, 41)))
+        with self.assertRaises(IndexError):
+            pager.jump(3)
+
+    def test_resize(self):
+        pager = refiner.Pager([str(i) for i in range(45)], 20)
+        pager.jump(1)
+        pager.resize(10)
+        self.assertEqual(pager.current()[0], "20")
+        pager.resize(0)
+        self.assertEqual(len(pager.current()), 45)
+
+
+class TestCandidatesPaging(unittest.TestCase):
+    def test_candidates(self):
+        cs = refiner.Candidates("t", [str(i) for i in range(45)], None)
+        self.assertEqual(cs.cands(20)[-1], "NEXT")
+        self.assertEqual(cs.select(20, "NEXT")[-2:], ["PREV", "NEXT"])
+        self.assertEqual(cs.select(20, "NEXT"), [str(i) for i in range(40, 45)] + ["PREV"])
+        self.assertEqual(cs.select(20, "PREV")[0], "20")
+        self.assertEqual(cs.jump(0, 20)[0], "0")
+        self.assertEqual(cs.select(20, "44").key, "44")
+
+    def test_num(self):
+        ns = refiner.NumCandidates("t", 1, 30, None, skippable=True)
+        self.assertEqual(ns.cands(20), [str(i) for i in range(1, 18)] + ["NEXT", "SKIP"])
+        self.assertEqual(ns.select(20, "NEXT"), [str(i) for i in range(18, 31)] + ["PREV", "SKIP"])
+        self.assertEqual(ns.select(20, "PREV")[0], "1")
+        self.assertEqual(ns.select(20, "5").key, "5")
+        # 案内と SKIP を含めて num_cands 個以下に収める
+        ns = refiner.NumCandidates("t", 1, 35, None, skippable=True)
+        self.assertLessEqual(len(ns.cands(20)), 20)
+        self.assertLessEqual(len(ns.select(20, "NEXT")), 20)
+        self.assertEqual(ns.select(20, "NEXT"), ["35", "PREV", "SKIP"])
+        ns = refiner.NumCandidates("t", 1, 20, None)
+        self.assertEqual(ns.cands(20), [str(i) for i in range(1, 21)])
+
+    def test_num_range(self):
+        ns = refiner.NumCandidates("t", 1, 4713, None, skippable=True)
+        cands = ns.cands(20)
+        self.assertEqual(len(cands), 20)
+        self.assertEqual((cands[0], cands[-2], cands[-1]), ("1-249", "4483-4713", "SKIP"))
+        self.assertEqual(ns.select(20, "250-498")[:2], ["250-263", "264-277"])
+
+    def test_num_log(self):
+        ns = refiner.NumCandidates("t", 1, 10**13, None, scale="log")
+        cands = ns.cands(20)
+        self.assertEqual(cands[:3], ["1-9", "10-99", "100-999"])
+        self.assertLessEqual(len(cands), 20)
+        # 1桁の範囲に入ったら等幅で分ける
+        self.assertEqual(ns.select(20, "1000000-9999999")[0], "1000000-1449999")
+        ns = refiner.NumCandidates("t", 1, 10**40, None, scale="log")
+        self.assertLessEqual(len(ns.cands(20)), 20)
+        ns = refiner.NumCandidates("t", 0, 50000, None, scale="auto")
+        self.assertEqual(ns.cands(20)[:3], ["0-0", "1-1", "2-4"])
+
+    def test_kana(self):
+        labels = ["ア" + "アイウエオ"[i % 5] * (i + 1) for i in range(25)] + ["イカ", "完了"]
+        ks = refiner.KanaCandidates("t", labels, None)
+        self.assertEqual(ks.cands(20), ["ア", "イ", "完了"])
+        # 20件を超える「ア」は2文字目で分かれる
+        self.assertEqual(ks.select(20, "ア"), ["アア", "アイ", "アウ", "アエ", "アオ", "PREV"])
+        self.assertEqual(ks.select(20, "アイ"),
+                         ["ア" + "イ" * n for n in (2, 7, 12, 17, 22)] + ["PREV"])
+        self.assertEqual(ks.select(20, "アイイ").key, "アイイ")
+        ks = refiner.KanaCandidates("t", labels, None)
+        ks.cands(20)
+        ks.select(20, "ア")
+        self.assertEqual(ks.select(20, "PREV"), ["ア", "イ", "完了"])
+        ks.select(20, "イ")
+        self.assertEqual(ks.select(20, "イカ").key, "イカ")
+
+
+class TestSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        reading.reading_cache(":memory:")
+
+    def setUp(self):
+        self.labels = ["東京都", "東京国際空港", "京都府", "大阪府", "Tokyo Dome", "とやま"]
+
+    def test_candidates(self):
+        cs = refiner.Candidates("t", self.labels, None)
+        self.assertEqual(cs.search("東京"), ["東京国際空港", "東京都"])
+        # カナとローマ字，ひらがなでも探せる．同じ候補は1度だけ
+        self.assertCountEqual(cs.search("とう"), ["東京都", "東京国際空港"])
+        self.assertCountEqual(cs.search("toukyou"), ["東京都", "東京国際空港"])
+        self.assertEqual(cs.search("tokyo"), ["Tokyo Dome"])
+        self.assertEqual(cs.search("ＴＯＹ"), ["とやま"])
+        self.assertEqual(cs.search("キョウト"), ["京都府"])
+        self.assertEqual(cs.search("北"), [])
+        self.assertEqual(len(cs.search("", 2)), 2)
+        self.assertEqual(cs.select(20, "京都府").key, "京都府")
+
+    def test_kana(self):
+        ks = refiner.KanaCandidates("t", self.labels + ["完了"], None)
+        self.assertEqual(ks.search("oosaka"), ["大阪府"])
+        self.assertEqual(ks.select(20, "大阪府").key, "大阪府")
+        ks.search("kyou")
+        with self.assertRaises(ValueError):
+            ks.select(20, "大阪府")
+        self.assertNotIn("完了", ks.search("カ", 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import time
+import unittest
+
+from show_a_table.model.refiner import geo_refiner, sparql_cache
+from show_a_table.model.refiner.sparql_cache import SparqlCache
+
+
+def _row(s, label):
+    return {"s": {"type": "uri", "value": s}, "l": {"type": "literal", "value": label}}
+
+
+class _Endpoint:
+    def __init__(self, label="日本"):
+        self.calls = 0
+        self.label = label
+        self.fail = False
+
+    def __call__(self, query):
+        self.calls += 1
+        if self.fail:
+            raise OSError("connection refused")
+        return [_row("http://yago-knowledge.org/resource/Japan", self.label)]
+
+
+class TestSparqlCache(unittest.TestCase):
+    def test_hit(self):
+        ep = _Endpoint()
+        cache = SparqlCache(":memory:", ttl=0)
+        self.assertEqual(cache.get("q", ep), cache.get("q", ep))
+        cache.get("r", ep)
+        self.assertEqual(ep.calls, 2)
+        st = cache.stats()
+        self.assertEqual((st["hits"], st["misses"], st["entries"]), (1, 2, 2))
+        self.assertAlmostEqual(st["hit_rate"], 1 / 3)
+
+    def test_disk(self):
+        ep = _Endpoint()
+        with tempfile.TemporaryDirectory() as tmp:
+            fn = os.path.join(tmp, "sparql.sqlite3")
+            cache = SparqlCache(fn)
+            cache.get("q", ep)
+            cache.close()
+            cache = SparqlCache(fn)
+            self.assertEqual(cache.get("q", ep)[0]["l"]["value"], "日本")
+            self.assertEqual((ep.calls, cache.hits), (1, 1))
+
+    def test_memory_limit(self):
+        ep = _Endpoint()
+        cache = SparqlCache(":memory:", max_memory=1)
+        cache.get("q", ep)
+        cache.get("r", ep)
+        # メモリから溢れてもディスクから引ける
+        cache.get("q", ep)
+        self.assertEqual((ep.calls, cache.hits, len(cache._memory)), (2, 1, 1))
+
+    def test_expire(self):
+        ep = _Endpoint()
+        cache = SparqlCache(":memory:", ttl=0.01, stale_while_revalidate=False)
+        cache.get("q", ep)
+        time.sleep(0.02)
+        ep.label = "にっぽん"
+        self.assertEqual(cache.get("q", ep)[0]["l"]["value"], "にっぽん")
+        self.assertEqual((ep.calls, cache.misses), (2, 2))
+
+    def test_stale_while_revalidate(self):
+        ep = _Endpoint()
+        cache = SparqlCache(":memory:", ttl=0.01, stale_while_revalidate=True)
+        cache.get("q", ep)
+        time.sleep(0.02)
+        ep.label = "にっぽん"
+        self.assertEqual(cache.get("q", ep)[0]["l"]["value"], "日本")
+        cache.wait()
+        self.assertEqual(cache.get("q", ep)[0]["l"]["value"], "にっぽん")
+        st = cache.stats()
+        self.assertEqual((st["stale_hits"], st["refreshes"], st["hits"]), (1, 1, 1))
+
+    def test_error(self):
+        ep = _Endpoint()
+        cache = SparqlCache(":memory:", ttl=0.01, stale_while_revalidate=False)
+        cache.get("q", ep)
+        time.sleep(0.02)
+        ep.fail = True
+        self.assertEqual(cache.get("q", ep)[0]["l"]["value"], "日本")
+        with self.assertRaises(OSError):
+            cache.get("r", ep)
+        self.assertEqual(cache.errors, 2)
+
+
+class TestGeoRefiner(unittest.TestCase):
+    def test_cached(self):
+        sparql_cache.sparql_cache(":memory:")
+        ep = _Endpoint()
+        gr = geo_refiner.GeoRefiner("国")
+        gr._fetch = ep
+        self.assertEqual(gr.refine()._cands[0].ref, "http://yago-knowledge.org/resource/Japan")
+        geo_refiner.GeoRefiner("国").refine()
+        self.assertEqual(ep.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
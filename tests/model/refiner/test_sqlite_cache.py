@@ -0,0 +1,44 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from show_a_table.model.refiner.sqlite_cache import SharedCache, connect, fresh
+
+
+class _Cache:
+    def __init__(self, dbpath):
+        self.dbpath = dbpath
+        self.conn = connect(dbpath, "CREATE TABLE IF NOT EXISTS t (k TEXT);")
+
+
+class TestSharedCache(unittest.TestCase):
+    def test_default_path(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dbpath = os.path.join(tmp, "sub", "t.sqlite3")
+            shared = SharedCache(_Cache, "SHOW_A_TABLE_TEST_CACHE", "t.sqlite3")
+            with mock.patch.dict(os.environ, {"SHOW_A_TABLE_TEST_CACHE": dbpath}):
+                cache = shared.get()
+            self.assertEqual(cache.dbpath, dbpath)
+            self.assertTrue(os.path.exists(dbpath))
+            # プロセス内では同じものを返し，別の場所を指定すれば開き直す
+            self.assertIs(shared.get(), cache)
+            self.assertIsNot(shared.get(":memory:"), cache)
+
+    def test_fallback(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            blocker = os.path.join(tmp, "file")
+            open(blocker, "w").close()
+            shared = SharedCache(_Cache, "SHOW_A_TABLE_TEST_CACHE", "t.sqlite3")
+            # ディレクトリを作れない場所ならばメモリ上に開く
+            self.assertEqual(shared.get(os.path.join(blocker, "t.sqlite3")).dbpath, ":memory:")
+
+    def test_fresh(self):
+        self.assertTrue(fresh(time.time(), 10))
+        self.assertFalse(fresh(time.time() - 20, 10))
+        self.assertTrue(fresh(0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
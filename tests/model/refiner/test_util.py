@@ -29,5 +29,28 @@ class TestUtil(unittest.TestCase):
         print(dic)
 
 
+class TestKanaTrie(unittest.TestCase):
+    def test_split(self):
+        pairs = [(str(i), "アイ" + "アイウ"[i % 3] * (i + 1)) for i in range(30)] + [("s", "アイ")]
+        trie = util.make_kana_trie(pairs, 10)
+        # 子が1つしかない「ア」は飛ばし，短いラベルは「アイ」の葉に残る
+        self.assertEqual(sorted(trie.children), ["アイ"])
+        node = trie.children["アイ"]
+        self.assertEqual(sorted(node.children), ["アイ", "アイア", "アイイ", "アイウ"])
+        self.assertEqual([e[0] for e in node.children["アイ"].entries], ["s"])
+        self.assertTrue(all(len(leaf.entries) <= 10 for leaf in trie.leaves()))
+        self.assertEqual(sum(len(leaf.entries) for leaf in trie.leaves()), 31)
+
+    def test_same_reading(self):
+        trie = util.make_kana_trie([(str(i), "アア") for i in range(30)], 10)
+        self.assertEqual(len(trie.children["アア"].entries), 30)
+
+    def test_make_n_dict(self):
+        pairs = [(str(i), "カ" * (i + 1)) for i in range(5)] + [("完了", "完了")]
+        dic = util.make_n_dict(pairs, 10)
+        self.assertEqual(sorted(dic), ["カ", "完了"])
+        self.assertEqual(len(pairs), 6)
+
+
 if __name__ == "__main__":
     unittest.main()